@@ -0,0 +1,254 @@
+"""
+This file provides station basemap masks, which are compiled once from basemap images
+into boolean masks, stored next to the basemaps as .npy files and kept in memory for later frames.
+It also provides per-station overlay pixel sets learned from archived frames, which restrict narrow filling
+to the pixels covered by static map overlays. Overlay pixels of a station are learned from a folder of its
+archived radar images with:
+    python -m MesoDetect.DataIO.basemap <station number> <archive folder>
+"""
+import os
+import sys
+import numpy as np
+from PIL import Image
+from functools import lru_cache
+from colorama import Fore, Style
+from MesoDetect.DataIO.decoder import decode_layer_plane
+from MesoDetect.DataIO.radar_config import RadarConfig
+from MesoDetect.DataIO.data_config import get_station_config
+from MesoDetect.DataIO.utils import scan_folder_image_paths
+from MesoDetect.DataIO.consts import (BASEMAP_IMG_PATH, BOUNDARY_COLOR_THRESHOLD, BOUNDARY_MASK_CACHE_SIZE,
+                                      NEED_COVER_BOUNDARY_STATIONS, NARROW_SURROUNDING_OFFSETS, NO_ECHO_INDEX,
+                                      OVERLAY_MIN_COVERED_FRAMES, OVERLAY_GAP_RATIO_THRESHOLD)
+from pathlib import Path
+from typing import Iterable, Optional, Tuple, Union
+
+
+"""
+Logic Implementation Function: compile white boundary basemap into boolean mask
+"""
+def compile_boundary_mask(station_num: str) -> np.ndarray:
+    """
+    Compiles the white boundary basemap of the station into a boolean mask.
+
+    Args:
+        station_num (str): radar station number with format "Zxxxx".
+
+    Returns:
+        np.ndarray: square boolean mask indexed by [y, x], True for white boundary pixels.
+        The side length of the mask is the height of the basemap image.
+    """
+    base_img = Image.open(BASEMAP_IMG_PATH + "white_boundary_" + station_num + ".png")
+    side = base_img.size[1]
+    base_arr = np.asarray(base_img.convert("RGB"))
+    return base_arr[:side, :side, 0] > BOUNDARY_COLOR_THRESHOLD
+
+
+"""
+Utility Function: get compiled boundary mask of the station
+"""
+@lru_cache(maxsize=BOUNDARY_MASK_CACHE_SIZE)
+def get_boundary_mask(station_num: str) -> np.ndarray:
+    """
+    Retrieves the boundary mask of the station. The mask is memory-mapped from its .npy file when the file
+    is newer than the basemap image, otherwise it is compiled from the basemap image and saved for later use.
+
+    Args:
+        station_num (str): radar station number with format "Zxxxx".
+
+    Returns:
+        np.ndarray: read-only square boolean mask indexed by [y, x].
+    """
+    basemap_path = BASEMAP_IMG_PATH + "white_boundary_" + station_num + ".png"
+    mask_path = BASEMAP_IMG_PATH + "white_boundary_" + station_num + ".npy"
+
+    if os.path.exists(mask_path) and os.path.getmtime(mask_path) >= os.path.getmtime(basemap_path):
+        return np.load(mask_path, mmap_mode="r")
+
+    mask = compile_boundary_mask(station_num)
+    temp_path = mask_path + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            np.save(file, mask)
+        # Replace in one step so that other detection processes never map a partly written mask
+        os.replace(temp_path, mask_path)
+    except OSError as e:
+        print(Fore.YELLOW + f"[Warning] Saving boundary mask of {station_num} failed: {e}" + Style.RESET_ALL)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    mask.flags.writeable = False
+    return mask
+
+
+"""
+Utility Function: cover white boundary of the station on radar image
+"""
+def cover_station_boundary(radar_img: Image, station_num: str) -> Image:
+    """
+    Covers white boundary pixels of the station on radar image with black color.
+
+    Args:
+        radar_img (Image): original radar image.
+        station_num (str): radar station number with format "Zxxxx".
+
+    Returns:
+        Image: RGB radar image with boundary pixels covered.
+    """
+    mask = get_boundary_mask(station_num)
+    radar_arr = np.array(radar_img.convert("RGB"))
+    height = min(mask.shape[0], radar_arr.shape[0])
+    width = min(mask.shape[1], radar_arr.shape[1])
+    radar_arr[:height, :width][mask[:height, :width]] = 0
+    return Image.fromarray(radar_arr)
+
+
+"""
+Logic Implementation Function: learn overlay pixels of the station from archived frames
+"""
+def learn_overlay_pixels(
+        img_paths: Iterable[Union[str, Path]],
+        station_num: str,
+        min_covered_frames: int = OVERLAY_MIN_COVERED_FRAMES,
+        gap_ratio_threshold: float = OVERLAY_GAP_RATIO_THRESHOLD,
+        radar_config: Optional[RadarConfig] = None
+) -> np.ndarray:
+    """
+    Learns the pixels covered by static map overlays, such as boundaries and region name marks, from archived
+    frames of the station. A pixel is covered in a frame when its up and down or left and right neighbours are
+    both valid echoes, and it is an overlay pixel when it is a blank gap in most of the frames that cover it.
+
+    Args:
+        img_paths (Iterable[Union[str, Path]]): archived radar image paths of the station, more images are suggested.
+        station_num (str): radar station number with format "Zxxxx".
+        min_covered_frames (int): minimum number of frames that cover the pixel.
+        gap_ratio_threshold (float): minimum ratio of covering frames in which the pixel is a blank gap.
+        radar_config (Optional[RadarConfig]): radar config of the archived frames,
+            station profile for the size of the first image if not given.
+
+    Returns:
+        np.ndarray: int32 array with shape (N, 2) of overlay pixel [x, y] coordinates.
+    """
+    cover_mask = get_boundary_mask(station_num) if station_num in NEED_COVER_BOUNDARY_STATIONS else None
+
+    covered_num = None
+    gap_num = None
+    for img_path in img_paths:
+        radar_img = Image.open(img_path)
+        if radar_config is None:
+            radar_config = get_station_config(station_num, radar_img.size)
+        radar_zone = radar_config.radar_zone
+        cv_pairs = radar_config.color_velocity_pairs
+        valid_plane = decode_layer_plane(radar_img, radar_zone, cv_pairs, cover_mask) != NO_ECHO_INDEX
+        if covered_num is None:
+            covered_num = np.zeros(valid_plane.shape, dtype=np.int32)
+            gap_num = np.zeros(valid_plane.shape, dtype=np.int32)
+
+        # Get neighbour validity in NARROW_SURROUNDING_OFFSETS order
+        padded_plane = np.pad(valid_plane, 1, constant_values=False)
+        height, width = valid_plane.shape
+        valid = [padded_plane[1 + dy:height + 1 + dy, 1 + dx:width + 1 + dx] for dx, dy in NARROW_SURROUNDING_OFFSETS]
+        covered = valid[0] & valid[1] | valid[2] & valid[3]
+        covered_num += covered
+        gap_num += covered & ~valid_plane
+
+    if covered_num is None:
+        return np.zeros((0, 2), dtype=np.int32)
+    is_overlay = (covered_num >= min_covered_frames) & (gap_num >= gap_ratio_threshold * covered_num)
+    ys, xs = np.nonzero(is_overlay)
+    return np.stack((xs, ys), axis=1).astype(np.int32)
+
+
+"""
+Utility Function: save learned overlay pixels of the station
+"""
+def save_overlay_pixels(station_num: str, overlay_pixels: np.ndarray) -> Optional[str]:
+    """
+    Saves learned overlay pixels of the station next to the basemaps.
+
+    Args:
+        station_num (str): radar station number with format "Zxxxx".
+        overlay_pixels (np.ndarray): int32 array with shape (N, 2) of overlay pixel [x, y] coordinates.
+
+    Returns:
+        Optional[str]: path of the saved overlay pixel file, None if saving failed.
+    """
+    overlay_path = BASEMAP_IMG_PATH + "overlay_pixels_" + station_num + ".npy"
+    temp_path = overlay_path + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            np.save(file, np.asarray(overlay_pixels, dtype=np.int32))
+        # Replace in one step so that detection processes never load partly written overlay pixels
+        os.replace(temp_path, overlay_path)
+    except OSError as e:
+        print(Fore.RED + f"[Error] Saving overlay pixels of {station_num} failed: {e}" + Style.RESET_ALL)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+    return overlay_path
+
+
+"""
+Utility Function: get narrow filling candidate pixels of the station
+"""
+def get_overlay_candidates(station_num: str, image_size: Tuple[int, int]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Retrieves the narrow filling candidate pixels of the station, which include learned overlay pixels
+    and their narrow surrounding pixels. Candidates are computed again when overlay pixels are learned again.
+
+    Args:
+        station_num (str): radar station number with format "Zxxxx".
+        image_size (Tuple[int, int]): radar image size (width, height).
+
+    Returns:
+        Optional[Tuple[np.ndarray, np.ndarray]]: read-only (ys, xs) coordinate arrays of candidate pixels
+        in row-major order, or None if the station has no learned overlay pixels.
+    """
+    overlay_path = BASEMAP_IMG_PATH + "overlay_pixels_" + station_num + ".npy"
+    try:
+        overlay_mtime = os.stat(overlay_path).st_mtime_ns
+    except OSError:
+        return None
+    return _load_overlay_candidates(overlay_path, overlay_mtime, (image_size[0], image_size[1]))
+
+
+@lru_cache(maxsize=BOUNDARY_MASK_CACHE_SIZE)
+def _load_overlay_candidates(
+        overlay_path: str,
+        mtime_ns: int,
+        image_size: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Modification time is part of the cache key so that overlay pixels learned again are loaded again
+    width, height = image_size
+    overlay_pixels = np.load(overlay_path)
+    xs, ys = overlay_pixels[:, 0], overlay_pixels[:, 1]
+    overlay_mask = np.zeros((height, width), dtype=bool)
+    in_image = (0 <= xs) & (xs < width) & (0 <= ys) & (ys < height)
+    overlay_mask[ys[in_image], xs[in_image]] = True
+
+    # Add narrow surrounding pixels of the overlay pixels
+    candidate_mask = overlay_mask.copy()
+    for dx, dy in NARROW_SURROUNDING_OFFSETS:
+        candidate_mask[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)] |= \
+            overlay_mask[max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)]
+    candidate_ys, candidate_xs = np.nonzero(candidate_mask)
+    candidate_ys.flags.writeable = False
+    candidate_xs.flags.writeable = False
+    return candidate_ys, candidate_xs
+
+
+if __name__ == "__main__":
+    # Usage: python -m MesoDetect.DataIO.basemap <station number> <archive folder>
+    if len(sys.argv) != 3:
+        print("Usage: python -m MesoDetect.DataIO.basemap <station number> <archive folder>")
+        sys.exit(1)
+    learn_station_num, archive_folder = sys.argv[1], sys.argv[2]
+    # Archived images of the station in the folder and its sub folders
+    archive_img_paths = list(scan_folder_image_paths(archive_folder, recursive=True, station_num=learn_station_num))
+    if len(archive_img_paths) == 0:
+        print(Fore.RED + f"[Error] No radar image of {learn_station_num} in {archive_folder}." + Style.RESET_ALL)
+        sys.exit(1)
+    learned_pixels = learn_overlay_pixels(archive_img_paths, learn_station_num)
+    saved_path = save_overlay_pixels(learn_station_num, learned_pixels)
+    if saved_path is None:
+        sys.exit(1)
+    print(f"[Info] {len(learned_pixels)} overlay pixels learned from {len(archive_img_paths)} images "
+          f"saved to {saved_path}.")
@@ -2,36 +2,177 @@
 This file defines constant data that are used in radar image process algorithm,
 radar image config data are not within this scope
 """
+import os
 from pathlib import Path
 from MesoDetect.MesocycloneAnalysis.consts import MesocycloneInfo
-from typing import TypedDict, List
+from typing import TypedDict, List, Sequence
 from datetime import datetime
 
 
 # List of valid image extension
 VALID_IMG_EXTENSION = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
 
+# Number of threads scanning sub folders at the same time in recursive image folder scanning
+FOLDER_SCAN_WORKER_NUM = 8
+
 # List of surrounding pixels coordinate offsets
 SURROUNDING_OFFSETS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]
 
 # List of surrounding pixels coordinate offsets for narrow filling
 NARROW_SURROUNDING_OFFSETS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
 
+# Policies for choosing between surrounding indexes with equal distance to velocity 0 in narrow filling:
+# "neg" for the negative velocity index, "pos" for the positive velocity index and "random" for seeded random choice
+NARROW_FILL_TIE_BREAKS = ("neg", "pos", "random")
+
+# Default tie break policy of narrow filling
+NARROW_FILL_TIE_BREAK = "random"
+
+# Default random seed of narrow filling, so that same frame always gets same filling result
+NARROW_FILL_SEED = 0
+
 # Radar Stations that has white boundary lines which may interfere with white color echoes
 NEED_COVER_BOUNDARY_STATIONS = ["Z9750", "Z9755", "Z9756", "Z9762", "Z9763"]
 
+# Minimum red channel value of basemap pixels that are regarded as white boundary
+BOUNDARY_COLOR_THRESHOLD = 245
+
+# Maximum number of compiled station boundary masks kept in memory
+BOUNDARY_MASK_CACHE_SIZE = 8
+
+# Minimum number of archived frames in which a pixel lies between valid echoes for overlay pixel learning
+OVERLAY_MIN_COVERED_FRAMES = 2
+
+# Minimum ratio of frames that a covered pixel is a blank gap for regarding it as overlay pixel
+OVERLAY_GAP_RATIO_THRESHOLD = 0.5
+
 # Scale unit of gray color
 GRAY_SCALE_UNIT = 17
 
+# Maximum difference of each RGB channel for matching a pixel color with color bar color
+COLOR_MATCH_TOLERANCE = 10
+
+# Layer index value of pixels that do not match any color bar color in layer index plane
+NO_ECHO_INDEX = 255
+
+# Bit flags of radar frame flag plane
+# base echo, drawn as (v, 0, v) in gray image
+FLAG_BASE_ECHO = 1
+# base filled echo, drawn as (v, 0, 0) in gray image
+FLAG_BASE_FILLED = 2
+# unfolded echo, drawn as (v, v, v) in gray image
+FLAG_UNFOLDED = 4
+# flags of echoes that are not regarded as valid echoes
+FLAG_BASE_MASK = FLAG_BASE_ECHO | FLAG_BASE_FILLED
+
+# Available engines for decoding radar image: "numpy" for lookup table decoding, "pixel" for per-pixel matching
+DECODER_ENGINES = ("numpy", "pixel")
+
+# Default engine for decoding radar image
+DEFAULT_DECODER_ENGINE = "numpy"
+
 # Radar image pixels and actual distance ratio
 PIXEL_KM_RATIO_PAIR = [((1024, 768), 0.333333), ((760, 600), 0.425532)]
 
 # Default Image path of basemap
 BASEMAP_IMG_PATH = (Path(__file__).parent.parent.parent / "data/basemaps").as_posix() + "/"
 
+# Cache folder of current user
+USER_CACHE_FOLDER = Path(os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+
+# Default folder of stored preprocessed radar frames, under user cache folder unless set by MESODETECT_FRAME_STORE
+FRAME_STORE_FOLDER = Path(os.environ.get("MESODETECT_FRAME_STORE")
+                          or USER_CACHE_FOLDER / "MesoDetect" / "frames").as_posix() + "/"
+
+# Maximum total size in bytes of stored frames, least recently used frames are removed beyond it
+FRAME_STORE_MAX_SIZE = 1024 * 1024 * 1024
+
+# Maximum age in seconds of stored frames since last use
+FRAME_STORE_MAX_AGE = 30 * 24 * 3600
+
+# Number of frames stored by a process between two prunings of the frame store
+FRAME_STORE_PRUNE_INTERVAL = 64
+
+# Version of radar image decoding and narrow filling, stored frames of other versions are not reused,
+# so it must be increased when decoding or narrow filling results change
+FRAME_STORE_VERSION = 1
+
+# Whether to reuse stored preprocessed frames of same radar images in detection by default
+ENABLE_FRAME_STORE = False
+
 # Default radar image config file path
 CONFIG_FILE = (Path(__file__).parent.parent.parent / "data/radar_config.yaml").as_posix()
 
+# Maximum number of parsed radar config versions kept in memory
+RADAR_CONFIG_CACHE_SIZE = 4
+
+# Default folder of persisted per-station radar config files
+STATION_CONFIG_FOLDER = (Path(__file__).parent.parent.parent / "data/stations").as_posix() + "/"
+
+# Default number of images submitted to a batch detection worker at a time
+BATCH_CHUNK_SIZE = 1
+
+# Number of images a batch detection worker process handles before it is replaced by a new one,
+# which limits memory growth of long running batch detection
+BATCH_MAX_TASKS_PER_CHILD = 32
+
+# Default maximum number of radar images detected at the same time by asynchronous detection
+ASYNC_MAX_IN_FLIGHT = 4
+
+# Default interval in seconds between scans of watched radar image folder
+WATCH_POLL_INTERVAL = 1.0
+
+# Number of following scans in which a new radar image file keeps same size and modification time
+# before it is regarded as fully written
+WATCH_STABLE_SCANS = 1
+
+# Default maximum number of fully written radar images waiting for detection in folder watching mode
+WATCH_QUEUE_SIZE = 16
+
+# Available debug output formats: "png" for saving debug images of each stage into debug folders,
+# "bundle" for recording debug arrays of a radar image into one compressed .npz bundle written in background
+DEBUG_FORMATS = ("png", "bundle")
+
+# Default debug output format
+DEFAULT_DEBUG_FORMAT = "bundle"
+
+# File name of debug bundle under output folder of a radar image
+DEBUG_BUNDLE_NAME = "debug_bundle.npz"
+
+# Maximum number of debug bundles waiting for the background writer, each bundle holds all debug arrays of a radar image
+DEBUG_BUNDLE_QUEUE_SIZE = 2
+
+# zlib compression level (0-9) of palettized result images, lower for faster encoding and higher for smaller files
+RESULT_PNG_COMPRESS_LEVEL = 6
+
+# Rendering modes of mesocyclone result images: "headless" for no images, "cropped" for bounding box patch
+# images of detect areas rendered when their paths are accessed, "full" for image size images saved eagerly
+RESULT_RENDER_MODES = ("headless", "cropped", "full")
+
+# Default rendering mode of mesocyclone result images
+DEFAULT_RESULT_RENDER_MODE = "full"
+
+# Quantiles of stage times and counters in aggregated detection metrics
+METRICS_QUANTILES = (0.5, 0.95, 0.99)
+
+# Metric name prefix of detection metrics in Prometheus text format
+METRICS_PROMETHEUS_PREFIX = "mesodetect"
+
+# Folder name of profiling outputs under output folder of a radar image in profiling mode
+PROFILE_FOLDER_NAME = "profile"
+
+# File name of Chrome trace event timeline in profile folder
+PROFILE_TRACE_NAME = "trace.json"
+
+# Default ratio of radar images that are profiled in profiling mode of batch detection
+PROFILE_SAMPLE_RATE = 1.0
+
+# Number of threads running independent neg and pos velocity mode stages of a radar image at the same time,
+# stages run one after another in the detection thread when less than 2, and always in profiling or memory tracing.
+# The mode analyses still hold the GIL in Python loops, so threads give no speedup and are disabled by default,
+# note that CPU time of outer stages does not include stages run in other threads
+STAGE_WORKER_NUM = 1
+
 # Default debug image folder name
 CURRENT_DEBUG_RESULT_FOLDER = "DataIO/"
 
@@ -42,4 +183,6 @@ class DetectionResult(TypedDict):
     station_number: str
     scan_time: datetime
     meso_list: List[MesocycloneInfo]
-    result_img_paths: List[str]
\ No newline at end of file
+    # List of result image paths, or MesoResultImages rendering each image on access in "cropped" mode
+    result_img_paths: Sequence[str]
+    metrics: dict
\ No newline at end of file
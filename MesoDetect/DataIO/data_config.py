@@ -1,20 +1,27 @@
 """
 This file provides functions that process input original radar image
 and generate a radar image configration data file, also provides functions
-to read configration data
+to read configration data and a registry of per-station radar config profiles
 """
 from PIL import Image
 import math
+import threading
 from colorama import Fore, Style
 import yaml
 import re
 import os
-from MesoDetect.DataIO.consts import CONFIG_FILE
-from MesoDetect.DataIO.utils import check_output_folder
-from typing import Union, Optional, Tuple
+from MesoDetect.DataIO.consts import CONFIG_FILE, STATION_CONFIG_FOLDER
+from MesoDetect.DataIO.utils import check_output_folder, parse_radar_image_name
+from MesoDetect.DataIO.radar_config import RadarConfig, load_radar_config
+from typing import Union, Optional, Tuple, Dict
 from pathlib import Path
 
 
+# In-memory station profiles keyed by station number and image size
+_station_profiles: Dict[Tuple[str, Tuple[int, int]], RadarConfig] = {}
+_station_profiles_lock = threading.RLock()
+
+
 """
 Public Interface for setting up data configration
 """
@@ -23,19 +30,20 @@ def setup_config(
         output_folder_path: Union[str, Path],
         station_num: str = "",
         enable_default_config: bool = True,
-) -> Optional[Tuple[str, Path, Path]]:
+) -> Optional[Tuple[str, Path, Path, RadarConfig]]:
     """
     Set up detetion configuration data, including resolving original image path, creating output directory, extracting
-    station number, writing and validating radar image configuration data.
+    station number and getting radar config profile of the station. Default config profiles are kept in memory by the
+    station registry, so no config file is written during detection.
     Args:
         img_path: original input image path
         output_folder_path: given output path
         station_num: radar station number
-        enable_default_config: bool flag for enabling default radar image config
+        enable_default_config: bool flag for enabling default radar image config, use the config file otherwise
 
     Returns:
-        resolved station number, resolved image path and output directory path if processing successfully,
-        None otherwise.
+        resolved station number, resolved image path, output directory path and radar config
+        if processing successfully, None otherwise.
     """
     print("[Info] Start setting up data configuration...")
     # Resolve original input image path, transform into Path type
@@ -71,37 +79,122 @@ def setup_config(
 
     # Check if use default radar image configurataion
     if enable_default_config:
-        write_result = write_default_config(resolved_img_path_str)
-        if not write_result:
-            print(Fore.RED + "[Error] Writing default configration data failed." + Style.RESET_ALL)
+        try:
+            with Image.open(resolved_image_path) as radar_img:
+                image_size = radar_img.size
+        except Exception as e:
+            print(Fore.RED + f"[Error] Unexcepted: {e}" + Style.RESET_ALL)
+            print(Fore.RED + "[Error] Reading radar image size failed." + Style.RESET_ALL)
             return None
-
-    # Validate config file
-    validation_result = validate_radar_config()
-    if not validation_result:
-        print(Fore.RED + "[Error] Validating radar image configration data failed." + Style.RESET_ALL)
-        return None
+        radar_config = get_station_config(station_num, image_size)
+    else:
+        # Validate config file
+        validation_result = validate_radar_config()
+        if not validation_result:
+            print(Fore.RED + "[Error] Validating radar image configration data failed." + Style.RESET_ALL)
+            return None
+        radar_config = load_radar_config()
     print("[Info] Setting up data configuration complete.")
-    return station_num, resolved_image_path, result_output_path
+    return station_num, resolved_image_path, result_output_path, radar_config
 
 
 def is_valid_image_name(image_name: str) -> bool:
-    # Split the name into segments
-    segments = image_name.split('_')
+    return parse_radar_image_name(image_name) is not None
 
-    # Check if there are enough segments (at least 5)
-    if len(segments) < 5:
-        return False
 
-    # Check the 4th segment (Z followed by exactly 4 digits)
-    if not re.fullmatch(r'Z\d{4}', segments[3]):
-        return False
+"""
+Public Interface: get radar config profile of the station from station registry
+"""
+def get_station_config(station_num: str, image_size: Tuple[int, int], persist: bool = False) -> RadarConfig:
+    """
+    Gets the radar config profile of the station for radar images with given size. The profile is built on first use,
+    from the persisted station config file if it exists or from default config data otherwise,
+    and is held in memory for later detections.
 
-    # Check the 5th segment (timestamp: YYYYmmDDHHMM or YYYYmmDDHHMMss)
-    if not re.fullmatch(r'\d{12}(\d{2})?', segments[4]):
-        return False
+    Args:
+        station_num (str): radar station number with format "Zxxxx".
+        image_size (Tuple[int, int]): radar image size (width, height).
+        persist (bool): whether to save a newly built default profile into the station config file.
 
-    return True
+    Returns:
+        RadarConfig: radar config profile of the station.
+    """
+    profile_key = (station_num, (image_size[0], image_size[1]))
+    radar_config = _station_profiles.get(profile_key)
+    if radar_config is not None:
+        return radar_config
+
+    with _station_profiles_lock:
+        if profile_key not in _station_profiles:
+            _station_profiles[profile_key] = build_station_config(station_num, profile_key[1], persist)
+        return _station_profiles[profile_key]
+
+
+"""
+Logic Implementation Functon: build radar config profile of the station
+"""
+def build_station_config(station_num: str, image_size: Tuple[int, int], persist: bool = False) -> RadarConfig:
+    """
+    Builds the radar config profile of the station, using the station config file when it is valid.
+
+    Args:
+        station_num (str): radar station number with format "Zxxxx".
+        image_size (Tuple[int, int]): radar image size (width, height).
+        persist (bool): whether to save the built default profile into the station config file.
+
+    Returns:
+        RadarConfig: radar config profile of the station.
+    """
+    station_config_path = get_station_config_path(station_num, image_size)
+    if os.path.exists(station_config_path) and validate_radar_config(station_config_path):
+        radar_config = load_radar_config(station_config_path)
+        if radar_config.image_size == image_size:
+            return radar_config
+        print(Fore.YELLOW + f"[Warning] Image size in `{station_config_path}` does not match {image_size}, "
+                            f"default config data is used." + Style.RESET_ALL)
+
+    radar_config = RadarConfig.from_dict(yaml.safe_load(get_default_config_content(image_size)))
+    if persist:
+        save_station_config(station_num, radar_config)
+    return radar_config
+
+
+"""
+Utility Function: save radar config profile of the station
+"""
+def save_station_config(station_num: str, radar_config: RadarConfig) -> str:
+    """
+    Saves the radar config profile of the station into the station config file, and updates the station registry.
+
+    Args:
+        station_num (str): radar station number with format "Zxxxx".
+        radar_config (RadarConfig): radar config profile of the station.
+
+    Returns:
+        str: path of the station config file.
+    """
+    os.makedirs(STATION_CONFIG_FOLDER, exist_ok=True)
+    station_config_path = get_station_config_path(station_num, radar_config.image_size)
+    with open(station_config_path, "w") as file:
+        yaml.safe_dump(radar_config.to_dict(), file, default_flow_style=None, sort_keys=False)
+    with _station_profiles_lock:
+        _station_profiles[(station_num, radar_config.image_size)] = radar_config
+    return station_config_path
+
+
+"""
+Utility Function: get station config file path
+"""
+def get_station_config_path(station_num: str, image_size: Tuple[int, int]) -> str:
+    return STATION_CONFIG_FOLDER + f"{station_num}_{image_size[0]}x{image_size[1]}.yaml"
+
+
+"""
+Utility Function: clear in-memory station profiles
+"""
+def clear_station_registry():
+    with _station_profiles_lock:
+        _station_profiles.clear()
 
 
 """
@@ -120,13 +213,37 @@ def write_default_config(sample_img_path: str, yaml_path: str = CONFIG_FILE):
     """
     try:
         radar_img = Image.open(sample_img_path)
+        yaml_content = get_default_config_content(radar_img.size)
+    except Exception as e:
+        print(Fore.RED + f"[Error] Unexcepted: {e}" + Style.RESET_ALL)
+        return False
+
+    # Write the YAML content to the file
+    with open(yaml_path, "w") as file:
+        file.write(yaml_content)
+
+    print(f"[Info] Default radar config file generated successfully at: {yaml_path}")
+    return True
 
-        (width, height) = radar_img.size
 
-        center_offset = math.floor(height / 2)
-        radar_zone_offset = math.floor(height * 0.05)
+"""
+Utility Function: get default radar image config file content
+"""
+def get_default_config_content(image_size: Tuple[int, int]) -> str:
+    """
+    Generates default YAML configuration content with comments explaining each variable for radar images of given size.
 
-        yaml_content = f"""# Configuration for Radar Detection
+    Parameters:
+        image_size: radar image size (width, height).
+    Returns:
+        YAML content in string type.
+    """
+    (width, height) = image_size
+
+    center_offset = math.floor(height / 2)
+    radar_zone_offset = math.floor(height * 0.05)
+
+    yaml_content = f"""# Configuration for Radar Detection
     image_size: """ + str([width, height]) + """ # size of radar image: [width, height]
     
     radar_center: """ + str([center_offset, center_offset]) + """  # List of 2 integers: [x, y]
@@ -164,16 +281,7 @@ def write_default_config(sample_img_path: str, yaml_path: str = CONFIG_FILE):
         - 27.5
     
     """
-    except Exception as e:
-        print(Fore.RED + f"[Error] Unexcepted: {e}" + Style.RESET_ALL)
-        return False
-
-    # Write the YAML content to the file
-    with open(yaml_path, "w") as file:
-        file.write(yaml_content)
-
-    print(f"[Info] Default radar config file generated successfully at: {yaml_path}")
-    return True
+    return yaml_content
 
 
 """
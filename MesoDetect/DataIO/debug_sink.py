@@ -0,0 +1,314 @@
+"""
+This file provides debug sinks that receive debug images of analysis stages. Stages allocate debug canvases
+through the sink and hand over frames and images to it, so that with the null sink of disabled debug mode
+no debug canvas is allocated and nothing is drawn or rendered.
+Debug outputs can also be recorded as arrays into one compressed debug bundle per radar image, which is written
+by a background writer thread and rendered into debug images on demand.
+"""
+import os
+import sys
+import atexit
+import queue
+import threading
+import numpy as np
+from PIL import Image
+from colorama import Fore, Style
+from MesoDetect.DataIO.consts import DEBUG_BUNDLE_QUEUE_SIZE
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.utils import check_output_folder
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+# Key suffixes of debug arrays in debug bundle
+BUNDLE_RGB_SUFFIX = "@rgb"
+BUNDLE_LAYERS_SUFFIX = "@layers"
+BUNDLE_FLAGS_SUFFIX = "@flags"
+
+
+class DebugSink:
+    """
+    Null debug sink used when debug mode is disabled, every debug output is discarded.
+
+    Attributes:
+        enabled (bool): whether debug outputs are kept, stages skip debug only computation when False.
+    """
+    enabled = False
+
+    def stage(self, folder_name: str) -> Optional["DebugSink"]:
+        """
+        Gets the sink for debug outputs of an analysis stage.
+
+        Args:
+            folder_name (str): debug folder name of the stage, such as "RadarDenoise/".
+
+        Returns:
+            Optional[DebugSink]: the stage sink, or None if the stage sink can not be prepared.
+        """
+        return self
+
+    def canvas(self, size: Tuple[int, int]) -> Optional[np.ndarray]:
+        """
+        Allocates a black RGB canvas for drawing a debug image.
+
+        Args:
+            size (Tuple[int, int]): canvas size (width, height).
+
+        Returns:
+            Optional[np.ndarray]: uint8 array with shape (height, width, 3), None when debug outputs are discarded.
+        """
+        return None
+
+    def save_canvas(self, name: str, canvas: Optional[np.ndarray]):
+        """Saves a debug canvas from canvas() with given debug image name."""
+        pass
+
+    def save_frame(self, name: str, frame: RadarFrame):
+        """Saves the current state of a radar frame with given debug image name."""
+        pass
+
+    def save_image(self, name: str, image: Image):
+        """Saves a debug image with given debug image name."""
+        pass
+
+
+# Shared sink of disabled debug mode
+NULL_DEBUG_SINK = DebugSink()
+
+
+class FolderDebugSink(DebugSink):
+    """
+    Debug sink that saves each debug output as a PNG image in a folder.
+
+    Attributes:
+        folder_path (Path): folder of debug images.
+    """
+    enabled = True
+
+    def __init__(self, folder_path: Path):
+        self.folder_path = folder_path
+
+    def stage(self, folder_name: str) -> Optional[DebugSink]:
+        stage_folder_path = check_output_folder(self.folder_path, folder_name)
+        if stage_folder_path is None:
+            return None
+        return FolderDebugSink(stage_folder_path)
+
+    def canvas(self, size: Tuple[int, int]) -> Optional[np.ndarray]:
+        return np.zeros((size[1], size[0], 3), dtype=np.uint8)
+
+    def save_canvas(self, name: str, canvas: Optional[np.ndarray]):
+        Image.fromarray(canvas).save(self.folder_path / (name + ".png"))
+
+    def save_frame(self, name: str, frame: RadarFrame):
+        frame.to_image().save(self.folder_path / (name + ".png"))
+
+    def save_image(self, name: str, image: Image):
+        image.save(self.folder_path / (name + ".png"))
+
+
+class BundleDebugSink(DebugSink):
+    """
+    Debug sink that records each debug output as arrays in memory, which are saved into one compressed .npz
+    debug bundle by save_bundle(). Debug canvases are recorded as RGB arrays and radar frames as their layer
+    and flag planes, keyed by "<stage folder>/<debug image name>" with an array suffix.
+
+    Attributes:
+        records (Dict[str, np.ndarray]): recorded debug arrays shared by sinks of all stages.
+        prefix (str): stage folder of the sink, empty for the root sink.
+    """
+    enabled = True
+
+    def __init__(self, records: Optional[Dict[str, np.ndarray]] = None, prefix: str = ""):
+        self.records = {} if records is None else records
+        self.prefix = prefix
+
+    def stage(self, folder_name: str) -> Optional[DebugSink]:
+        return BundleDebugSink(self.records, self.get_key(folder_name.strip("/")))
+
+    def canvas(self, size: Tuple[int, int]) -> Optional[np.ndarray]:
+        return np.zeros((size[1], size[0], 3), dtype=np.uint8)
+
+    def save_canvas(self, name: str, canvas: Optional[np.ndarray]):
+        # Canvases may be drawn further after saved, so a copy is recorded
+        self.records[self.get_key(name) + BUNDLE_RGB_SUFFIX] = canvas.copy()
+
+    def save_frame(self, name: str, frame: RadarFrame):
+        key = self.get_key(name)
+        self.records[key + BUNDLE_LAYERS_SUFFIX] = frame.layers.copy()
+        self.records[key + BUNDLE_FLAGS_SUFFIX] = frame.flags.copy()
+
+    def save_image(self, name: str, image: Image):
+        self.records[self.get_key(name) + BUNDLE_RGB_SUFFIX] = np.asarray(image.convert("RGB"))
+
+    def get_key(self, name: str) -> str:
+        return name if not self.prefix else self.prefix + "/" + name
+
+    def save_bundle(self, bundle_path: Union[str, Path]):
+        """
+        Hands over recorded debug arrays to the background writer, which saves them as a compressed .npz bundle.
+        Recorded arrays are cleared so that the sink can be used for another radar image.
+
+        Args:
+            bundle_path (Union[str, Path]): path of the debug bundle file.
+        """
+        records = dict(self.records)
+        self.records.clear()
+        submit_debug_bundle(Path(bundle_path), records)
+
+
+# Queue of debug bundles waiting for the background writer, bounded so that submitting blocks
+# when bundles are recorded faster than they are written
+_bundle_queue: "queue.Queue[Tuple[Path, Dict[str, np.ndarray]]]" = queue.Queue(maxsize=DEBUG_BUNDLE_QUEUE_SIZE)
+_bundle_writer: Optional[threading.Thread] = None
+_bundle_writer_lock = threading.Lock()
+
+
+"""
+Utility Function: submit debug bundle to background writer
+"""
+def submit_debug_bundle(bundle_path: Path, records: Dict[str, np.ndarray]):
+    """
+    Puts a debug bundle into the writing queue and starts the background writer thread if not running,
+    blocks while the queue is full.
+
+    Args:
+        bundle_path (Path): path of the debug bundle file.
+        records (Dict[str, np.ndarray]): debug arrays of the bundle.
+    """
+    global _bundle_writer
+    with _bundle_writer_lock:
+        if _bundle_writer is None or not _bundle_writer.is_alive():
+            _bundle_writer = threading.Thread(target=write_debug_bundles, name="DebugBundleWriter", daemon=True)
+            _bundle_writer.start()
+    _bundle_queue.put((bundle_path, records))
+
+
+"""
+Logic Implementation Function: background writer of debug bundles
+"""
+def write_debug_bundles():
+    """
+    Background writer loop saving queued debug bundles as compressed .npz files. Each bundle is written
+    into a temporary file first and then renamed, so a bundle file is never read partially written.
+    """
+    while True:
+        bundle_path, records = _bundle_queue.get()
+        temp_path = bundle_path.with_name(bundle_path.name + f".{os.getpid()}.tmp")
+        try:
+            with open(temp_path, "wb") as bundle_file:
+                np.savez_compressed(bundle_file, **records)
+            os.replace(temp_path, bundle_path)
+        except Exception as e:
+            print(Fore.YELLOW + f"[Warning] Saving debug bundle {bundle_path} failed: {e}" + Style.RESET_ALL)
+            if temp_path.exists():
+                temp_path.unlink()
+        finally:
+            _bundle_queue.task_done()
+
+
+"""
+Public Interface: wait for pending debug bundles
+"""
+def flush_debug_bundles():
+    """
+    Blocks until all debug bundles submitted so far are written. Called automatically at interpreter exit.
+    """
+    if _bundle_writer is not None:
+        _bundle_queue.join()
+
+
+atexit.register(flush_debug_bundles)
+
+
+"""
+Public Interface: render debug images from debug bundle
+"""
+def render_debug_bundle(
+        bundle_path: Union[str, Path],
+        output_folder_path: Union[str, Path],
+        names: Optional[List[str]] = None
+) -> Optional[List[str]]:
+    """
+    Renders debug images recorded in a debug bundle into PNG files with the same folder layout as the png
+    debug format, so that any stage can be inspected after detection.
+
+    Args:
+        bundle_path (Union[str, Path]): path of the debug bundle file.
+        output_folder_path (Union[str, Path]): folder for rendered debug images.
+        names (Optional[List[str]]): debug image names or stage folder prefixes to render, such as
+            "RadarDenoise/" or "RadarDenoise/neg_integrate", all debug images are rendered if not given.
+
+    Returns:
+        Optional[List[str]]: paths of rendered debug images as POSIX strings, None if the bundle can not be read.
+    """
+    bundle_path = Path(bundle_path)
+    output_folder_path = Path(output_folder_path)
+    if not bundle_path.is_file():
+        print(Fore.RED + f"[Error] Debug bundle {bundle_path} does not exist." + Style.RESET_ALL)
+        return None
+
+    rendered_paths = []
+    try:
+        with np.load(bundle_path) as bundle:
+            for key in sorted(bundle.files):
+                name, suffix = key.rsplit("@", 1)
+                suffix = "@" + suffix
+                if suffix == BUNDLE_FLAGS_SUFFIX:
+                    continue
+                if names is not None and not any(name == item or name.startswith(item) for item in names):
+                    continue
+                if suffix == BUNDLE_RGB_SUFFIX:
+                    debug_img = Image.fromarray(bundle[key])
+                else:
+                    debug_img = RadarFrame(bundle[key], bundle[name + BUNDLE_FLAGS_SUFFIX]).to_image()
+                image_path = output_folder_path / (name + ".png")
+                image_path.parent.mkdir(parents=True, exist_ok=True)
+                debug_img.save(image_path)
+                rendered_paths.append(image_path.as_posix())
+    except Exception as e:
+        print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
+        print(Fore.RED + f"[Error] Rendering debug bundle {bundle_path} failed." + Style.RESET_ALL)
+        return None
+
+    return rendered_paths
+
+
+"""
+Utility Function: get debug sink of an analysis stage
+"""
+def get_debug_sink(
+        enable_debug: bool,
+        output_path: Path,
+        folder_name: str,
+        debug_sink: Optional[DebugSink] = None
+) -> Optional[DebugSink]:
+    """
+    Gets the debug sink of an analysis stage, which saves debug images into the stage folder under output path
+    when debug mode is enabled, or discards them otherwise.
+
+    Args:
+        enable_debug (bool): whether debug mode is enabled.
+        output_path (Path): output folder path of current radar image.
+        folder_name (str): debug folder name of the stage.
+        debug_sink (Optional[DebugSink]): debug sink of current radar image, such as a BundleDebugSink,
+            debug images are saved as PNG files under output path if not given.
+
+    Returns:
+        Optional[DebugSink]: debug sink of the stage, or None if the stage folder can not be created.
+    """
+    if not enable_debug:
+        return NULL_DEBUG_SINK
+    if debug_sink is not None:
+        return debug_sink.stage(folder_name)
+    return FolderDebugSink(output_path).stage(folder_name)
+
+
+if __name__ == "__main__":
+    # Usage: python -m MesoDetect.DataIO.debug_sink <bundle path> <output folder> [debug image names...]
+    if len(sys.argv) < 3:
+        print("Usage: python -m MesoDetect.DataIO.debug_sink <bundle path> <output folder> [names...]")
+        sys.exit(1)
+    result_paths = render_debug_bundle(sys.argv[1], sys.argv[2], sys.argv[3:] or None)
+    if result_paths is None:
+        sys.exit(1)
+    print(f"[Info] {len(result_paths)} debug images rendered into {sys.argv[2]}.")
@@ -0,0 +1,142 @@
+"""
+This file implements the NumPy decoding engine that turns the RGB data of a radar image
+into a layer index plane in one pass, using an RGB to layer index lookup table built from the color bar.
+Palette mode images skip RGB conversion, their palette entries are classified once and the palette
+index buffer is mapped into the layer index plane directly.
+"""
+import numpy as np
+from PIL import Image
+from functools import lru_cache
+from MesoDetect.DataIO.consts import COLOR_MATCH_TOLERANCE, NO_ECHO_INDEX
+from typing import List, Optional, Tuple
+
+
+"""
+Utility Function: build RGB to layer index lookup table
+"""
+@lru_cache(maxsize=4)
+def build_color_lut(
+        colors: Tuple[Tuple[int, int, int], ...],
+        tolerance: int = COLOR_MATCH_TOLERANCE
+) -> np.ndarray:
+    """
+    Builds a lookup table that maps every RGB color to the index of the first color bar color
+    that matches it within the given per-channel tolerance.
+
+    Args:
+        colors (Tuple[Tuple[int, int, int], ...]): color bar colors, in color velocity pairs order.
+        tolerance (int): maximum absolute difference allowed for each channel.
+
+    Returns:
+        np.ndarray: uint8 array with shape (256, 256, 256) indexed by [R, G, B], holding the matched
+        color index or NO_ECHO_INDEX for colors that match no color bar color.
+    """
+    lut = np.full((256, 256, 256), NO_ECHO_INDEX, dtype=np.uint8)
+    # Write colors in reversed order so that the first matched color wins on overlapping ranges
+    for idx in range(len(colors) - 1, -1, -1):
+        r, g, b = colors[idx][:3]
+        lut[max(r - tolerance, 0):r + tolerance + 1,
+            max(g - tolerance, 0):g + tolerance + 1,
+            max(b - tolerance, 0):b + tolerance + 1] = idx
+    lut.flags.writeable = False
+    return lut
+
+
+"""
+Logic Implementation Function: decode radar image into layer index plane
+"""
+def decode_layer_plane(
+        radar_img: Image,
+        radar_zone: List[int],
+        cv_pairs: List[Tuple[Tuple[int, int, int], float]],
+        cover_mask: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Decodes the radar zone of a radar image into a layer index plane. Palette mode images are decoded
+    from their palette indexes directly, other images are decoded from their RGB data.
+
+    Args:
+        radar_img (Image): original radar image.
+        radar_zone (List[int]): radar zone range [min, max] shared by both axes.
+        cv_pairs (List[Tuple[Tuple[int, int, int], float]]): color velocity pairs of the color bar.
+        cover_mask (Optional[np.ndarray]): boolean mask indexed by [y, x] of pixels decoded as black color,
+            such as station boundary pixels.
+
+    Returns:
+        np.ndarray: uint8 array with shape (height, width) holding the color velocity pair index of each pixel,
+        NO_ECHO_INDEX for pixels outside radar zone or without matched color.
+    """
+    lut = build_color_lut(tuple(cv[0] for cv in cv_pairs))
+    zone = (slice(radar_zone[0], radar_zone[1]), slice(radar_zone[0], radar_zone[1]))
+    if radar_img.mode == "P":
+        zone_plane = build_palette_lut(radar_img, lut)[np.asarray(radar_img)[zone]]
+    else:
+        zone_arr = np.asarray(radar_img.convert("RGB"))[zone]
+        zone_plane = lut[zone_arr[..., 0], zone_arr[..., 1], zone_arr[..., 2]]
+
+    if cover_mask is not None:
+        zone_cover = cover_mask[zone]
+        zone_plane[:zone_cover.shape[0], :zone_cover.shape[1]][zone_cover] = lut[0, 0, 0]
+
+    layer_plane = np.full((radar_img.size[1], radar_img.size[0]), NO_ECHO_INDEX, dtype=np.uint8)
+    layer_plane[zone] = zone_plane
+    return layer_plane
+
+
+"""
+Utility Function: build palette index to layer index lookup table
+"""
+def build_palette_lut(radar_img: Image, lut: np.ndarray) -> np.ndarray:
+    """
+    Classifies each palette entry of a palette mode image against the color bar once,
+    so that the palette index buffer of the image maps into layer indexes with one lookup.
+
+    Args:
+        radar_img (Image): palette mode radar image.
+        lut (np.ndarray): RGB to layer index lookup table, see build_color_lut.
+
+    Returns:
+        np.ndarray: uint8 array with shape (256,) of layer index of each palette index,
+        palette indexes without palette entry are regarded as black color.
+    """
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    raw_palette = np.asarray(radar_img.getpalette("RGB"), dtype=np.uint8).reshape(-1, 3)[:256]
+    palette[:len(raw_palette)] = raw_palette
+    return lut[palette[:, 0], palette[:, 1], palette[:, 2]]
+
+
+"""
+Utility Function: convert layer index plane into color bar colored image
+"""
+def layer_plane_to_color_img(layer_plane: np.ndarray, palette: np.ndarray) -> Image:
+    """
+    Converts a layer index plane into an RGB image colored with the color bar colors.
+
+    Args:
+        layer_plane (np.ndarray): uint8 layer index plane.
+        palette (np.ndarray): uint8 array with shape (256, 3) of color of each layer index, see RadarConfig.palette.
+
+    Returns:
+        Image: RGB image with color bar colors, black for no echo.
+    """
+    return Image.fromarray(palette[layer_plane])
+
+
+"""
+Utility Function: convert layer index plane into color bar palettized image
+"""
+def layer_plane_to_palette_img(layer_plane: np.ndarray, palette: np.ndarray) -> Image:
+    """
+    Converts a layer index plane into a P mode image using the color bar colors as palette, which saves the
+    color lookup and gives much smaller PNG files than RGB images.
+
+    Args:
+        layer_plane (np.ndarray): uint8 layer index plane.
+        palette (np.ndarray): uint8 array with shape (256, 3) of color of each layer index, see RadarConfig.palette.
+
+    Returns:
+        Image: P mode image with color bar palette, black for no echo.
+    """
+    palette_img = Image.fromarray(layer_plane)
+    palette_img.putpalette(palette.tobytes())
+    return palette_img
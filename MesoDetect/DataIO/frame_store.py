@@ -0,0 +1,246 @@
+"""
+This file provides the on-disk store of preprocessed radar frames, so that reprocessing the same radar image
+skips decoding, boundary covering and narrow filling. A stored frame is keyed by the image content hash together
+with everything that affects preprocessing, and holds the layer index plane packed two pixels per byte,
+which is memory-mapped on reading.
+"""
+import os
+import hashlib
+import numpy as np
+from colorama import Fore, Style
+import time
+import threading
+from MesoDetect.DataIO.consts import (FRAME_STORE_FOLDER, FRAME_STORE_VERSION, BASEMAP_IMG_PATH, FRAME_STORE_MAX_SIZE,
+                                      FRAME_STORE_MAX_AGE, FRAME_STORE_PRUNE_INTERVAL)
+from MesoDetect.DataIO.radar_config import RadarConfig
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+# Number of layer index values that fit in 4 bits, including no echo
+PACKED_LEVEL_NUM = 16
+
+# Number of frames stored by current process since last pruning
+_stored_count = 0
+_stored_count_lock = threading.Lock()
+
+
+"""
+Utility Function: get store key of preprocessed radar frame
+"""
+def get_frame_key(img_path: Union[str, Path], station_num: str, decoder: str, radar_config: RadarConfig) -> str:
+    """
+    Computes the store key of the preprocessed frame of a radar image, from the image content hash,
+    the frame store version, the decoding engine, the station number, the radar config,
+    the white boundary basemap and the learned overlay pixels of the station.
+
+    Args:
+        img_path (Union[str, Path]): original radar image path.
+        station_num (str): radar station number with format "Zxxxx".
+        decoder (str): radar image decoding engine, one of DECODER_ENGINES.
+        radar_config (RadarConfig): radar config of the radar image.
+
+    Returns:
+        str: hex digest store key.
+    """
+    key_hash = hashlib.sha256()
+    with open(img_path, "rb") as file:
+        key_hash.update(hashlib.sha256(file.read()).digest())
+
+    # White boundary basemap of the station decides covered pixels,
+    # and overlay pixels of the station decide the narrow filling candidates
+    boundary_path = BASEMAP_IMG_PATH + "white_boundary_" + station_num + ".png"
+    boundary_mtime = os.stat(boundary_path).st_mtime_ns if os.path.exists(boundary_path) else 0
+    overlay_path = BASEMAP_IMG_PATH + "overlay_pixels_" + station_num + ".npy"
+    overlay_mtime = os.stat(overlay_path).st_mtime_ns if os.path.exists(overlay_path) else 0
+
+    key_hash.update(repr((FRAME_STORE_VERSION, decoder, station_num, boundary_mtime, overlay_mtime,
+                          radar_config.to_dict())).encode())
+    return key_hash.hexdigest()
+
+
+"""
+Utility Function: pack layer index plane into 4-bit values
+"""
+def pack_layer_plane(layers: np.ndarray) -> np.ndarray:
+    """
+    Packs an int8 layer index plane two pixels per byte, the first pixel of each pair in the high 4 bits.
+
+    Args:
+        layers (np.ndarray): int8 layer index plane indexed by [y, x], -1 for no echo.
+
+    Returns:
+        np.ndarray: uint8 array with shape (height, ceil(width / 2)).
+    """
+    height, width = layers.shape
+    values = np.zeros((height, width + width % 2), dtype=np.uint8)
+    # Shift by one so that no echo (-1) is stored as 0
+    values[:, :width] = layers + 1
+    return (values[:, 0::2] << 4) | values[:, 1::2]
+
+
+"""
+Utility Function: unpack 4-bit values into layer index plane
+"""
+def unpack_layer_plane(packed: np.ndarray, width: int) -> np.ndarray:
+    """
+    Unpacks a packed layer index plane, see pack_layer_plane.
+
+    Args:
+        packed (np.ndarray): uint8 array with shape (height, ceil(width / 2)).
+        width (int): width of the layer index plane.
+
+    Returns:
+        np.ndarray: writable int8 layer index plane indexed by [y, x], -1 for no echo.
+    """
+    values = np.empty((packed.shape[0], packed.shape[1] * 2), dtype=np.uint8)
+    values[:, 0::2] = packed >> 4
+    values[:, 1::2] = packed & 0x0F
+    return values[:, :width].astype(np.int8) - 1
+
+
+"""
+Utility Function: get stored frame file path
+"""
+def get_frame_path(frame_key: str, store_folder: Union[str, Path] = FRAME_STORE_FOLDER) -> str:
+    return os.path.join(store_folder, frame_key[:2], frame_key + ".npy")
+
+
+"""
+Public Interface: load stored preprocessed radar frame
+"""
+def load_stored_frame(
+        frame_key: str,
+        image_size: Tuple[int, int],
+        store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+) -> Optional[RadarFrame]:
+    """
+    Loads the stored preprocessed frame with given key.
+
+    Args:
+        frame_key (str): store key of the frame, see get_frame_key.
+        image_size (Tuple[int, int]): expected frame size (width, height).
+        store_folder (Union[str, Path]): folder of stored frames.
+
+    Returns:
+        Optional[RadarFrame]: the stored frame, or None if no valid frame is stored with the key.
+    """
+    frame_path = get_frame_path(frame_key, store_folder)
+    if not os.path.exists(frame_path):
+        return None
+
+    width, height = image_size
+    try:
+        packed = np.load(frame_path, mmap_mode="r")
+    except (OSError, ValueError) as e:
+        print(Fore.YELLOW + f"[Warning] Reading stored frame `{frame_path}` failed: {e}" + Style.RESET_ALL)
+        return None
+    if packed.dtype != np.uint8 or packed.shape != (height, (width + 1) // 2):
+        print(Fore.YELLOW + f"[Warning] Stored frame `{frame_path}` does not match image size {image_size}."
+              + Style.RESET_ALL)
+        return None
+
+    # Update modification time as last use time for pruning
+    try:
+        os.utime(frame_path)
+    except OSError:
+        pass
+    print("[Info] Reuse stored preprocessed radar frame.")
+    return RadarFrame(unpack_layer_plane(packed, width))
+
+
+"""
+Public Interface: store preprocessed radar frame
+"""
+def save_stored_frame(
+        frame_key: str,
+        radar_frame: RadarFrame,
+        store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+) -> Optional[str]:
+    """
+    Stores a preprocessed frame with given key. Frames with flags or with layer indexes
+    that do not fit in 4 bits are not stored.
+
+    Args:
+        frame_key (str): store key of the frame, see get_frame_key.
+        radar_frame (RadarFrame): preprocessed radar frame.
+        store_folder (Union[str, Path]): folder of stored frames.
+
+    Returns:
+        Optional[str]: path of the stored frame file, or None if the frame is not stored.
+    """
+    if radar_frame.flags.any() or radar_frame.layers.max(initial=-1) >= PACKED_LEVEL_NUM - 1:
+        return None
+
+    frame_path = get_frame_path(frame_key, store_folder)
+    temp_path = frame_path + "." + str(os.getpid()) + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(frame_path), exist_ok=True)
+        with open(temp_path, "wb") as file:
+            np.save(file, pack_layer_plane(radar_frame.layers))
+        # Replace in one step so that readers never see a partly written frame
+        os.replace(temp_path, frame_path)
+    except OSError as e:
+        print(Fore.YELLOW + f"[Warning] Storing preprocessed frame failed: {e}" + Style.RESET_ALL)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+    # Prune the store once in a while instead of scanning it on every store
+    global _stored_count
+    with _stored_count_lock:
+        _stored_count += 1
+        need_prune = _stored_count >= FRAME_STORE_PRUNE_INTERVAL
+        if need_prune:
+            _stored_count = 0
+    if need_prune:
+        prune_frame_store(store_folder)
+    return frame_path
+
+
+"""
+Public Interface: prune stored preprocessed radar frames
+"""
+def prune_frame_store(
+        store_folder: Union[str, Path] = FRAME_STORE_FOLDER,
+        max_size: int = FRAME_STORE_MAX_SIZE,
+        max_age: float = FRAME_STORE_MAX_AGE
+) -> int:
+    """
+    Removes stored frames that are not used within max age, and then least recently used frames
+    until the total size of stored frames is not larger than max size.
+
+    Args:
+        store_folder (Union[str, Path]): folder of stored frames.
+        max_size (int): maximum total size in bytes of stored frames.
+        max_age (float): maximum age in seconds of stored frames since last use.
+
+    Returns:
+        int: number of removed frames.
+    """
+    frame_files = []
+    for frame_path in Path(store_folder).glob("*/*.npy"):
+        try:
+            stat = frame_path.stat()
+        except OSError:
+            continue
+        frame_files.append((stat.st_mtime, stat.st_size, frame_path))
+
+    # Remove expired frames and least recently used frames beyond max size
+    frame_files.sort(reverse=True)
+    expire_time = time.time() - max_age
+    total_size = 0
+    removed_num = 0
+    for mtime, size, frame_path in frame_files:
+        if mtime >= expire_time and total_size + size <= max_size:
+            total_size += size
+            continue
+        try:
+            frame_path.unlink()
+            removed_num += 1
+        except OSError:
+            # Frames removed by other processes at the same time
+            pass
+    if removed_num > 0:
+        print(f"[Info] Removed {removed_num} stored frames from frame store.")
+    return removed_num
@@ -0,0 +1,524 @@
+"""
+This file provides metrics of detection process. Wall time and CPU time of each stage and counters of
+analysis results are recorded into the metrics of current detection, which are attached to the detection
+result and can be aggregated across a batch into quantiles exported as JSON or Prometheus text format.
+Stages are recorded through record_stage() and count_metric(), which do nothing when no metrics are collected.
+In profiling mode, each top level stage is profiled by cProfile into a .prof file, and all stages are written
+into a Chrome trace event timeline, which can be opened with chrome://tracing or Perfetto.
+In memory tracing mode, traced peak and retained memory of each stage and live NumPy and PIL buffers are
+recorded with stage times.
+"""
+import os
+import json
+import cProfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from colorama import Fore, Style
+from MesoDetect.DataIO.consts import METRICS_QUANTILES, METRICS_PROMETHEUS_PREFIX, PROFILE_TRACE_NAME, STAGE_WORKER_NUM
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+
+class DetectionMetrics:
+    """
+    Metrics of one detection. Stage names are joined with "/" from outer to inner stages, such as
+    "denoise/neg", and counters are named under the stage they are counted in.
+
+    Attributes:
+        stages (Dict[str, Dict[str, float]]): "wall_time", "cpu_time" in seconds and "calls" of each stage.
+        counters (Dict[str, float]): value of each counter.
+        profile_folder (Optional[Path]): folder of profiling outputs, None if profiling is disabled.
+        trace_events (List[dict]): Chrome trace events of recorded stages in profiling mode.
+        trace_memory (bool): whether memory of stages is traced, see get_memory_stats() for memory stats.
+        memory_stats (Dict[str, float]): memory stats of the whole detection in memory tracing mode.
+    """
+    def __init__(self, profile_folder: Optional[Path] = None, trace_memory: bool = False):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.profile_folder = profile_folder
+        self.trace_memory = trace_memory
+        self.memory_stats: Dict[str, float] = {}
+        self.trace_events: List[dict] = []
+        self.start_time = time.perf_counter()
+        # Stages of concurrent threads are recorded into the same metrics
+        self.lock = threading.Lock()
+
+    def add_stage(
+            self,
+            stage_name: str,
+            wall_time: float,
+            cpu_time: float,
+            wall_start: float = 0.0,
+            memory_stats: Optional[Dict[str, float]] = None
+    ):
+        with self.lock:
+            stage = self.stages.setdefault(stage_name, {"wall_time": 0.0, "cpu_time": 0.0, "calls": 0})
+            stage["wall_time"] += wall_time
+            stage["cpu_time"] += cpu_time
+            stage["calls"] += 1
+            # Stages called more than once keep the largest memory usage, and the sum of memory changes
+            for stat_name, value in (memory_stats or {}).items():
+                if stat_name in ("retained_memory", "pil_images"):
+                    stage[stat_name] = stage.get(stat_name, 0) + value
+                else:
+                    stage[stat_name] = max(stage.get(stat_name, value), value)
+            if self.profile_folder is not None:
+                # Complete event with timestamp and duration in microseconds
+                self.trace_events.append({
+                    "name": stage_name.rsplit("/", 1)[-1],
+                    "cat": stage_name,
+                    "ph": "X",
+                    "ts": (wall_start - self.start_time) * 1e6,
+                    "dur": wall_time * 1e6,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": {"cpu_time": cpu_time}
+                })
+
+    def add_counter(self, counter_name: str, value: float):
+        with self.lock:
+            self.counters[counter_name] = self.counters.get(counter_name, 0) + value
+
+    def to_dict(self) -> dict:
+        """
+        Converts metrics into plain data for detection result.
+
+        Returns:
+            dict: metrics data with "wall_time", "cpu_time", "stages" and "counters" keys.
+        """
+        with self.lock:
+            return {
+                "wall_time": self.wall_time,
+                "cpu_time": self.cpu_time,
+                **self.memory_stats,
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "counters": dict(self.counters)
+            }
+
+
+# Metrics of current detection and name of current stage, held by context so that each thread has its own stage
+_current_metrics: ContextVar[Optional[DetectionMetrics]] = ContextVar("current_metrics", default=None)
+_current_stage: ContextVar[str] = ContextVar("current_stage", default="")
+# Memory tracing state of current stage, see start_memory_stage()
+_current_memory_state: ContextVar[Optional[list]] = ContextVar("current_memory_state", default=None)
+
+# Thread pool shared by concurrent stages of detections in the process, created on first use
+_stage_executor: Optional[ThreadPoolExecutor] = None
+_stage_executor_lock = threading.Lock()
+
+
+def reset_stage_executor():
+    """Drops the stage thread pool in forked child processes, whose copied pool has no running threads."""
+    global _stage_executor, _stage_executor_lock
+    _stage_executor = None
+    _stage_executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_stage_executor)
+
+
+"""
+Public Interface: collect metrics of a detection
+"""
+@contextmanager
+def collect_metrics(profile_folder: Optional[Path] = None, trace_memory: bool = False) -> Iterator[DetectionMetrics]:
+    """
+    Collects metrics of stages recorded within the context, total wall time and CPU time of the context
+    are recorded as well.
+
+    Args:
+        profile_folder (Optional[Path]): folder for .prof files of top level stages and Chrome trace of all
+            stages, profiling is disabled if not given.
+        trace_memory (bool): whether to trace memory of stages with tracemalloc, which slows down detection.
+
+    Returns:
+        Iterator[DetectionMetrics]: metrics of the context.
+    """
+    metrics = DetectionMetrics(profile_folder, trace_memory)
+    metrics_token = _current_metrics.set(metrics)
+    stage_token = _current_stage.set("")
+    # Tracemalloc started by other tools is kept running after collection
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    memory_state = start_memory_stage() if trace_memory else None
+    memory_token = _current_memory_state.set(memory_state)
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield metrics
+    finally:
+        metrics.wall_time = time.perf_counter() - wall_start
+        metrics.cpu_time = time.thread_time() - cpu_start
+        if memory_state is not None:
+            metrics.memory_stats = end_memory_stage(memory_state, True)
+        _current_memory_state.reset(memory_token)
+        if started_tracing:
+            tracemalloc.stop()
+        _current_stage.reset(stage_token)
+        _current_metrics.reset(metrics_token)
+        if profile_folder is not None:
+            save_trace(metrics)
+
+
+"""
+Utility Function: record a stage into current metrics
+"""
+@contextmanager
+def record_stage(stage_name: str) -> Iterator[None]:
+    """
+    Records wall time and CPU time of the context as a stage of current metrics, nested stages are named
+    under the stage of outer context. CPU time is measured for the current thread.
+
+    Args:
+        stage_name (str): name of the stage.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    parent_stage = _current_stage.get()
+    full_stage_name = parent_stage + "/" + stage_name if parent_stage else stage_name
+    stage_token = _current_stage.set(full_stage_name)
+
+    # Only one profiler can be active in a thread, so only top level stages are profiled
+    profiler = None
+    if metrics.profile_folder is not None and not parent_stage:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            print(Fore.YELLOW + f"[Warning] Profiling stage `{full_stage_name}` skipped: {e}" + Style.RESET_ALL)
+            profiler = None
+
+    memory_state = start_memory_stage() if metrics.trace_memory else None
+    memory_token = _current_memory_state.set(memory_state)
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        wall_end, cpu_end = time.perf_counter(), time.thread_time()
+        if profiler is not None:
+            profiler.disable()
+            save_profile(profiler, metrics.profile_folder, full_stage_name)
+        # Live buffers are counted from a tracemalloc snapshot, which is only taken for top level stages
+        memory_stats = end_memory_stage(memory_state, not parent_stage) if memory_state is not None else None
+        _current_memory_state.reset(memory_token)
+        metrics.add_stage(full_stage_name, wall_end - wall_start, cpu_end - cpu_start, wall_start, memory_stats)
+        _current_stage.reset(stage_token)
+
+
+"""
+Utility Function: run a stage concurrently
+"""
+def submit_stage(stage_name: str, func: Callable[..., Any], *args) -> Future:
+    """
+    Runs a function as a recorded stage in the stage thread pool. The function runs in a copy of the current
+    context, so that its stage and counters are recorded under the current stage of the caller.
+    The function runs in the calling thread before returning when STAGE_WORKER_NUM is less than 2, or when
+    current metrics are profiled or memory traced, since profilers only attach to the detection thread and
+    tracemalloc peaks are shared by all threads.
+
+    Args:
+        stage_name (str): name of the stage.
+        func (Callable[..., Any]): function of the stage.
+        *args: arguments of the function.
+
+    Returns:
+        Future: future of the function result.
+    """
+    global _stage_executor
+
+    def run_stage():
+        with record_stage(stage_name):
+            return func(*args)
+
+    metrics = _current_metrics.get()
+    is_traced = metrics is not None and (metrics.profile_folder is not None or metrics.trace_memory)
+    if STAGE_WORKER_NUM < 2 or is_traced:
+        future = Future()
+        try:
+            future.set_result(run_stage())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKER_NUM, thread_name_prefix="MesoStage")
+    # Each submitted stage needs its own context copy, a context can not be entered by two threads at once
+    return _stage_executor.submit(copy_context().run, run_stage)
+
+
+"""
+Utility Function: start memory tracing of a stage
+"""
+def start_memory_stage() -> list:
+    """
+    Starts memory tracing of a stage. Tracemalloc has only one peak for the whole process, so the peak is reset
+    at the start of each stage, and the peak reached before the reset is kept by the outer stage.
+    Stages are never run concurrently in memory tracing mode, see submit_stage().
+
+    Returns:
+        list: memory state of the stage, [peak memory before inner stages, memory and PIL stats at stage start].
+    """
+    current_memory, peak_memory = tracemalloc.get_traced_memory()
+    outer_state = _current_memory_state.get()
+    if outer_state is not None:
+        outer_state[0] = max(outer_state[0], peak_memory)
+    tracemalloc.reset_peak()
+    return [current_memory, current_memory, Image.core.get_stats()]
+
+
+"""
+Utility Function: end memory tracing of a stage
+"""
+def end_memory_stage(memory_state: list, count_buffers: bool) -> Dict[str, float]:
+    """
+    Ends memory tracing of a stage and gets memory stats of the stage.
+
+    Args:
+        memory_state (list): memory state from start_memory_stage().
+        count_buffers (bool): whether to count live NumPy buffers from a tracemalloc snapshot.
+
+    Returns:
+        Dict[str, float]: memory stats with keys:
+            "peak_memory": traced peak memory above memory at stage start in bytes.
+            "retained_memory": traced memory change from stage start to stage end in bytes.
+            "pil_images": number of PIL images created in the stage.
+            "pil_blocks": number of live PIL image memory blocks at stage end.
+            "numpy_buffers", "numpy_bytes": number and bytes of live NumPy data buffers at stage end,
+                only if count_buffers is True.
+    """
+    current_memory, peak_memory = tracemalloc.get_traced_memory()
+    start_peak, start_memory, start_pil_stats = memory_state
+    pil_stats = Image.core.get_stats()
+    memory_stats = {
+        "peak_memory": max(start_peak, peak_memory) - start_memory,
+        "retained_memory": current_memory - start_memory,
+        "pil_images": pil_stats["new_count"] - start_pil_stats["new_count"],
+        "pil_blocks": pil_stats["allocated_blocks"] - pil_stats["freed_blocks"]
+    }
+    if count_buffers:
+        numpy_filter = tracemalloc.DomainFilter(inclusive=True, domain=np.lib.tracemalloc_domain)
+        numpy_traces = tracemalloc.take_snapshot().filter_traces([numpy_filter]).traces
+        memory_stats["numpy_buffers"] = len(numpy_traces)
+        memory_stats["numpy_bytes"] = sum(trace.size for trace in numpy_traces)
+    return memory_stats
+
+
+"""
+Utility Function: save profiling statistics of a stage
+"""
+def save_profile(profiler: cProfile.Profile, profile_folder: Path, stage_name: str):
+    """
+    Saves profiling statistics of a stage as "<stage name>.prof" in profile folder, which can be read by
+    pstats or viewers such as snakeviz.
+
+    Args:
+        profiler (cProfile.Profile): disabled profiler of the stage.
+        profile_folder (Path): folder of profiling outputs.
+        stage_name (str): name of the stage.
+    """
+    try:
+        profile_folder.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(profile_folder / (stage_name.replace("/", ".") + ".prof"))
+    except OSError as e:
+        print(Fore.YELLOW + f"[Warning] Saving profile of stage `{stage_name}` failed: {e}" + Style.RESET_ALL)
+
+
+"""
+Utility Function: save Chrome trace of recorded stages
+"""
+def save_trace(metrics: DetectionMetrics):
+    """
+    Saves trace events of recorded stages as a Chrome trace event JSON file in profile folder.
+
+    Args:
+        metrics (DetectionMetrics): metrics collected in profiling mode.
+    """
+    trace_path = metrics.profile_folder / PROFILE_TRACE_NAME
+    try:
+        metrics.profile_folder.mkdir(parents=True, exist_ok=True)
+        with metrics.lock:
+            trace_data = {"traceEvents": list(metrics.trace_events), "displayTimeUnit": "ms"}
+        trace_path.write_text(json.dumps(trace_data), encoding="utf-8")
+    except OSError as e:
+        print(Fore.YELLOW + f"[Warning] Saving trace {trace_path} failed: {e}" + Style.RESET_ALL)
+
+
+"""
+Utility Function: add value to a counter of current metrics
+"""
+def count_metric(counter_name: str, value: float = 1):
+    """
+    Adds value to a counter of current metrics, which is named under current stage.
+
+    Args:
+        counter_name (str): name of the counter.
+        value (float): value added to the counter.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return
+    current_stage = _current_stage.get()
+    metrics.add_counter(current_stage + "/" + counter_name if current_stage else counter_name, value)
+
+
+"""
+Public Interface: aggregate metrics of detection results
+"""
+def aggregate_metrics(metrics_list: Iterable[dict], quantiles: Iterable[float] = METRICS_QUANTILES) -> dict:
+    """
+    Aggregates metrics of multiple detections into quantiles of each stage stat and counter value.
+    Total wall time, CPU time and memory stats of detections are aggregated as stage "total".
+
+    Args:
+        metrics_list (Iterable[dict]): metrics data of detection results, see DetectionMetrics.to_dict().
+        quantiles (Iterable[float]): quantiles to compute, such as 0.5 for p50.
+
+    Returns:
+        dict: aggregated metrics with "frames", "stages" and "counters" keys. Each stage has a summary of
+            "wall_time", "cpu_time" and memory stats if traced, and each counter has a summary, with "count",
+            "sum" and a "p<quantile>" key for each quantile, such as "p50" and "p99".
+    """
+    quantiles = tuple(quantiles)
+    frame_num = 0
+    stage_values: Dict[str, Dict[str, list]] = {}
+    counter_values: Dict[str, list] = {}
+    for metrics in metrics_list:
+        if not metrics:
+            continue
+        frame_num += 1
+        stages = dict(metrics["stages"])
+        stages["total"] = {key: value for key, value in metrics.items() if key not in ("stages", "counters")}
+        for stage_name, stage in stages.items():
+            values = stage_values.setdefault(stage_name, {})
+            for stat_name, value in stage.items():
+                if stat_name != "calls":
+                    values.setdefault(stat_name, []).append(value)
+        for counter_name, value in metrics["counters"].items():
+            counter_values.setdefault(counter_name, []).append(value)
+
+    return {
+        "frames": frame_num,
+        "stages": {
+            stage_name: {stat_name: get_summary(values[stat_name], quantiles) for stat_name in values}
+            for stage_name, values in stage_values.items()
+        },
+        "counters": {counter_name: get_summary(values, quantiles) for counter_name, values in counter_values.items()}
+    }
+
+
+"""
+Utility Function: summarize values into quantiles
+"""
+def get_summary(values: list, quantiles: tuple) -> Dict[str, float]:
+    """
+    Summarizes values into count, sum and quantiles.
+
+    Args:
+        values (list): values to summarize.
+        quantiles (tuple): quantiles to compute.
+
+    Returns:
+        Dict[str, float]: summary with "count", "sum" and "p<quantile>" keys, such as "p99" for 0.99
+            and "p99_9" for 0.999.
+    """
+    summary = {"count": len(values), "sum": float(np.sum(values))}
+    quantile_values = np.quantile(np.asarray(values, dtype=np.float64), quantiles)
+    for quantile, quantile_value in zip(quantiles, quantile_values):
+        summary["p" + f"{quantile * 100:g}".replace(".", "_")] = float(quantile_value)
+    return summary
+
+
+"""
+Public Interface: export aggregated metrics as JSON
+"""
+def export_metrics_json(aggregated_metrics: dict, file_path: Optional[Union[str, Path]] = None) -> str:
+    """
+    Exports aggregated metrics as JSON text.
+
+    Args:
+        aggregated_metrics (dict): aggregated metrics from aggregate_metrics().
+        file_path (Optional[Union[str, Path]]): path of JSON file to write, only text is returned if not given.
+
+    Returns:
+        str: JSON text of aggregated metrics.
+    """
+    metrics_text = json.dumps(aggregated_metrics, indent=2)
+    if file_path is not None:
+        Path(file_path).write_text(metrics_text, encoding="utf-8")
+    return metrics_text
+
+
+# Prometheus metric name suffix and help text of each stage stat
+STAGE_STAT_FAMILIES = {
+    "wall_time": ("stage_wall_seconds", "Wall time of detection stages in seconds."),
+    "cpu_time": ("stage_cpu_seconds", "CPU time of detection stages in seconds."),
+    "peak_memory": ("stage_peak_memory_bytes", "Traced peak memory of detection stages above stage start in bytes."),
+    "retained_memory": ("stage_retained_memory_bytes", "Traced memory retained by detection stages in bytes."),
+    "pil_images": ("stage_pil_images", "Number of PIL images created in detection stages."),
+    "pil_blocks": ("stage_pil_blocks", "Number of live PIL image memory blocks at end of detection stages."),
+    "numpy_buffers": ("stage_numpy_buffers", "Number of live NumPy data buffers at end of detection stages."),
+    "numpy_bytes": ("stage_numpy_bytes", "Bytes of live NumPy data buffers at end of detection stages.")
+}
+
+
+"""
+Public Interface: export aggregated metrics in Prometheus text format
+"""
+def export_metrics_prometheus(
+        aggregated_metrics: dict,
+        file_path: Optional[Union[str, Path]] = None,
+        prefix: str = METRICS_PROMETHEUS_PREFIX
+) -> str:
+    """
+    Exports aggregated metrics in Prometheus text exposition format. Stage stats are exported as summaries
+    with a "stage" label, such as "<prefix>_stage_wall_seconds", see STAGE_STAT_FAMILIES, and counters as
+    summary "<prefix>_counter" with a "counter" label.
+
+    Args:
+        aggregated_metrics (dict): aggregated metrics from aggregate_metrics().
+        file_path (Optional[Union[str, Path]]): path of text file to write, only text is returned if not given.
+        prefix (str): metric name prefix.
+
+    Returns:
+        str: Prometheus text of aggregated metrics.
+    """
+    lines = [
+        f"# HELP {prefix}_frames Number of detected radar images.",
+        f"# TYPE {prefix}_frames gauge",
+        f"{prefix}_frames {aggregated_metrics['frames']}"
+    ]
+    summary_families = []
+    for stat_name, (metric_name, metric_help) in STAGE_STAT_FAMILIES.items():
+        summaries = {name: stage[stat_name] for name, stage in aggregated_metrics["stages"].items()
+                     if stat_name in stage}
+        if summaries:
+            summary_families.append((f"{prefix}_{metric_name}", metric_help, "stage", summaries))
+    summary_families.append((f"{prefix}_counter", "Counter values of detection stages per radar image.", "counter",
+                             aggregated_metrics["counters"]))
+    for metric_name, metric_help, label_name, summaries in summary_families:
+        lines.append(f"# HELP {metric_name} {metric_help}")
+        lines.append(f"# TYPE {metric_name} summary")
+        for name, summary in sorted(summaries.items()):
+            label = f'{label_name}="{name}"'
+            for key, value in summary.items():
+                if key.startswith("p"):
+                    quantile = float(key[1:].replace("_", ".")) / 100
+                    lines.append(f'{metric_name}{{{label},quantile="{quantile:g}"}} {value:g}')
+            lines.append(f"{metric_name}_sum{{{label}}} {summary['sum']:g}")
+            lines.append(f"{metric_name}_count{{{label}}} {summary['count']}")
+
+    metrics_text = "\n".join(lines) + "\n"
+    if file_path is not None:
+        Path(file_path).write_text(metrics_text, encoding="utf-8")
+    return metrics_text
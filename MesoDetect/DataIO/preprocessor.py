@@ -1,18 +1,24 @@
 """
 This file implements the logic of preprocess orignal radar image,
-including turning into grayscale image and executing narrow filling.
+including turning into radar frame and executing narrow filling.
 """
 from PIL import Image, ImageDraw
 import time
-from tqdm import tqdm
-import random
+import numpy as np
 from colorama import Fore, Style
-from MesoDetect.DataIO.consts import (NEED_COVER_BOUNDARY_STATIONS, BASEMAP_IMG_PATH,
-                                      GRAY_SCALE_UNIT, NARROW_SURROUNDING_OFFSETS, CURRENT_DEBUG_RESULT_FOLDER)
-from MesoDetect.DataIO import utils
-from MesoDetect.DataIO.utils import check_output_folder
+from MesoDetect.DataIO.consts import (NEED_COVER_BOUNDARY_STATIONS, GRAY_SCALE_UNIT,
+                                      NARROW_SURROUNDING_OFFSETS, CURRENT_DEBUG_RESULT_FOLDER,
+                                      COLOR_MATCH_TOLERANCE, DECODER_ENGINES, DEFAULT_DECODER_ENGINE,
+                                      NARROW_FILL_TIE_BREAKS, NARROW_FILL_TIE_BREAK, NARROW_FILL_SEED)
+from MesoDetect.DataIO.debug_sink import DebugSink, NULL_DEBUG_SINK, get_debug_sink
+from MesoDetect.DataIO.metrics import record_stage, count_metric
+from MesoDetect.DataIO.radar_config import RadarConfig
+from MesoDetect.DataIO.data_config import get_station_config
+from MesoDetect.DataIO.decoder import decode_layer_plane, layer_plane_to_color_img
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.basemap import cover_station_boundary, get_boundary_mask, get_overlay_candidates
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List, Tuple
 
 
 """
@@ -22,58 +28,78 @@ def radar_image_preprocess(
         img_path: Path,
         station_num: str,
         output_path: Path,
-        enable_debug: bool = False
-) -> Optional[Image]:
+        enable_debug: bool = False,
+        decoder: str = DEFAULT_DECODER_ENGINE,
+        radar_config: Optional[RadarConfig] = None,
+        debug_sink: Optional[DebugSink] = None
+) -> Optional[RadarFrame]:
     """
-    Generates a gray scale image as internal representation of input radar image
-    and executes narrow for the gray scale image.
+    Generates a radar frame as internal representation of input radar image
+    and executes narrow for the radar frame.
     Args:
         img_path: path of input original radar image.
         station_num: station number in string type.
         enable_debug: boolean flat that indicates whether debug mode is enabled.
         output_path: folder path for output images
+        decoder: radar image decoding engine, one of DECODER_ENGINES.
+        radar_config: radar config of the input radar image, station profile for the image size if not given.
+        debug_sink: debug sink of the radar image, debug images are saved under output path if not given.
 
     Returns:
-        Gray scale image in PIL.Image format if successful.
+        Radar frame of the input radar image if successful.
         None otherwise.
     """
     print("[Info] Start preprocessing radar image...")
     # Generate debug folder for current module process if enable debug mode
-    debug_output_path = output_path
-    if enable_debug:
-        debug_output_path = check_output_folder(output_path, CURRENT_DEBUG_RESULT_FOLDER)
+    debug_sink = get_debug_sink(enable_debug, output_path, CURRENT_DEBUG_RESULT_FOLDER, debug_sink)
+    if debug_sink is None:
+        print(Fore.RED + "[Error] Output folder check failed." + Style.RESET_ALL)
+        return None
     # Read radar data
     try:
-        read_result_img = read_radar_image(img_path, station_num, debug_output_path, enable_debug)
+        if radar_config is None:
+            with Image.open(img_path) as radar_img:
+                radar_config = get_station_config(station_num, radar_img.size)
+        with record_stage("read"):
+            read_result_frame = read_radar_image(img_path, station_num, debug_sink, decoder, radar_config)
     except Exception as e:
         print(Fore.RED + f"[Error] Exception: {e} raised when reading radar image." + Style.RESET_ALL)
         return None
 
-    # Fill radar data
+    # Fill radar data, only evaluate overlay candidates when the station has learned overlay pixels
     try:
-        filled_img = narrow_fill(read_result_img, debug_output_path, enable_debug)
+        with record_stage("narrow_fill"):
+            candidate_pixels = get_overlay_candidates(station_num, read_result_frame.size)
+            filled_frame = narrow_fill(read_result_frame, radar_config, debug_sink, candidate_pixels=candidate_pixels)
     except Exception as e:
         print(Fore.RED + f"[Error] Exception: {e} raised when executing narrow filling." + Style.RESET_ALL)
         return None
 
     print("[Info] Radar image preprocessing complete.")
-    return filled_img
+    return filled_frame
 
 
 """
-Logic implementation Function: read original radar image and convert to gray scale image
+Logic implementation Function: read original radar image and convert to radar frame
 """
-def read_radar_image(radar_img_path: Path, station_num: str, image_debug_folder_path: Path, enable_debug: bool = False) -> Image:
+def read_radar_image(
+        radar_img_path: Path,
+        station_num: str,
+        debug_sink: DebugSink = NULL_DEBUG_SINK,
+        decoder: str = DEFAULT_DECODER_ENGINE,
+        radar_config: Optional[RadarConfig] = None
+) -> RadarFrame:
     """
-    Generates a gray image from the original radar image so that later process can basemaps on this gray image
+    Generates a radar frame from the original radar image so that later process can basemaps on this frame
     Args:
         radar_img_path: original radar image path
         station_num: radar station number for boundary replacement check
-        image_debug_folder_path: debug output folder path
-        enable_debug: flag of whether to enable debug mode or not
+        debug_sink: debug sink for debug images of the process
+        decoder: decoding engine, "numpy" for lookup table decoding and "pixel" for per-pixel color matching
+        radar_config: radar config of the radar image, station profile for the image size if not given
 
     Returns:
-        path of gray scale image if execution success.
+        radar frame of the original radar image.
     """
     start = time.time()
     print("[Info] Start processing radar data...")
@@ -82,30 +108,69 @@ def read_radar_image(radar_img_path: Path, station_num: str, image_debug_folder_
     radar_img = Image.open(radar_img_path)
 
     # Check whether current radar image need boundary coverage
+    cover_mask = None
     if station_num in NEED_COVER_BOUNDARY_STATIONS:
-        coverage_draw = ImageDraw.Draw(radar_img)
-        base_img = Image.open(BASEMAP_IMG_PATH + "white_boundary_" + station_num + ".png")
-
-        # Iterate the whole zone of radar image that might covered by the white boundary
-        for x in range(0, base_img.size[1]):
-            for y in range(0, base_img.size[1]):
-                base_pixel_value = base_img.getpixel((x, y))
-                if base_pixel_value[0] > 245:
-                    coverage_draw.point((x, y), (0, 0, 0))
+        if decoder == "numpy":
+            # Boundary is covered while decoding so that palette mode image keeps its palette indexes
+            cover_mask = get_boundary_mask(station_num)
+        else:
+            radar_img = cover_station_boundary(radar_img, station_num)
 
         # Debug process
-        if enable_debug:
-            radar_img.save(image_debug_folder_path / "boundary_coverage.png")
+        if debug_sink.enabled:
+            coverage_img = radar_img if cover_mask is None else cover_station_boundary(radar_img, station_num)
+            debug_sink.save_image("boundary_coverage", coverage_img)
+
+    # Decode radar zone echo data
+    if radar_config is None:
+        radar_config = get_station_config(station_num, radar_img.size)
+    radar_zone = radar_config.radar_zone
+    cv_pairs = radar_config.color_velocity_pairs
+    if decoder == "numpy":
+        layer_plane = decode_layer_plane(radar_img, radar_zone, cv_pairs, cover_mask)
+        radar_frame = RadarFrame.from_layer_plane(layer_plane)
+        read_debug_img = layer_plane_to_color_img(layer_plane, radar_config.palette) if debug_sink.enabled else None
+    elif decoder == "pixel":
+        gray_img, read_debug_img = decode_radar_pixels(radar_img, radar_zone, cv_pairs)
+        radar_frame = RadarFrame.from_image(gray_img)
+    else:
+        raise ValueError(f"Invalid decoder engine `{decoder}`, expected one of {DECODER_ENGINES}.")
+    count_metric("pixels_decoded", (radar_zone[1] - radar_zone[0]) ** 2)
 
-    # Result images
+    debug_sink.save_frame("original_gray", radar_frame)
+    if read_debug_img is not None:
+        debug_sink.save_image("read_debug", read_debug_img)
+
+    end = time.time()
+    duration = end - start
+    print(f'[Info] Duration of radar reading: {duration:.4f} seconds')
+    return radar_frame
+
+
+"""
+Logic Implementation Function: decode radar zone pixel by pixel
+"""
+def decode_radar_pixels(
+        radar_img: Image,
+        radar_zone: List[int],
+        cv_pairs: List[Tuple[Tuple[int, int, int], float]]
+) -> Tuple[Image, Image]:
+    """
+    Decodes radar zone of the radar image by matching each pixel with every color bar color.
+    Args:
+        radar_img: original radar image
+        radar_zone: radar zone range [min, max] shared by both axes
+        cv_pairs: color velocity pairs of the color bar
+
+    Returns:
+        gray scale image and read debug image
+    """
     gray_img = Image.new("RGB", radar_img.size, (0, 0, 0))
     gray_draw = ImageDraw.Draw(gray_img)
     read_debug_img = Image.new("RGB", radar_img.size, (0, 0, 0))
     read_debug_draw = ImageDraw.Draw(read_debug_img)
 
     # Iterate the radar zone to read echo data
-    radar_zone = utils.get_radar_info("radar_zone")
-    cv_pairs = utils.get_color_bar_info("color_velocity_pairs")
     for x in range(radar_zone[0], radar_zone[1]):
         for y in range(radar_zone[0], radar_zone[1]):
             # Get current pixel value
@@ -113,157 +178,186 @@ def read_radar_image(radar_img_path: Path, station_num: str, image_debug_folder_
 
             # Match echo color
             for idx in range(len(cv_pairs)):
-                if all(abs(c1 - c2) <= 10 for c1, c2 in zip(pixel_value[:3], cv_pairs[idx][0][:3])):
+                if all(abs(c1 - c2) <= COLOR_MATCH_TOLERANCE for c1, c2 in zip(pixel_value[:3], cv_pairs[idx][0][:3])):
                     gray_value = (idx + 1) * GRAY_SCALE_UNIT
                     gray_draw.point((x, y), (gray_value, gray_value, gray_value))
                     read_debug_draw.point((x, y), cv_pairs[idx][0])
-
-    if enable_debug:
-        gray_img.save(image_debug_folder_path / "original_gray.png")
-        read_debug_img.save(image_debug_folder_path / "read_debug.png")
-
-    end = time.time()
-    duration = end - start
-    print(f'[Info] Duration of radar reading: {duration:.4f} seconds')
-    return gray_img
+                    break
+    return gray_img, read_debug_img
 
 
 """
 Logic Implementation Function: narrow filling process 
-for original gray scale image after reading from original radar image
+for original radar frame after reading from original radar image
 """
-def narrow_fill(gray_img: Image, image_debug_folder_path: Path, enable_debug: bool = False) -> Image:
+def narrow_fill(
+        radar_frame: RadarFrame,
+        radar_config: RadarConfig,
+        debug_sink: DebugSink = NULL_DEBUG_SINK,
+        tie_break: str = NARROW_FILL_TIE_BREAK,
+        seed: int = NARROW_FILL_SEED,
+        candidate_pixels: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> RadarFrame:
     """
-    Executes narrow filling process for gray scale radar image, filling small gaps caused by original radar image
+    Executes narrow filling process for radar frame, filling small gaps caused by original radar image
     region boundaries and region name marks.
     Args:
-        gray_img: gray scale image
-        image_debug_folder_path: debug output folder path
-        enable_debug: flag of whether to enable debug mode or not
+        radar_frame: radar frame read from original radar image
+        radar_config: radar config of the radar frame
+        debug_sink: debug sink for debug images of the process
+        tie_break: policy for choosing between surrounding indexes with equal distance to velocity 0,
+            one of NARROW_FILL_TIE_BREAKS
+        seed: random seed used by the "random" tie break policy
+        candidate_pixels: optional (ys, xs) coordinate arrays of pixels to evaluate, such as station overlay
+            candidates, the whole radar zone is evaluated when not given
 
     Returns:
-        filled gray scale image
+        filled radar frame
     """
     start = time.time()
     print("[Info] Start filling radar image...")
 
-    # Create result path
-    filled_img = gray_img.copy()
-    filled_draw = ImageDraw.Draw(filled_img)
+    # Get const values
+    radar_zone = radar_config.radar_zone
+    align_const = (1 + radar_config.layer_num) * 1.0 / 2
 
-    simple_fill_img = Image.new("RGB", filled_img.size, (0, 0, 0))
-    complex_fill_img = Image.new("RGB", filled_img.size, (0, 0, 0))
-    only_filled_img = Image.new("RGB", filled_img.size, (0, 0, 0))
+    index_plane = radar_frame.layers.astype(np.int16)
 
-    simple_fill_draw = ImageDraw.Draw(simple_fill_img)
-    complex_fill_draw = ImageDraw.Draw(complex_fill_img)
-    only_fill_draw = ImageDraw.Draw(only_filled_img)
+    # Fill radar zone
+    filled_plane, simple_mask, complex_mask = fill_narrow_gaps(index_plane, radar_zone, align_const, tie_break, seed,
+                                                           candidate_pixels)
 
-    # Get const values
-    radar_zone = utils.get_radar_info("radar_zone")
-    align_const = (1 + len(utils.get_color_bar_info("color_velocity_pairs"))) * 1.0 / 2
-    gray_value_interval = GRAY_SCALE_UNIT
-
-    # Iterate radar zone
-    total_iterations = (radar_zone[1] - radar_zone[0]) ** 2
-    with tqdm(total=total_iterations, desc="  Narrow Filling Progress", unit="pixels") as pbar:
-        for x in range(radar_zone[0], radar_zone[1]):
-            for y in range(radar_zone[0], radar_zone[1]):
-                # Get current pixel value
-                pixel_value = gray_img.getpixel((x, y))
-                # Calculate cv index according to the gray value
-                index = round(pixel_value[0] * 1.0 / gray_value_interval) - 1
-                # Filter out no blank pixel
-                if not index == -1:
-                    pbar.update(1)
-                    continue
-                # Get surrounding pixel color value info
-                surrounding_indexes = []
-                for offset in NARROW_SURROUNDING_OFFSETS:
-                    neighbour_value = gray_img.getpixel((x + offset[0], y + offset[1]))
-                    surrounding_index = round(neighbour_value[0] * 1.0 / gray_value_interval) - 1
-                    surrounding_indexes.append(surrounding_index)
-                # Check whether the current pixel neighbours satisfy narrow fill condition
-                if (not (surrounding_indexes[0] > -1 and surrounding_indexes[1] > -1
-                         or surrounding_indexes[2] > -1 and surrounding_indexes[3] > -1)):
-                    pbar.update(1)
-                    continue
-                # Execute Direct filling if only one side with same echo color
-                if (surrounding_indexes[0] == surrounding_indexes[1] and surrounding_indexes[0] > -1
-                        and surrounding_indexes[2] == surrounding_indexes[3] and surrounding_indexes[2] < 0):
-                    gray_value = (surrounding_indexes[0] + 1) * gray_value_interval
-                    filled_draw.point((x, y), (gray_value, gray_value, gray_value))
-                    simple_fill_draw.point((x, y), (gray_value, gray_value, gray_value))
-                    only_fill_draw.point((x, y), (gray_value, gray_value, gray_value))
-                    pbar.update(1)
-                    continue
-                if (surrounding_indexes[2] == surrounding_indexes[3] and surrounding_indexes[2] > -1
-                        and surrounding_indexes[0] == surrounding_indexes[1] and surrounding_indexes[0] < 0):
-                    gray_value = (surrounding_indexes[2] + 1) * gray_value_interval
-                    filled_draw.point((x, y), (gray_value, gray_value, gray_value))
-                    simple_fill_draw.point((x, y), (gray_value, gray_value, gray_value))
-                    only_fill_draw.point((x, y), (gray_value, gray_value, gray_value))
-                    pbar.update(1)
-                    continue
-                # Get valid indexes
-                valid_indexes = []
-                for index in surrounding_indexes:
-                    if index > -1:
-                        valid_indexes.append(index)
-                if max(valid_indexes) - min(valid_indexes) <= 1:
-                    # Indicate that color value indexes are next to each other
-                    # Use first average then round to get fill color value index
-                    average_index = round((sum(valid_indexes) * 1.0) / len(valid_indexes))
-                    # Calculate gray value basemap on the index value
-                    gray_value = (average_index + 1) * gray_value_interval
-                    # Compose gray RGB color
-                    gray_color = (gray_value, gray_value, gray_value)
-                    # Fill blank pixel
-                    filled_draw.point((x, y), gray_color)
-                    # Draw debug image
-                    simple_fill_draw.point((x, y), gray_color)
-                    only_fill_draw.point((x, y), gray_color)
-                else:
-                    # choose a value index that closer to velocity 0 to fill
-                    # if there are more than two index have equal distance to velocity 0
-                    # then use ramdom choose strategy
-                    # First get aligned indexes as well as their distances to velocity 0
-                    aligned_indexes = []
-                    aligned_index_distances = []
-                    for valid_index in valid_indexes:
-                        aligned_index = valid_index + 1 - align_const
-                        aligned_indexes.append(aligned_index)
-                        aligned_index_distances.append(abs(aligned_index))
-                    # Get the minimum distance to velocity 0
-                    minimum_distance = min(aligned_index_distances)
-                    # Iterate aligned indexes and record minimum distance to velocity 0 element
-                    minimum_aligned_indexes = []
-                    for aligned_element_idx in range(len(aligned_indexes)):
-                        if aligned_index_distances[aligned_element_idx] == minimum_distance:
-                            minimum_aligned_indexes.append(aligned_indexes[aligned_element_idx])
-                    # randomly choose minimum aligned index
-                    random_align_index = random.choice(minimum_aligned_indexes)
-                    # Restore gray index value from aligned index value
-                    final_value_index = round(random_align_index + align_const - 1)
-                    # Calculate gray value basemap on the gray index value
-                    gray_value = (final_value_index + 1) * gray_value_interval
-                    # Compose RGB color
-                    gray_color = (gray_value, gray_value, gray_value)
-                    # Fill blank pixel on fill result image
-                    filled_draw.point((x, y), gray_color)
-                    # Draw debug image
-                    complex_fill_draw.point((x, y), gray_color)
-                    only_fill_draw.point((x, y), gray_color)
-                # Update bar process
-                pbar.update(1)
-
-
-    if enable_debug:
-        simple_fill_img.save(image_debug_folder_path / "simple_filled.png")
-        complex_fill_img.save(image_debug_folder_path / "complex_filled.png")
-        only_filled_img.save(image_debug_folder_path / "only_filled.png")
-        filled_img.save(image_debug_folder_path / "filled.png")
+    filled_frame = RadarFrame(filled_plane.astype(np.int8))
+
+    if debug_sink.enabled:
+        fill_mask = simple_mask | complex_mask
+        for mask, debug_img_name in [(simple_mask, "simple_filled"), (complex_mask, "complex_filled"),
+                                     (fill_mask, "only_filled")]:
+            debug_frame = RadarFrame(np.where(mask, filled_frame.layers, -1).astype(np.int8))
+            debug_sink.save_frame(debug_img_name, debug_frame)
+        debug_sink.save_frame("filled", filled_frame)
     end = time.time()
     duration = end - start
     print(f"[Info] Duration of radar filling: {duration:.4f} seconds")
-    return filled_img
+    return filled_frame
+
+
+def fill_narrow_gaps(
+        index_plane: np.ndarray,
+        radar_zone: List[int],
+        align_const: float,
+        tie_break: str = NARROW_FILL_TIE_BREAK,
+        seed: int = NARROW_FILL_SEED,
+        candidate_pixels: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fills blank pixels of radar zone whose up and down or left and right neighbours are both valid echoes.
+    Every blank pixel is decided by the neighbours in the given plane, so filled pixels do not affect each other.
+    Args:
+        index_plane: cv index plane indexed by [y, x], -1 for blank pixels
+        radar_zone: radar zone range [min, max] shared by both axes
+        align_const: index value of velocity 0 in the aligned index scale
+        tie_break: policy for choosing between surrounding indexes with equal distance to velocity 0
+        seed: random seed used by the "random" tie break policy
+        candidate_pixels: optional (ys, xs) coordinate arrays that restrict the pixels to evaluate,
+            the whole radar zone is evaluated when not given
+
+    Returns:
+        filled cv index plane, mask of simple filled pixels and mask of complex filled pixels
+    """
+    if tie_break not in NARROW_FILL_TIE_BREAKS:
+        raise ValueError(f"Invalid tie break policy `{tie_break}`, expected one of {NARROW_FILL_TIE_BREAKS}.")
+    zone_min, zone_max = radar_zone
+    # Pad the plane with blank pixels so that neighbours of radar zone border are always readable
+    padded_plane = np.pad(index_plane, 1, constant_values=-1)
+
+    # Get evaluated pixels and their surroundings in NARROW_SURROUNDING_OFFSETS order
+    if candidate_pixels is None:
+        target = (slice(zone_min, zone_max), slice(zone_min, zone_max))
+        center = index_plane[target]
+        surroundings = np.stack([padded_plane[zone_min + 1 + dy:zone_max + 1 + dy, zone_min + 1 + dx:zone_max + 1 + dx]
+                                 for dx, dy in NARROW_SURROUNDING_OFFSETS])
+    else:
+        ys, xs = candidate_pixels
+        in_zone = (zone_min <= ys) & (ys < zone_max) & (zone_min <= xs) & (xs < zone_max)
+        target = (ys[in_zone], xs[in_zone])
+        center = index_plane[target]
+        surroundings = np.stack([padded_plane[target[0] + 1 + dy, target[1] + 1 + dx]
+                                 for dx, dy in NARROW_SURROUNDING_OFFSETS])
+
+    fill_values, simple_fill, complex_fill = decide_narrow_fill(center, surroundings, align_const, tie_break, seed)
+
+    # Restore full size results
+    filled_plane = index_plane.copy()
+    filled_plane[target] = fill_values
+    simple_mask = np.zeros(index_plane.shape, dtype=bool)
+    simple_mask[target] = simple_fill
+    complex_mask = np.zeros(index_plane.shape, dtype=bool)
+    complex_mask[target] = complex_fill
+    return filled_plane, simple_mask, complex_mask
+
+
+def decide_narrow_fill(
+        center: np.ndarray,
+        surroundings: np.ndarray,
+        align_const: float,
+        tie_break: str,
+        seed: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Applies narrow filling rules element-wise on evaluated pixels.
+    Args:
+        center: cv indexes of evaluated pixels, -1 for blank pixels
+        surroundings: cv indexes of the four narrow surrounding pixels stacked on the first axis
+        align_const: index value of velocity 0 in the aligned index scale
+        tie_break: policy for choosing between surrounding indexes with equal distance to velocity 0
+        seed: random seed used by the "random" tie break policy
+
+    Returns:
+        filled cv indexes, mask of simple filled pixels and mask of complex filled pixels
+    """
+    valid = surroundings > -1
+
+    # Check whether the current pixel neighbours satisfy narrow fill condition
+    need_fill = (center == -1) & (valid[0] & valid[1] | valid[2] & valid[3])
+
+    # Execute direct filling if only one side with same echo color
+    vertical_fill = (need_fill & (surroundings[0] == surroundings[1]) & valid[0]
+                     & (surroundings[2] == surroundings[3]) & ~valid[2])
+    horizontal_fill = (need_fill & (surroundings[2] == surroundings[3]) & valid[2]
+                       & (surroundings[0] == surroundings[1]) & ~valid[0])
+    rest_fill = need_fill & ~vertical_fill & ~horizontal_fill
+
+    # Statistics of valid surrounding indexes
+    valid_num = valid.sum(axis=0)
+    valid_sum = np.where(valid, surroundings, 0).sum(axis=0)
+    valid_max = np.where(valid, surroundings, np.iinfo(np.int16).min).max(axis=0)
+    valid_min = np.where(valid, surroundings, np.iinfo(np.int16).max).min(axis=0)
+
+    # Use average index when color value indexes are next to each other
+    average_fill = rest_fill & (valid_max - valid_min <= 1)
+    # Otherwise choose a value index that closer to velocity 0
+    closest_fill = rest_fill & ~average_fill
+
+    fill_values = center.copy()
+    fill_values[vertical_fill] = surroundings[0][vertical_fill]
+    fill_values[horizontal_fill] = surroundings[2][horizontal_fill]
+    fill_values[average_fill] = np.rint(valid_sum[average_fill] / valid_num[average_fill])
+
+    if np.any(closest_fill):
+        candidates = surroundings[:, closest_fill]
+        candidate_valid = valid[:, closest_fill]
+        distances = np.where(candidate_valid, np.abs(candidates + 1 - align_const), np.inf)
+        is_closest = distances == distances.min(axis=0)
+        if tie_break == "neg":
+            chosen = np.where(is_closest, candidates, np.iinfo(np.int16).max).min(axis=0)
+        elif tie_break == "pos":
+            chosen = np.where(is_closest, candidates, np.iinfo(np.int16).min).max(axis=0)
+        else:
+            # Choose one of the closest surroundings with a seeded generator
+            scores = np.random.default_rng(seed).random(candidates.shape)
+            chosen_offset = np.where(is_closest, scores, -1).argmax(axis=0)
+            chosen = np.take_along_axis(candidates, chosen_offset[np.newaxis], axis=0)[0]
+        fill_values[closest_fill] = chosen
+
+    return fill_values, vertical_fill | horizontal_fill | average_fill, closest_fill
@@ -0,0 +1,109 @@
+"""
+This file provides RadarConfig, the immutable in-process form of the radar image configuration data.
+A config is loaded once from the config file and memoized by file path and modification time,
+then passed explicitly through the detection pipeline instead of reading the config file in each stage.
+"""
+import os
+import numpy as np
+import yaml
+from dataclasses import dataclass, field
+from functools import lru_cache
+from MesoDetect.DataIO.consts import CONFIG_FILE, RADAR_CONFIG_CACHE_SIZE
+from pathlib import Path
+from typing import Tuple, Union
+
+
+@dataclass(frozen=True)
+class RadarConfig:
+    """
+    Immutable radar image configuration data with precomputed derived values.
+
+    Attributes:
+        image_size (Tuple[int, int]): size of radar image (width, height).
+        radar_center (Tuple[int, int]): radar center coordinate (x, y).
+        radar_zone (Tuple[int, int]): radar zone range [min, max) shared by both axes.
+        color_velocity_pairs (Tuple[Tuple[Tuple[int, int, int], float], ...]): color bar colors and velocities.
+        velocities (np.ndarray): read-only float array of velocity of each layer index.
+        palette (np.ndarray): read-only uint8 array with shape (256, 3) of color of each layer index,
+            black for indexes without color, such as NO_ECHO_INDEX.
+    """
+    image_size: Tuple[int, int]
+    radar_center: Tuple[int, int]
+    radar_zone: Tuple[int, int]
+    color_velocity_pairs: Tuple[Tuple[Tuple[int, int, int], float], ...]
+    velocities: np.ndarray = field(init=False, repr=False, compare=False)
+    palette: np.ndarray = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        velocities = np.array([cv[1] for cv in self.color_velocity_pairs], dtype=np.float64)
+        velocities.flags.writeable = False
+        palette = np.zeros((256, 3), dtype=np.uint8)
+        palette[:len(self.color_velocity_pairs)] = [cv[0][:3] for cv in self.color_velocity_pairs]
+        palette.flags.writeable = False
+        # Frozen dataclass only allows setting derived fields through object.__setattr__
+        object.__setattr__(self, "velocities", velocities)
+        object.__setattr__(self, "palette", palette)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RadarConfig":
+        """
+        Creates a config from radar config data loaded from the config file.
+
+        Args:
+            data (dict): config data with "image_size", "radar_center", "radar_zone"
+                and "color_velocity_pairs" keys.
+        """
+        cv_pairs = tuple(((cv[0][0], cv[0][1], cv[0][2]), cv[1]) for cv in data["color_velocity_pairs"])
+        return cls(
+            image_size=(data["image_size"][0], data["image_size"][1]),
+            radar_center=(data["radar_center"][0], data["radar_center"][1]),
+            radar_zone=(data["radar_zone"][0], data["radar_zone"][1]),
+            color_velocity_pairs=cv_pairs,
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Converts the config into radar config data with the same structure as the config file.
+        """
+        return {
+            "image_size": list(self.image_size),
+            "radar_center": list(self.radar_center),
+            "radar_zone": list(self.radar_zone),
+            "color_velocity_pairs": [[list(cv[0]), cv[1]] for cv in self.color_velocity_pairs],
+        }
+
+    @property
+    def zone(self) -> Tuple[slice, slice]:
+        """Index of radar zone for arrays indexed by [y, x]."""
+        return slice(self.radar_zone[0], self.radar_zone[1]), slice(self.radar_zone[0], self.radar_zone[1])
+
+    @property
+    def layer_num(self) -> int:
+        """Number of velocity layers, equal to the number of color velocity pairs."""
+        return len(self.color_velocity_pairs)
+
+
+"""
+Utility Function: load radar config from config file
+"""
+def load_radar_config(yaml_path: Union[str, Path] = CONFIG_FILE) -> RadarConfig:
+    """
+    Loads the radar config from the config file. The config is parsed only when the file is loaded
+    for the first time or has been modified since last loading.
+
+    Args:
+        yaml_path (Union[str, Path]): path of the radar config file.
+
+    Returns:
+        RadarConfig: the immutable radar config.
+    """
+    resolved_path = os.path.abspath(yaml_path)
+    return _parse_radar_config(resolved_path, os.stat(resolved_path).st_mtime_ns)
+
+
+@lru_cache(maxsize=RADAR_CONFIG_CACHE_SIZE)
+def _parse_radar_config(yaml_path: str, mtime_ns: int) -> RadarConfig:
+    # Modification time is part of the cache key so that modified config file is parsed again
+    with open(yaml_path, "r") as file:
+        data = yaml.safe_load(file)
+    return RadarConfig.from_dict(data)
@@ -0,0 +1,125 @@
+"""
+This file defines RadarFrame, the internal array representation of radar images shared by all analysis stages.
+A frame holds an int8 layer index plane (-1 for no echo) and a uint8 bit flag plane, both indexed by [y, x],
+so that stages read echo data directly instead of decoding gray values of PIL images pixel by pixel.
+"""
+import numpy as np
+from PIL import Image
+from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT, FLAG_BASE_ECHO, FLAG_BASE_FILLED, FLAG_BASE_MASK
+from typing import Optional, Tuple
+
+
+class RadarFrame:
+    """
+    Radar frame with a layer index plane and a flag plane.
+
+    Attributes:
+        layers (np.ndarray): int8 array indexed by [y, x], color velocity pair index of each pixel, -1 for no echo.
+        flags (np.ndarray): uint8 array indexed by [y, x], combination of FLAG_BASE_ECHO, FLAG_BASE_FILLED
+            and FLAG_UNFOLDED bits, 0 for normal echoes and no echo pixels.
+        layer_model (Optional[LayerModel]): cached layer model of the layer plane, kept by copies of the frame
+            and updated with changed pixels when the layer model of the frame is requested again.
+    """
+    __slots__ = ("layers", "flags", "layer_model")
+
+    def __init__(self, layers: np.ndarray, flags: Optional[np.ndarray] = None):
+        self.layers = layers
+        self.flags = np.zeros(layers.shape, dtype=np.uint8) if flags is None else flags
+        self.layer_model = None
+
+    @classmethod
+    def empty(cls, size: Tuple[int, int]) -> "RadarFrame":
+        """
+        Creates a frame without any echo.
+
+        Args:
+            size (Tuple[int, int]): frame size (width, height).
+        """
+        return cls(np.full((size[1], size[0]), -1, dtype=np.int8))
+
+    @classmethod
+    def from_layer_plane(cls, layer_plane: np.ndarray) -> "RadarFrame":
+        """
+        Creates a frame from a decoded uint8 layer index plane without copying it,
+        NO_ECHO_INDEX is viewed as -1 in the int8 layer plane.
+
+        Args:
+            layer_plane (np.ndarray): uint8 layer index plane from the decoding engine.
+        """
+        # NO_ECHO_INDEX (255) and -1 share the same byte
+        return cls(layer_plane.view(np.int8))
+
+    @classmethod
+    def from_image(cls, gray_img: Image) -> "RadarFrame":
+        """
+        Creates a frame from an internal gray scale RGB image.
+
+        Args:
+            gray_img (Image): gray scale image, with (v, v, v) for echoes, (v, 0, v) for base echoes
+                and (v, 0, 0) for base filled echoes.
+        """
+        gray_arr = np.asarray(gray_img.convert("RGB"))
+        channel_indexes = np.rint(gray_arr / GRAY_SCALE_UNIT).astype(np.int16) - 1
+        layers = channel_indexes[..., 0].astype(np.int8)
+        flags = np.zeros(layers.shape, dtype=np.uint8)
+        is_base = (layers >= 0) & (channel_indexes[..., 1] != channel_indexes[..., 0])
+        flags[is_base & (channel_indexes[..., 2] == -1)] = FLAG_BASE_FILLED
+        flags[is_base & (channel_indexes[..., 2] != -1)] = FLAG_BASE_ECHO
+        return cls(layers, flags)
+
+    def to_image(self) -> Image:
+        """
+        Renders the frame into the internal gray scale RGB image.
+
+        Returns:
+            Image: gray scale image, with (v, v, v) for echoes, (v, 0, v) for base echoes
+            and (v, 0, 0) for base filled echoes.
+        """
+        gray_value = np.where(self.layers >= 0, (self.layers.astype(np.int16) + 1) * GRAY_SCALE_UNIT, 0)
+        gray_value = gray_value.astype(np.uint8)
+        second_channel = np.where(self.flags & FLAG_BASE_MASK, 0, gray_value).astype(np.uint8)
+        third_channel = np.where(self.flags & FLAG_BASE_FILLED, 0, gray_value).astype(np.uint8)
+        return Image.fromarray(np.dstack((gray_value, second_channel, third_channel)))
+
+    def to_layer_image(self) -> Image:
+        """
+        Wraps the layer index plane into an "L" mode image sharing the frame memory, -1 is shown as 255.
+        """
+        height, width = self.layers.shape
+        layer_plane = np.ascontiguousarray(self.layers).view(np.uint8)
+        return Image.frombuffer("L", (width, height), layer_plane, "raw", "L", 0, 1)
+
+    def copy(self) -> "RadarFrame":
+        frame = RadarFrame(self.layers.copy(), self.flags.copy())
+        # Layer model is never changed in place, so copies share it until their layer planes differ
+        frame.layer_model = self.layer_model
+        return frame
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Frame size (width, height), same as PIL image size."""
+        return self.layers.shape[1], self.layers.shape[0]
+
+    def layer_index(self, coord: Tuple[int, int]) -> int:
+        """Layer index of the pixel at (x, y), -1 for no echo."""
+        return int(self.layers[coord[1], coord[0]])
+
+    def valid_index(self, coord: Tuple[int, int]) -> int:
+        """Layer index of the pixel at (x, y) when it is a valid echo, -1 for no echo, base and base filled echoes."""
+        if self.flags[coord[1], coord[0]] & FLAG_BASE_MASK:
+            return -1
+        return int(self.layers[coord[1], coord[0]])
+
+    def is_base(self, coord: Tuple[int, int]) -> bool:
+        """Whether the pixel at (x, y) is a base echo or a base filled echo."""
+        return bool(self.flags[coord[1], coord[0]] & FLAG_BASE_MASK)
+
+    def set_pixel(self, coord: Tuple[int, int], layer_index: int, flags: int = 0):
+        """Sets layer index and flags of the pixel at (x, y)."""
+        self.layers[coord[1], coord[0]] = layer_index
+        self.flags[coord[1], coord[0]] = flags
+
+    def copy_pixel(self, coord: Tuple[int, int], source: "RadarFrame"):
+        """Copies layer index and flags of the pixel at (x, y) from the source frame."""
+        self.layers[coord[1], coord[0]] = source.layers[coord[1], coord[0]]
+        self.flags[coord[1], coord[0]] = source.flags[coord[1], coord[0]]
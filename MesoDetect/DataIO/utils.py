@@ -1,19 +1,27 @@
 """
 this file mainly provides public utility functions about folder process
 """
-from PIL import Image, ImageDraw
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT
+import numpy as np
+from PIL import Image
+from MesoDetect.DataIO.consts import (NO_ECHO_INDEX, RESULT_PNG_COMPRESS_LEVEL, RESULT_RENDER_MODES,
+                                      DEFAULT_RESULT_RENDER_MODE)
+from MesoDetect.DataIO.decoder import layer_plane_to_palette_img
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
 from MesoDetect.MesocycloneAnalysis.consts import MesocycloneInfo
 from MesoDetect.DataIO.consts import DetectionResult
 from datetime import datetime, timedelta
-from MesoDetect.DataIO.consts import CONFIG_FILE
 import math
 import os
-import yaml
+import re
+import heapq
+from collections.abc import Sequence
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from colorama import Fore, Style
-from typing import Union, Optional, List, Tuple
+from typing import Union, Optional, List, Tuple, Iterator
 from pathlib import Path
-from MesoDetect.DataIO.consts import VALID_IMG_EXTENSION
+from MesoDetect.DataIO.consts import VALID_IMG_EXTENSION, FOLDER_SCAN_WORKER_NUM
 
 """
 Utility Function: validate output image folder
@@ -45,33 +53,145 @@ def check_output_folder(output_folder_path: Union[str, Path], current_folder_nam
 """
 Utility Function: extract images path from given folder
 """
-def get_folder_image_paths(img_folder_path: Union[Path, str]) -> List[Path]:
+def get_folder_image_paths(
+        img_folder_path: Union[Path, str],
+        recursive: bool = False,
+        station_num: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None
+) -> List[Path]:
     """
-    Retrieves the full paths of image files in a given folder.
+    Retrieves the full paths of image files in a given folder, in scan time order.
 
     Args:
         img_folder_path (Union[Path, str]): Path to the folder containing image files.
+        recursive (bool): whether to include image files in sub folders.
+        station_num (Optional[str]): only include radar images of the station if given.
+        start_time (Optional[datetime]): only include radar images scanned at or after the time (UTC) if given.
+        end_time (Optional[datetime]): only include radar images scanned before the time (UTC) if given.
 
     Returns:
         List[str]: A list of absolute Paths for valid image files in the folder.
     """
+    return list(scan_folder_image_paths(img_folder_path, recursive, station_num, start_time, end_time))
+
+
+"""
+Utility Function: lazily scan images path from given folder
+"""
+def scan_folder_image_paths(
+        img_folder_path: Union[Path, str],
+        recursive: bool = False,
+        station_num: Optional[str] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        ordered: bool = True,
+        worker_num: int = FOLDER_SCAN_WORKER_NUM
+) -> Iterator[Path]:
+    """
+    Scans image files in a given folder without opening them. Sub folders are scanned by a thread pool,
+    and images are filtered by the station number and scan time in formatted radar image names.
+    When a filter is given, images without formatted radar image name are skipped.
+
+    Args:
+        img_folder_path (Union[Path, str]): Path to the folder containing image files.
+        recursive (bool): whether to scan sub folders.
+        station_num (Optional[str]): only include radar images of the station if given.
+        start_time (Optional[datetime]): only include radar images scanned at or after the time (UTC) if given.
+        end_time (Optional[datetime]): only include radar images scanned before the time (UTC) if given.
+        ordered (bool): whether to yield images of all folders in scan time order, which starts yielding
+            after all folders are listed. Otherwise images of each folder are yielded in scan time order
+            as soon as the folder is listed.
+        worker_num (int): number of threads scanning folders.
+
+    Returns:
+        Iterator[Path]: iterator of absolute Paths for valid image files.
+    """
     # resolve input image folder path
     img_folder_path = Path(img_folder_path).expanduser().resolve()
 
-    # extract all file names
-    all_files = os.listdir(str(img_folder_path))
+    # Scan time keys are compared as 14 digits strings
+    start_key = None if start_time is None else start_time.strftime("%Y%m%d%H%M%S")
+    end_key = None if end_time is None else end_time.strftime("%Y%m%d%H%M%S")
+    enable_filter = station_num is not None or start_key is not None or end_key is not None
+
+    def scan_folder(folder_path: str) -> Tuple[List[Tuple[str, str, Path]], List[str]]:
+        folder_images: List[Tuple[str, str, Path]] = []
+        sub_folders: List[str] = []
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        sub_folders.append(entry.path)
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in VALID_IMG_EXTENSION:
+                    continue
+                name_info = parse_radar_image_name(entry.name)
+                if name_info is None:
+                    if enable_filter:
+                        continue
+                    time_key = ""
+                else:
+                    time_key = name_info[1].ljust(14, "0")
+                    if station_num is not None and name_info[0] != station_num:
+                        continue
+                    if start_key is not None and time_key < start_key:
+                        continue
+                    if end_key is not None and time_key >= end_key:
+                        continue
+                folder_images.append((time_key, entry.name, Path(entry.path)))
+        folder_images.sort()
+        return folder_images, sub_folders
+
+    with ThreadPoolExecutor(max_workers=max(worker_num, 1)) as executor:
+        pending_scans = {executor.submit(scan_folder, str(img_folder_path))}
+        scanned_folders: List[List[Tuple[str, str, Path]]] = []
+        while pending_scans:
+            done_scans, pending_scans = wait(pending_scans, return_when=FIRST_COMPLETED)
+            for scan in done_scans:
+                folder_images, sub_folders = scan.result()
+                pending_scans.update(executor.submit(scan_folder, sub_folder) for sub_folder in sub_folders)
+                if ordered:
+                    scanned_folders.append(folder_images)
+                else:
+                    for image_item in folder_images:
+                        yield image_item[2]
+
+    # Merge sorted images of each folder
+    for image_item in heapq.merge(*scanned_folders):
+        yield image_item[2]
 
-    # filter out image files
-    image_files = [file for file in all_files if os.path.splitext(file)[1].lower() in VALID_IMG_EXTENSION]
 
-    # iterate image file names
-    image_paths: List[Path] = []
-    for image_name in image_files:
-        image_path = img_folder_path / image_name
-        image_paths.append(image_path)
+"""
+Utility Function: parse formatted radar image name
+"""
+def parse_radar_image_name(image_name: str) -> Optional[Tuple[str, str]]:
+    """
+    Parses radar image name with format "Z_RADR_I_<station>_<scan time>_...".
 
-    return image_paths
+    Args:
+        image_name (str): radar image file name.
 
+    Returns:
+        Optional[Tuple[str, str]]: station number "Zxxxx" and scan time "YYYYmmDDHHMM" or "YYYYmmDDHHMMss",
+        None if the name is not formatted.
+    """
+    # Split the name into segments
+    segments = image_name.split('_')
+
+    # Check if there are enough segments (at least 5)
+    if len(segments) < 5:
+        return None
+
+    # Check the 4th segment (Z followed by exactly 4 digits)
+    if not re.fullmatch(r'Z\d{4}', segments[3]):
+        return None
+
+    # Check the 5th segment (timestamp: YYYYmmDDHHMM or YYYYmmDDHHMMss)
+    if not re.fullmatch(r'\d{12}(\d{2})?', segments[4]):
+        return None
+
+    return segments[3], segments[4]
 
 
 """
@@ -83,14 +203,23 @@ other styles.
 """
 Utility Function: visualizing process result image from gray color into original radar image color
 """
-def visualize_result(folder_path: Path, gray_img: Image, result_name: str) -> str:
+def visualize_result(
+        folder_path: Path,
+        gray_img: RadarFrame,
+        result_name: str,
+        radar_config: RadarConfig,
+        compress_level: int = RESULT_PNG_COMPRESS_LEVEL
+) -> str:
     """
-    Generates a color visualization image from a grayscale radar image and saves it to disk.
+    Generates a color visualization image from a radar frame and saves it to disk as a P mode PNG
+    with the color bar palette.
 
     Args:
         folder_path (Path): The output directory where the visualization image will be saved.
-        gray_img (Image): The grayscale radar image (PIL Image) to visualize.
+        gray_img (RadarFrame): The radar frame to visualize.
         result_name (str): The filename (without extension) for the output image.
+        radar_config (RadarConfig): Radar config of the frame.
+        compress_level (int): PNG compression level from 0 to 9, lower for faster saving, higher for smaller file.
 
     Returns:
         str: The file path (as POSIX string) to the saved visualization image.
@@ -100,30 +229,37 @@ def visualize_result(folder_path: Path, gray_img: Image, result_name: str) -> st
     if not os.path.exists(visualize_result_path):
         os.makedirs(visualize_result_path)
 
-    # Create visualization result image
-    visual_img = Image.new("RGB", gray_img.size, (0, 0, 0))
-    visual_draw = ImageDraw.Draw(visual_img)
-
-    # Iterate gray image
-    radar_zone = get_radar_info("radar_zone")
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
-    for x in range(radar_zone[0], radar_zone[1]):
-        for y in range(radar_zone[0], radar_zone[1]):
-            # Get current pixel value
-            pixel_value = gray_img.getpixel((x, y))[0]
-            # Calculate gray value index
-            gray_value_index = round(1.0 * pixel_value / GRAY_SCALE_UNIT) - 1
-            # Get actual color and draw
-            if 0 <= gray_value_index <= len(cv_pairs) - 1:
-                visual_draw.point((x, y), cv_pairs[gray_value_index][0])
+    # Create visualization result image with color bar palette
+    visual_img = get_visualization_img(gray_img, radar_config)
 
     # Save visualization result image
     visualization_result_path = visualize_result_path / (result_name + ".png")
-    visual_img.save(visualization_result_path)
+    visual_img.save(visualization_result_path, compress_level=compress_level)
 
     return visualization_result_path.as_posix()
 
 
+"""
+Utility Function: get visualization image of a radar frame
+"""
+def get_visualization_img(gray_img: RadarFrame, radar_config: RadarConfig) -> Image:
+    """
+    Creates a P mode visualization image of radar zone of the radar frame with the color bar palette.
+
+    Args:
+        gray_img (RadarFrame): The radar frame to visualize.
+        radar_config (RadarConfig): Radar config of the frame.
+
+    Returns:
+        Image: P mode visualization image.
+    """
+    # Extract radar zone of the layer plane
+    zone = radar_config.zone
+    layer_plane = np.full(gray_img.layers.shape, NO_ECHO_INDEX, dtype=np.uint8)
+    layer_plane[zone] = gray_img.layers[zone].view(np.uint8)
+    return layer_plane_to_palette_img(layer_plane, radar_config.palette)
+
+
 def print_detection_result(result: DetectionResult):
     if len(result['meso_list']) == 0:
         print("[Info] No active mesocyclone detected.")
@@ -151,30 +287,130 @@ def print_detection_result(result: DetectionResult):
         print("-------------------------------------------------")
 
 
+class MesoResultImages(Sequence):
+    """
+    Sequence of mesocyclone result image paths. Only the echo patch of each detect area is kept, and a result
+    image not rendered yet is rendered and saved when its path is accessed for the first time or by render_all.
+
+    Attributes:
+        render_mode (str): result image rendering mode, "cropped" or "full" images are rendered.
+        image_size (Tuple[int, int]): size of full result image (width, height).
+        palette (np.ndarray): color bar palette of result images, see RadarConfig.palette.
+        compress_level (int): PNG compression level of result images.
+        image_paths (List[Path]): path of each result image.
+        offsets (List[Tuple[int, int]]): top left coordinate (x, y) of each echo patch in radar image.
+        patches (List[np.ndarray]): uint8 layer index plane of each detect area bounding box.
+    """
+    def __init__(self, render_mode: str, image_size: Tuple[int, int], palette: np.ndarray, compress_level: int):
+        self.render_mode = render_mode
+        self.image_size = image_size
+        self.palette = palette
+        self.compress_level = compress_level
+        self.image_paths: List[Path] = []
+        self.offsets: List[Tuple[int, int]] = []
+        self.patches: List[np.ndarray] = []
+        self.rendered: List[bool] = []
+
+    def add_image(self, image_path: Path, offset: Tuple[int, int], patch: np.ndarray):
+        self.image_paths.append(image_path)
+        self.offsets.append(offset)
+        self.patches.append(patch)
+        self.rendered.append(False)
+
+    def __len__(self) -> int:
+        return len(self.image_paths)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[idx] for idx in range(len(self))[index]]
+        self.render(index)
+        return self.image_paths[index].as_posix()
+
+    def __repr__(self) -> str:
+        return f"MesoResultImages({[path.as_posix() for path in self.image_paths]})"
+
+    def render(self, index: int):
+        """
+        Renders and saves a result image if it is not rendered yet.
+
+        Args:
+            index (int): index of the result image.
+        """
+        if self.rendered[index]:
+            return
+        patch = self.patches[index]
+        if self.render_mode == "full":
+            layer_plane = np.full((self.image_size[1], self.image_size[0]), NO_ECHO_INDEX, dtype=np.uint8)
+            offset_x, offset_y = self.offsets[index]
+            layer_plane[offset_y:offset_y + patch.shape[0], offset_x:offset_x + patch.shape[1]] = patch
+        else:
+            layer_plane = patch
+        result_img = layer_plane_to_palette_img(layer_plane, self.palette)
+        result_img.save(self.image_paths[index], compress_level=self.compress_level)
+        self.rendered[index] = True
+
+    def render_all(self):
+        """
+        Renders and saves all result images that are not rendered yet.
+        """
+        for index in range(len(self)):
+            self.render(index)
+
+
+"""
+Utility Function: get disk mask of detect area
+"""
+@lru_cache(maxsize=64)
+def get_disk_mask(radius: int) -> np.ndarray:
+    """
+    Gets the mask of pixels within given distance from the center of a square with side 2 * radius + 1.
+
+    Args:
+        radius (int): radius of the disk.
+
+    Returns:
+        np.ndarray: read-only boolean mask with shape (2 * radius + 1, 2 * radius + 1).
+    """
+    offsets = np.arange(-radius, radius + 1)
+    disk_mask = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius ** 2
+    disk_mask.flags.writeable = False
+    return disk_mask
+
+
 """
 Utility Function: packing detection result data into a single dictionary data
 """
 def pack_detection_result(
         station_number: str,
         resolved_img_path: Path,
-        refer_img: Image,
+        refer_img: RadarFrame,
         meso_list: List[MesocycloneInfo],
-        output_path: Path
+        output_path: Path,
+        radar_config: RadarConfig,
+        compress_level: int = RESULT_PNG_COMPRESS_LEVEL,
+        render_mode: str = DEFAULT_RESULT_RENDER_MODE
 ) -> DetectionResult:
     """
-    Packs the results of mesocyclone detection into a structured output and generates
-    visualization images highlighting detected mesocyclones.
+    Packs the results of mesocyclone detection into a structured output with visualization images
+    highlighting detected mesocyclones. Images are saved before returning in "full" mode, and are rendered
+    lazily when their paths are accessed in "cropped" mode, see MesoResultImages.
 
     Args:
         station_number (str): Radar station identifier.
         resolved_img_path (Path): Path to the original resolved radar image.
-        refer_img (Image): Reference grayscale radar image (used to extract echo values).
+        refer_img (RadarFrame): Reference radar frame (used to extract echo values).
         meso_list (List[MesocycloneInfo]): List of detected mesocyclone information.
         output_path (Path): Directory where visualization images will be saved.
+        radar_config (RadarConfig): Radar config of the frame.
+        compress_level (int): PNG compression level from 0 to 9 of the palettized result images.
+        render_mode (str): Result image rendering mode, one of RESULT_RENDER_MODES. "headless" renders no image,
+                           "cropped" renders bounding box patch of each detect area on demand, "full" renders
+                           image size images eagerly.
 
     Returns:
         DetectionResult: A dictionary-like object containing detection metadata,
-                         mesocyclone info, and paths to the generated images.
+                         mesocyclone info, and paths of the result images as a list of str,
+                         or as a MesoResultImages sequence in "cropped" mode.
     """
     # Get scan time from resolved image path
     scan_time = resolved_img_path.as_posix().split("/")[-1].split("_")[4][:12]
@@ -183,100 +419,52 @@ def pack_detection_result(
     resolved_scan_time = datetime.strptime(scan_time, "%Y%m%d%H%M") + timedelta(hours=8)
 
     # Get basic data
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
-    image_size = get_radar_info("image_size")
-
-    # Iterate meso list for generating result images
-    result_image_paths: List[str] = []
-    for idx, meso_info in enumerate(meso_list, start=1):
-        meso_result_img = Image.new("RGB", image_size, (0, 0, 0))
-        meso_result_draw = ImageDraw.Draw(meso_result_img)
-        neg_center = meso_info['neg_center']
-        pos_center = meso_info['pos_center']
-        range_diameter = round(math.sqrt((neg_center[0] - pos_center[0]) ** 2 + (neg_center[1] - pos_center[1]) ** 2))
-        # Calculate mid-center of the meso pair
-        mid_center_x = round((neg_center[0] + pos_center[0]) / 2)
-        mid_center_y = round((neg_center[1] + pos_center[1]) / 2)
-        # Draw detect area
-        for x in range(mid_center_x - range_diameter, mid_center_x + range_diameter + 1):
-            for y in range(mid_center_y - range_diameter, mid_center_y + range_diameter + 1):
-                if math.sqrt((x - mid_center_x) ** 2 + (y - mid_center_y) ** 2) <= range_diameter:
-                    # Extract echo value
-                    echo_value = refer_img.getpixel((x, y))
-                    echo_index = round(echo_value[0] / GRAY_SCALE_UNIT) - 1
-                    if echo_index not in range(len(cv_pairs)):
-                        continue
-                    meso_result_draw.point((x, y), cv_pairs[echo_index][0])
-        result_image_path = output_path / ("meso_detect" + str(idx) + ".png")
-        meso_result_img.save(result_image_path)
-        result_image_paths.append(result_image_path.as_posix())
+    if render_mode not in RESULT_RENDER_MODES:
+        print(Fore.YELLOW + f"[Warning] Invalid render mode `{render_mode}`, "
+                            f"`{DEFAULT_RESULT_RENDER_MODE}` is used instead." + Style.RESET_ALL)
+        render_mode = DEFAULT_RESULT_RENDER_MODE
+
+    # Keep echo patch of each detect area for rendering result images on demand
+    result_image_paths = MesoResultImages(render_mode, refer_img.size, radar_config.palette, compress_level)
+    if render_mode != "headless":
+        cv_pairs = radar_config.color_velocity_pairs
+        # Layer indexes without color bar color are drawn as no echo
+        refer_plane = refer_img.layers.view(np.uint8)
+        for idx, meso_info in enumerate(meso_list, start=1):
+            neg_center = meso_info['neg_center']
+            pos_center = meso_info['pos_center']
+            range_diameter = round(math.sqrt((neg_center[0] - pos_center[0]) ** 2
+                                             + (neg_center[1] - pos_center[1]) ** 2))
+            # Calculate mid-center of the meso pair
+            mid_center_x = round((neg_center[0] + pos_center[0]) / 2)
+            mid_center_y = round((neg_center[1] + pos_center[1]) / 2)
+            # Clip detect area by image bounds
+            min_x = max(mid_center_x - range_diameter, 0)
+            max_x = max(min(mid_center_x + range_diameter + 1, refer_img.size[0]), min_x)
+            min_y = max(mid_center_y - range_diameter, 0)
+            max_y = max(min(mid_center_y + range_diameter + 1, refer_img.size[1]), min_y)
+            disk_offset_x = min_x - (mid_center_x - range_diameter)
+            disk_offset_y = min_y - (mid_center_y - range_diameter)
+            area_mask = get_disk_mask(range_diameter)[disk_offset_y:disk_offset_y + max_y - min_y,
+                                                      disk_offset_x:disk_offset_x + max_x - min_x]
+            area_plane = refer_plane[min_y:max_y, min_x:max_x]
+            patch = np.where(area_mask & (area_plane < len(cv_pairs)), area_plane, NO_ECHO_INDEX).astype(np.uint8)
+            result_image_paths.add_image(output_path / ("meso_detect" + str(idx) + ".png"), (min_x, min_y), patch)
+    # Full images are saved right away as callers may read result images from output folder without their paths,
+    # and their paths are kept as a plain list, only cropped images are rendered when their paths are accessed
+    result_img_paths: Sequence[str] = result_image_paths
+    if render_mode != "cropped":
+        result_image_paths.render_all()
+        result_img_paths = [image_path.as_posix() for image_path in result_image_paths.image_paths]
 
     detection_result: DetectionResult = {
         "input_img_path": resolved_img_path.as_posix(),
         "station_number": station_number,
         "scan_time": resolved_scan_time,
         "meso_list": meso_list,
-        "result_img_paths": result_image_paths
+        "result_img_paths": result_img_paths,
+        # Filled by the detection pipeline with metrics collected during detection
+        "metrics": {}
     }
 
     return detection_result
-
-
-"""
-Utility Function: Read config data from radar config file
-"""
-def get_radar_info(var_name: str) -> Optional[Union[Tuple[int, int], List[int]]]:
-    """
-    Retrieves specific radar configuration data from a YAML configuration file.
-
-    Args:
-        var_name (str): Name of the radar configuration variable to retrieve.
-                        Must be one of: "image_size", "radar_zone", "radar_center".
-
-    Returns:
-        Optional[Union[Tuple[int, int], List[int]]]: The requested configuration data,
-        or None if the variable name is invalid or the config file cannot be read.
-    """
-    # Load YAML file
-    with open(CONFIG_FILE, "r") as file:
-        data = yaml.safe_load(file)
-
-    if var_name == "image_size":
-        width, height = data["image_size"]
-        return width, height
-    elif var_name == "radar_zone":
-        return data["radar_zone"]
-    elif var_name == "radar_center":
-        return data["radar_center"]
-    else:
-        print(Fore.RED + f'[Error] Invalid var_name `{var_name}` for `get_radar_info`.' + Style.RESET_ALL)
-        return None
-
-
-"""
-Utility Function: Read config data from radar config file
-"""
-def get_color_bar_info(var_name: str) -> Optional[List[Tuple[Tuple[int, int, int], float]]]:
-    """
-    Retrieves color bar configuration data from the YAML config file.
-
-    Args:
-        var_name (str): The name of the color bar variable to retrieve.
-                        Currently only supports "color_velocity_pairs".
-
-    Returns:
-        Optional[List[Tuple[Tuple[int, int, int], float]]]: A list of color-velocity pairs,
-        where each item is a (color RGB tuple, velocity value), or None if the variable name is invalid.
-    """
-    # Load YAML file
-    with open(CONFIG_FILE, "r") as file:
-        data = yaml.safe_load(file)
-
-    if var_name == "color_velocity_pairs":
-        cv_pairs_tuple = []
-        for cv in data["color_velocity_pairs"]:
-            cv_pairs_tuple.append(((cv[0][0], cv[0][1], cv[0][2]), cv[1]))
-        return cv_pairs_tuple
-    else:
-        print(Fore.RED + f'[Error] Invalid var_name `{var_name}` for `get_color_bar_info`.' + Style.RESET_ALL)
-        return None
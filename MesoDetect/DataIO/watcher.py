@@ -0,0 +1,104 @@
+"""
+This file provides the radar image folder watcher for streaming detection of live radar feeds.
+The watched folder is scanned periodically, and each new radar image is reported once,
+as soon as it is fully written.
+"""
+import os
+import threading
+from MesoDetect.DataIO.consts import VALID_IMG_EXTENSION, WATCH_POLL_INTERVAL, WATCH_STABLE_SCANS
+from MesoDetect.DataIO.data_config import is_valid_image_name
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set, Tuple, Union
+
+
+"""
+Public Interface: watch radar image folder for new radar images
+"""
+def watch_radar_images(
+        img_folder_path: Union[str, Path],
+        stop_event: Optional[threading.Event] = None,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        stable_scans: int = WATCH_STABLE_SCANS,
+        include_existing: bool = True
+) -> Iterator[Path]:
+    """
+    Watches a folder and yields each new radar image once it is fully written. A file is regarded as
+    fully written when its size and modification time stay the same for stable_scans following scans.
+    Images found in the same scan are yielded in scan time order.
+
+    Args:
+        img_folder_path (Union[str, Path]): path of the watched folder.
+        stop_event (Optional[threading.Event]): event for stopping watching, watching never stops if not given.
+        poll_interval (float): interval in seconds between folder scans.
+        stable_scans (int): number of following scans in which a file must stay unchanged.
+        include_existing (bool): whether to yield radar images already in the folder when watching starts.
+
+    Returns:
+        Iterator[Path]: iterator of fully written radar image paths.
+    """
+    img_folder_path = Path(img_folder_path).expanduser().resolve()
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    # Names of reported images still in the folder and unchanged scan count of images being written
+    reported_names: Set[str] = set()
+    writing_files: Dict[str, Tuple[Tuple[int, int], int]] = {}
+    if not include_existing:
+        reported_names.update(entry.name for entry in scan_radar_images(img_folder_path))
+
+    while not stop_event.is_set():
+        written_entries = []
+        current_names = set()
+        scanned_names = set()
+        for entry in scan_radar_images(img_folder_path):
+            scanned_names.add(entry.name)
+            if entry.name in reported_names:
+                continue
+            current_names.add(entry.name)
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            last_state = writing_files.get(entry.name)
+            unchanged_scans = last_state[1] + 1 if last_state is not None and last_state[0] == signature else 0
+            if unchanged_scans >= stable_scans and stat.st_size > 0:
+                written_entries.append(entry)
+            else:
+                writing_files[entry.name] = (signature, unchanged_scans)
+
+        # Forget files removed before fully written, and reported files removed from the folder
+        for name in list(writing_files):
+            if name not in current_names:
+                del writing_files[name]
+        reported_names &= scanned_names
+
+        written_entries.sort(key=lambda item: (item.name.split("_")[4], item.name))
+        for entry in written_entries:
+            reported_names.add(entry.name)
+            writing_files.pop(entry.name, None)
+            yield Path(entry.path)
+
+        stop_event.wait(poll_interval)
+
+
+"""
+Utility Function: scan radar image files in folder
+"""
+def scan_radar_images(img_folder_path: Path) -> Iterator[os.DirEntry]:
+    """
+    Scans the folder for files with valid image extension and formatted radar image name.
+
+    Args:
+        img_folder_path (Path): path of the folder.
+
+    Returns:
+        Iterator[os.DirEntry]: iterator of radar image file entries.
+    """
+    with os.scandir(img_folder_path) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() not in VALID_IMG_EXTENSION:
+                continue
+            if not is_valid_image_name(entry.name) or not entry.is_file():
+                continue
+            yield entry
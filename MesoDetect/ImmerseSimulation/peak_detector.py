@@ -1,14 +1,17 @@
+import numpy as np
 from PIL import Image, ImageDraw
 from colorama import Fore, Style
 import time
 import copy
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT, SURROUNDING_OFFSETS
-from MesoDetect.DataIO.utils import get_color_bar_info
+from MesoDetect.DataIO.consts import SURROUNDING_OFFSETS
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
 from MesoDetect.ImmerseSimulation.consts import AREA_MAXIMUM_THRESHOLD
 from MesoDetect.ImmerseSimulation.region_filter import check_region_attributes
-from MesoDetect.RadarDenoise.dependencies import get_layer_model
+from MesoDetect.RadarDenoise.dependencies import LayerModel, get_layer_model
 from MesoDetect.ImmerseSimulation.consts import CURRENT_DEBUG_RESULT_FOLDER
-from MesoDetect.DataIO.utils import check_output_folder
+from MesoDetect.DataIO.debug_sink import DebugSink, get_debug_sink
+from MesoDetect.DataIO.metrics import record_stage, count_metric, submit_stage
 from typing import List, Tuple, Optional
 from pathlib import Path
 
@@ -17,16 +20,20 @@ from pathlib import Path
     Interface of peak_detector
 """
 def get_extrema_regions(
-        denoised_img: Image,
+        denoised_img: RadarFrame,
         debug_output_path: Path,
-        enable_debug: bool = False
+        enable_debug: bool,
+        radar_config: RadarConfig,
+        debug_sink: Optional[DebugSink] = None
 ) -> Optional[Tuple[List[List[Tuple[int, int]]], List[List[Tuple[int, int]]]]]:
     """
-    process denoised image and return list of extrema regions coordinate
+    process denoised frame and return list of extrema regions coordinate
     Args:
-        denoised_img: PIL Image object of denoised image
+        denoised_img: RadarFrame object of denoised frame
         enable_debug: boolean flag enabling debug mode for saving analysis result image
         debug_output_path: output location path for analysis result image saving
+        radar_config: radar config of the frame
+        debug_sink: debug sink of the radar image, debug images are saved under output path if not given
 
     Returns:
         a list that includes two list of peak coordinate groups for neg and pos velocity mode
@@ -34,39 +41,43 @@ def get_extrema_regions(
     start = time.time()
     print("[Info] Start immerse simulation analysis...")
 
-    if enable_debug:
-        debug_output_path = check_output_folder(debug_output_path, CURRENT_DEBUG_RESULT_FOLDER)
-        if debug_output_path is None:
-            print(Fore.RED + "[Error] Output folder check failed." + Style.RESET_ALL)
-            return None
+    debug_sink = get_debug_sink(enable_debug, debug_output_path, CURRENT_DEBUG_RESULT_FOLDER, debug_sink)
+    if debug_sink is None:
+        print(Fore.RED + "[Error] Output folder check failed." + Style.RESET_ALL)
+        return None
 
     # Get layer model of preprocessed image
     try:
-        layer_model = get_layer_model(denoised_img)
+        with record_stage("layer_model"):
+            layer_model = get_layer_model(denoised_img, radar_config)
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] Getting layer model for getting extrema regions failed." + Style.RESET_ALL)
         return None
 
-    # Get regional peaks
+    # Get regional peaks, the two velocity modes only read the layer model so they may run concurrently
+    neg_future = submit_stage("neg", extrema_region_analysis, layer_model, denoised_img.size, "neg", debug_sink,
+                              radar_config)
+    pos_future = submit_stage("pos", extrema_region_analysis, layer_model, denoised_img.size, "pos", debug_sink,
+                              radar_config)
     try:
-        neg_peak_groups = extrema_region_analysis(layer_model, denoised_img.size, "neg", enable_debug, debug_output_path)
+        neg_peak_groups = neg_future.result()
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] Extrema region analysis for `neg` mode failed." + Style.RESET_ALL)
         return None
 
     try:
-        pos_peak_groups = extrema_region_analysis(layer_model, denoised_img.size, "pos", enable_debug, debug_output_path)
+        pos_peak_groups = pos_future.result()
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] Extrema region analysis for `pos` mode failed." + Style.RESET_ALL)
         return None
 
-    if enable_debug:
+    if debug_sink.enabled:
         try:
             integrate_region_groups = neg_peak_groups + pos_peak_groups
-            get_region_debug_img(integrate_region_groups, denoised_img, "integrated", debug_output_path)
+            get_region_debug_img(integrate_region_groups, denoised_img.layers, "integrated", debug_sink, radar_config)
         except Exception as e:
             print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
             print(Fore.RED + f"[Error] Creating debug image for integrated extrema regions failed." + Style.RESET_ALL)
@@ -83,19 +94,19 @@ def get_extrema_regions(
     Internal dependency function
 """
 def extrema_region_analysis(
-        layer_model: List[List[Tuple[int, int]]],
+        layer_model: LayerModel,
         radar_img_size: Tuple[int, int],
         mode: str,
-        enable_debug: bool,
-        debug_output_path: Path
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
 ) -> List[List[Tuple[int, int]]]:
     """
     Args:
-        layer_model: a list of same value echo lists data structure for analysis
+        layer_model: layer model of the denoised frame for analysis
         radar_img_size: tuple with two int value of image size
         mode: string value that indicate the velocity mode, only in "neg" or "pos"
-        enable_debug: boolean flag, True for enabling debug mode and False for disabling
-        debug_output_path: path of debug folder
+        debug_sink: debug sink for debug images of the process
+        radar_config: radar config of the frame
     """
     # Check mode code
     if mode == "neg":
@@ -107,21 +118,16 @@ def extrema_region_analysis(
     else:
         raise ValueError(f"[Error] Invalid mode code: {mode} for extrema regions analysis.")
     # Iterate layer model with specific index range
-    immerse_img = Image.new("RGB", radar_img_size, (0, 0, 0))
-    immerse_draw = ImageDraw.Draw(immerse_img)
+    immerse_img = np.full((radar_img_size[1], radar_img_size[0]), -1, dtype=np.int8)
 
     # items in this list have structure like (flag, echo_groups)
     # the flag is an int value that only in 0 or 1
     # echo_groups is the list of coordinates
     peak_groups: List[Tuple[int, List[Tuple[int, int]]]] = []
     for layer_idx in layer_idx_range:
-        # Calculate current layer value
-        current_layer_value = (layer_idx + 1) * GRAY_SCALE_UNIT
-        current_layer_color = (current_layer_value, current_layer_value, current_layer_value)
-
-        # Draw current layer echoes into the immerse image
-        for echo_coord in layer_model[layer_idx]:
-            immerse_draw.point(echo_coord, current_layer_color)
+        # Draw current layer echoes into the immerse plane
+        xs, ys = layer_model.coordinates(layer_idx)
+        immerse_img[ys, xs] = layer_idx
 
         # Extend existing region groups
         extended_region_groups = extend_region_groups(peak_groups, layer_idx, immerse_img, is_neg)
@@ -136,27 +142,30 @@ def extrema_region_analysis(
         peak_groups = extended_region_groups
 
         # Draw debug image if enable debug mode
-        if enable_debug:
+        if debug_sink.enabled:
             # Create a peak region groups for debug image generation
             peak_debug_groups = []
             for peak_group_pair in peak_groups:
                 peak_debug_groups.append(peak_group_pair[1])
-            get_region_debug_img(peak_debug_groups, immerse_img, mode + "_peaks_" + str(layer_idx), debug_output_path)
+            get_region_debug_img(peak_debug_groups, immerse_img, mode + "_peaks_" + str(layer_idx), debug_sink,
+                                 radar_config)
 
     # Meso condition check
     filtered_peak_groups = []
     layer_model_len = len(layer_model)
     for peak_group_pair in peak_groups:
-        if check_region_attributes(peak_group_pair[1], immerse_img, layer_model_len):
+        if check_region_attributes(peak_group_pair[1], immerse_img, layer_model_len, radar_config):
             filtered_peak_groups.append(peak_group_pair[1])
 
-    if enable_debug:
-        get_region_debug_img(filtered_peak_groups, immerse_img, mode + "_peak_filtered", debug_output_path)
+    count_metric("extrema_regions", len(filtered_peak_groups))
+
+    if debug_sink.enabled:
+        get_region_debug_img(filtered_peak_groups, immerse_img, mode + "_peak_filtered", debug_sink, radar_config)
 
     return filtered_peak_groups
 
 
-def extend_region_groups(peak_groups: List[Tuple[int, List[Tuple[int, int]]]], layer_idx: int, immerse_img: Image, is_neg: bool)\
+def extend_region_groups(peak_groups: List[Tuple[int, List[Tuple[int, int]]]], layer_idx: int, immerse_img: np.ndarray, is_neg: bool)\
         -> List[Tuple[int, List[Tuple[int, int]]]]:
     layer_peak_groups = []
     # First check peak groups from last layer
@@ -180,8 +189,7 @@ def extend_region_groups(peak_groups: List[Tuple[int, List[Tuple[int, int]]]], l
                     current_coord = stack.pop()
                     for offset in SURROUNDING_OFFSETS:
                         neighbour_coord = (current_coord[0] + offset[0], current_coord[1] + offset[1])
-                        neighbour_value = immerse_img.getpixel(neighbour_coord)
-                        neighbour_index = round(neighbour_value[0] / GRAY_SCALE_UNIT) - 1
+                        neighbour_index = immerse_img[neighbour_coord[1], neighbour_coord[0]]
                         # Check neighbour index value
                         if is_neg and 0 <= neighbour_index <= layer_idx:
                             if neighbour_coord not in is_visited:
@@ -207,7 +215,7 @@ def extend_region_groups(peak_groups: List[Tuple[int, List[Tuple[int, int]]]], l
     return layer_peak_groups
 
 
-def get_init_regional_groups(layer_model: List[List[Tuple[int, int]]], layer_idx: int, immerse_img: Image)\
+def get_init_regional_groups(layer_model: LayerModel, layer_idx: int, immerse_img: np.ndarray)\
         -> List[Tuple[int, List[Tuple[int, int]]]]:
     # Initialize variables
     init_regional_groups = []
@@ -223,8 +231,7 @@ def get_init_regional_groups(layer_model: List[List[Tuple[int, int]]], layer_idx
                 current_coord = stack.pop()
                 for offset in SURROUNDING_OFFSETS:
                     neighbour_coord = (current_coord[0] + offset[0], current_coord[1] + offset[1])
-                    neighbour_value = immerse_img.getpixel(neighbour_coord)
-                    neighbour_index = round(neighbour_value[0] / GRAY_SCALE_UNIT) - 1
+                    neighbour_index = immerse_img[neighbour_coord[1], neighbour_coord[0]]
                     if neighbour_index == layer_idx:
                         if neighbour_coord not in is_visited:
                             is_visited.add(neighbour_coord)
@@ -242,27 +249,36 @@ def get_init_regional_groups(layer_model: List[List[Tuple[int, int]]], layer_idx
     return init_regional_groups
 
 
-def get_region_debug_img(region_groups: List[List[Tuple[int, int]]], refer_img: Image, debug_img_name: str, debug_output_path: Path):
+def get_region_debug_img(
+        region_groups: List[List[Tuple[int, int]]],
+        refer_img: np.ndarray,
+        debug_img_name: str,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+):
     # Create a debug image
-    debug_img = Image.new("RGB", refer_img.size, (0, 0, 0))
+    debug_img = Image.new("RGB", (refer_img.shape[1], refer_img.shape[0]), (0, 0, 0))
 
     # Draw extrema regions
-    debug_img = draw_extrema_regions(debug_img, region_groups, refer_img)
+    debug_img = draw_extrema_regions(debug_img, region_groups, refer_img, radar_config)
 
-    # Save debug image: regard the debug_output_path is valid
-    debug_img_path = debug_output_path / (debug_img_name + ".png")
-    debug_img.save(debug_img_path)
+    # Save debug image
+    debug_sink.save_image(debug_img_name, debug_img)
 
 
-def draw_extrema_regions(debug_img: Image, region_groups: List[List[Tuple[int, int]]], refer_img: Image) -> Image:
+def draw_extrema_regions(
+        debug_img: Image,
+        region_groups: List[List[Tuple[int, int]]],
+        refer_img: np.ndarray,
+        radar_config: RadarConfig
+) -> Image:
     # Draw region groups on debug image
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
+    cv_pairs = radar_config.color_velocity_pairs
     debug_img_draw = ImageDraw.Draw(debug_img)
     for region_group in region_groups:
         for coord in region_group:
-            # Get pixel value
-            pixel_value = refer_img.getpixel(coord)
-            pixel_value_index = round(pixel_value[0] / GRAY_SCALE_UNIT) - 1
+            # Get pixel value index from refer layer plane
+            pixel_value_index = int(refer_img[coord[1], coord[0]])
             if pixel_value_index in range(len(cv_pairs)):
                 debug_img_draw.point(coord, cv_pairs[pixel_value_index][0])
     return debug_img
\ No newline at end of file
@@ -1,19 +1,20 @@
 import numpy as np
 from sklearn.decomposition import PCA
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT, SURROUNDING_OFFSETS
+from MesoDetect.DataIO.consts import SURROUNDING_OFFSETS
 from MesoDetect.ImmerseSimulation.consts import (AREA_MAXIMUM_THRESHOLD, AREA_MINIMUM_THRESHOLD,
                                                  AVG_VOLUME_MINIMUM_THRESHOLD, NARROW_MAXIMUM_THRESHOLD,
                                                  DENSITY_MAXIMUM_THRESHOLD, LAYER_GROUP_MAXIMUM_THRESHOLD)
 from MesoDetect.RadarDenoise.dependencies import get_echo_groups
 
 
-def check_region_attributes(echo_group, refer_img, layer_model_len):
+def check_region_attributes(echo_group, refer_img, layer_model_len, radar_config):
     """
         Check given echo group fulfill the extrema region attribution constraints or not.
     Args:
         echo_group: list of echo coordinates that belongs to a connected component of echos
-        refer_img: the image that contains the next-to relationship of echo coordinates in echo_group
+        refer_img: the layer index plane that contains the next-to relationship of echo coordinates in echo_group
         layer_model_len: len of layer model, also equal to the len of radar velocity color legend
+        radar_config: radar config of the refer plane
 
     Returns:
         True if the given echo group fulfills the constraints, False otherwise.
@@ -23,8 +24,7 @@ def check_region_attributes(echo_group, refer_img, layer_model_len):
         return False
     # Calculate velocity mode of the group
     group_instance = echo_group[0]
-    group_instance_value = refer_img.getpixel(group_instance)
-    group_instance_index = round(group_instance_value[0] / GRAY_SCALE_UNIT) - 1
+    group_instance_index = refer_img[group_instance[1], group_instance[0]]
     half_len = round(layer_model_len / 2)
     if group_instance_index <= half_len - 1:
         is_neg = True
@@ -39,8 +39,7 @@ def check_region_attributes(echo_group, refer_img, layer_model_len):
     # Calculate the average volume of the group
     volume = 0
     for echo_coord in echo_group:
-        echo_value = refer_img.getpixel(echo_coord)
-        echo_index = round(echo_value[0] / GRAY_SCALE_UNIT) - 1
+        echo_index = int(refer_img[echo_coord[1], echo_coord[0]])
         if is_neg:
             volume += half_len - echo_index
         else:
@@ -69,12 +68,13 @@ def check_region_attributes(echo_group, refer_img, layer_model_len):
     # Calculate density degree
     # First calculate the perimeter
     surroundings = set()
+    echo_group_set = set(echo_group)
     for echo_coord in echo_group:
         # Check neighbour for each pixel
         for offset in SURROUNDING_OFFSETS:
             neighbour_coord = (echo_coord[0] + offset[0], echo_coord[1] + offset[1])
             # Filter out inner pixel
-            if neighbour_coord not in echo_group:
+            if neighbour_coord not in echo_group_set:
                 if neighbour_coord not in surroundings:
                     surroundings.add(neighbour_coord)
     # Note that the perimeter here calculated is the outer range of the group
@@ -92,9 +92,8 @@ def check_region_attributes(echo_group, refer_img, layer_model_len):
         group_layer_model.append([])
     # Get group layer model
     for echo_coord in echo_group:
-        # Get pixel value
-        echo_value = refer_img.getpixel(echo_coord)
-        echo_index = round(echo_value[0] / GRAY_SCALE_UNIT) - 1
+        # Get pixel value index
+        echo_index = int(refer_img[echo_coord[1], echo_coord[0]])
         if echo_index in range(layer_model_len):
             group_layer_model[echo_index].append(echo_coord)
     # Group each layer
@@ -106,7 +105,7 @@ def check_region_attributes(echo_group, refer_img, layer_model_len):
         if len(group_layer_model[layer_idx]) == 0:
             continue
         valid_layer_num += 1
-        current_layer_groups = get_echo_groups(refer_img, group_layer_model[layer_idx])
+        current_layer_groups = get_echo_groups(refer_img, group_layer_model[layer_idx], radar_config)
         total_group_count += len(current_layer_groups)
     # Calculate average group num in each layer
     if valid_layer_num == 0:
@@ -1,11 +1,13 @@
 import math
 import time
-from MesoDetect.DataIO.utils import get_color_bar_info, get_radar_info
+import numpy as np
 from MesoDetect.DataIO.consts import PIXEL_KM_RATIO_PAIR
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
 from typing import List, Tuple, Optional
 from pathlib import Path
-from MesoDetect.DataIO.utils import check_output_folder
+from MesoDetect.DataIO.debug_sink import DebugSink, get_debug_sink
+from MesoDetect.DataIO.metrics import count_metric
 from colorama import Fore, Style
 from PIL import Image, ImageDraw
 from MesoDetect.ImmerseSimulation.peak_detector import draw_extrema_regions
@@ -17,45 +19,48 @@ from MesoDetect.MesocycloneAnalysis.consts import (MesocycloneInfo, CURRENT_DEBU
     Interface for meso analysis
 """
 def opposite_extrema_analysis(
-        unfold_img: Image,
+        unfold_img: RadarFrame,
         neg_peaks: List[List[Tuple[int, int]]],
         pos_peaks: List[List[Tuple[int, int]]],
         output_path: Path,
-        enable_debug: bool = False
+        enable_debug: bool,
+        radar_config: RadarConfig,
+        debug_sink: Optional[DebugSink] = None
 ) -> Optional[List[MesocycloneInfo]]:
     """
     Detect mesocyclones from given negative and positive velocity echo extrema regions.
     Args:
-        unfold_img: unfold radar image in gray mode
+        unfold_img: unfold radar frame
         neg_peaks: negative velocity echo extrema regions
         pos_peaks: positive velocity echo extrema retions
         output_path: path of output images
         enable_debug: bool flag for debug mode
+        radar_config: radar config of the frame
+        debug_sink: debug sink of the radar image, debug images are saved under output path if not given
 
     Returns:
         a list of mesocyclone data structure
     """
     start = time.time()
     print("[Info] Start mesocyclone analysis...")
-    debug_output_path = output_path
-    if enable_debug:
-        debug_output_path = check_output_folder(output_path, CURRENT_DEBUG_RESULT_FOLDER)
-        if debug_output_path is None:
-            print(Fore.RED + "[Error] Output folder check failed." + Style.RESET_ALL)
-            return None
+    debug_sink = get_debug_sink(enable_debug, output_path, CURRENT_DEBUG_RESULT_FOLDER, debug_sink)
+    if debug_sink is None:
+        print(Fore.RED + "[Error] Output folder check failed." + Style.RESET_ALL)
+        return None
 
     try:
         # check meso conditions for each opposite extrema pair
-        mesocyclone_list = validate_potential_meso(unfold_img, neg_peaks, pos_peaks)
+        mesocyclone_list = validate_potential_meso(unfold_img, neg_peaks, pos_peaks, radar_config)
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] Validing potential mesocyclone process failed." + Style.RESET_ALL)
         return None
 
     # draw mesocyclone analysis debug image
-    if enable_debug:
+    if debug_sink.enabled:
         try:
-            get_meso_debug_img(neg_peaks, pos_peaks, mesocyclone_list, unfold_img, "meso_analysis_debug", debug_output_path)
+            get_meso_debug_img(neg_peaks, pos_peaks, mesocyclone_list, unfold_img.layers, "meso_analysis_debug",
+                               debug_sink, radar_config)
         except Exception as e:
             print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
             print(Fore.RED + f"[Error] Generating debug image for mesocyclone analysis failed." + Style.RESET_ALL)
@@ -83,12 +88,13 @@ def opposite_extrema_analysis(
     dependency functions
 """
 def validate_potential_meso(
-        unfold_img: Image,
+        unfold_img: RadarFrame,
         neg_peaks: List[List[Tuple[int, int]]],
         pos_peaks: List[List[Tuple[int, int]]],
+        radar_config: RadarConfig
 ) -> Optional[List[MesocycloneInfo]]:
     # Get pixel distance-actual distance ratio
-    radar_img_size = get_radar_info("image_size")
+    radar_img_size = radar_config.image_size
     if radar_img_size == PIXEL_KM_RATIO_PAIR[0][0]:
         pixel_km_ratio = PIXEL_KM_RATIO_PAIR[0][1]
     else:
@@ -97,20 +103,20 @@ def validate_potential_meso(
     # Get group centers
     neg_centers = []
     for group in neg_peaks:
-        center = get_group_center(unfold_img, group)
+        center = get_group_center(unfold_img.layers, group, radar_config)
         if not center is None:
             neg_centers.append(center)
 
     pos_centers = []
     for group in pos_peaks:
-        center = get_group_center(unfold_img, group)
+        center = get_group_center(unfold_img.layers, group, radar_config)
         if not center is None:
             pos_centers.append(center)
 
     # Meso Data Structure containing neg, pos center coordinate and float type center distance
     mesocyclone_list: List[MesocycloneInfo] = []
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
-    radar_center = get_radar_info("radar_center")
+    cv_pairs = radar_config.color_velocity_pairs
+    radar_center = radar_config.radar_center
     for neg_idx in range(len(neg_centers)):
         for pos_idx in range(len(pos_centers)):
             # Get extrema region center coordinate
@@ -121,12 +127,12 @@ def validate_potential_meso(
             center_distance_km = center_distance * pixel_km_ratio
             # Check opposite extrema region center distance
             if center_distance_km <= CENTER_DISTANCE_THRESHOLD:
+                count_metric("candidate_pairs")
                 # Get maxinum velocity value from extrema region
                 # For negative:
                 maximum_neg_velocity = 0
                 for coord in neg_peaks[neg_idx]:
-                    neg_peak_echo_value = unfold_img.getpixel(coord)
-                    neg_peak_echo_index = round(neg_peak_echo_value[0] / GRAY_SCALE_UNIT) - 1
+                    neg_peak_echo_index = unfold_img.layer_index(coord)
                     if neg_peak_echo_index in range(len(cv_pairs)):
                         neg_peak_echo_velocity = cv_pairs[neg_peak_echo_index][1]
                     else:
@@ -136,8 +142,7 @@ def validate_potential_meso(
                 # For positive:
                 maximum_pos_velocity = 0
                 for coord in pos_peaks[pos_idx]:
-                    pos_peak_echo_value = unfold_img.getpixel(coord)
-                    pos_peak_echo_index = round(pos_peak_echo_value[0] / GRAY_SCALE_UNIT) - 1
+                    pos_peak_echo_index = unfold_img.layer_index(coord)
                     if pos_peak_echo_index in range(len(cv_pairs)):
                         pos_peak_echo_velocity = cv_pairs[pos_peak_echo_index][1]
                     else:
@@ -164,10 +169,8 @@ def validate_potential_meso(
                                 # Skip coordinate that out of range
                                 continue
                             total_in_range_pixel_num += 1
-                            # Get pixel value
-                            pixel_value = unfold_img.getpixel((x, y))
-                            # Calculate gray value index, use second channel RGB value
-                            pixel_value_index = round(pixel_value[1] / GRAY_SCALE_UNIT) - 1
+                            # Get valid echo index, basemaps and basemaps filled echoes are invalid
+                            pixel_value_index = unfold_img.valid_index((x, y))
                             if pixel_value_index == -1:
                                 invalid_echo_num += 1
                     if total_in_range_pixel_num > 0:
@@ -201,6 +204,8 @@ def validate_potential_meso(
                         }
                         mesocyclone_list.append(mesocyclone_data)
 
+    count_metric("mesocyclones", len(mesocyclone_list))
+
     # Iterate through mesocyclone data list and add storm number
     for storm_index, meso_info in enumerate(mesocyclone_list):
         meso_info["storm_num"] = storm_index
@@ -208,26 +213,23 @@ def validate_potential_meso(
     return mesocyclone_list
 
 
-def get_group_center(refer_img: Image, echo_group: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
-    # Get basic data
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
-    # Iterate through group
-    center_x_sum = 0
-    center_y_sum = 0
-    weight_sum = 0
-    for echo_coord in echo_group:
-        echo_value = refer_img.getpixel(echo_coord)
-        echo_index = round(echo_value[0] / GRAY_SCALE_UNIT) - 1
-
-        weight = abs(cv_pairs[echo_index][1])
-        center_x_sum += echo_coord[0] * weight
-        center_y_sum += echo_coord[1] * weight
-        weight_sum += weight
+def get_group_center(
+        refer_img: np.ndarray,
+        echo_group: List[Tuple[int, int]],
+        radar_config: RadarConfig
+) -> Optional[Tuple[int, int]]:
+    if len(echo_group) == 0:
+        return None
+    # Get velocity weight of each echo in the group
+    group_coords = np.array(echo_group)
+    echo_indexes = refer_img[group_coords[:, 1], group_coords[:, 0]]
+    weights = np.abs(radar_config.velocities[echo_indexes])
+    weight_sum = float(weights.sum())
     # Calculate center coord
     if weight_sum == 0:
         return None
-    center_x = round(center_x_sum / weight_sum)
-    center_y = round(center_y_sum / weight_sum)
+    center_x = round(float(np.dot(group_coords[:, 0], weights)) / weight_sum)
+    center_y = round(float(np.dot(group_coords[:, 1], weights)) / weight_sum)
     center = (center_x, center_y)
     return center
 
@@ -236,18 +238,19 @@ def get_meso_debug_img(
         neg_extrema_groups: List[List[Tuple[int, int]]],
         pos_extrema_groups: List[List[Tuple[int, int]]],
         meso_list: List[MesocycloneInfo],
-        refer_img: Image,
+        refer_img: np.ndarray,
         debug_img_name: str,
-        debug_output_path: Path
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
 ):
     # debug image for meso analysis
-    meso_debug_img = Image.new("RGB", refer_img.size, (0, 0, 0))
+    meso_debug_img = Image.new("RGB", (refer_img.shape[1], refer_img.shape[0]), (0, 0, 0))
 
     # merge the two opposite extrema region list
     merged_extremas = neg_extrema_groups + pos_extrema_groups
 
     # draw extremas
-    meso_debug_img = draw_extrema_regions(meso_debug_img, merged_extremas, refer_img)
+    meso_debug_img = draw_extrema_regions(meso_debug_img, merged_extremas, refer_img, radar_config)
 
     debug_img_draw = ImageDraw.Draw(meso_debug_img)
     # Draw mesocyclone extrema region pairs
@@ -269,6 +272,5 @@ def get_meso_debug_img(
 
         debug_img_draw.line([neg_center, pos_center], fill=(0, 255, 255), width=1)
 
-    # Save debug image: regard the debug_output_path is valid
-    debug_img_path = debug_output_path / (debug_img_name + ".png")
-    meso_debug_img.save(debug_img_path)
+    # Save debug image
+    debug_sink.save_image(debug_img_name, meso_debug_img)
@@ -2,6 +2,16 @@
 REFER_IMG_COLOR = (238, 0, 0)
 
 
+"""Parameters for Layer Model"""
+# maximum ratio of changed pixel number to layer model echo number for updating a cached layer model incrementally,
+# layer model is rebuilt from the frame when more pixels are changed
+LAYER_MODEL_UPDATE_RATIO = 0.25
+
+# margin in pixels of the initial labeling window around given echoes for echo grouping,
+# the window is enlarged when echo groups reach its border
+ECHO_GROUP_WINDOW_MARGIN = 16
+
+
 """Parameters for Layer Analysis"""
 # threshold for distinct small groups and trustful large group(might be folded)
 # Value of this threshold supposed to be low
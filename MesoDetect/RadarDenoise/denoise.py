@@ -1,8 +1,10 @@
-from PIL import Image
 import time
 from colorama import Fore, Style
 from MesoDetect.RadarDenoise import layer_analysis, dependencies, velocity_integrate, velocity_unfold
-from MesoDetect.DataIO.utils import check_output_folder
+from MesoDetect.DataIO.debug_sink import DebugSink, get_debug_sink
+from MesoDetect.DataIO.metrics import record_stage, submit_stage
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
 from MesoDetect.RadarDenoise.consts import CURRENT_DEBUG_RESULT_FOLDER
 from pathlib import Path
 from typing import Optional
@@ -11,43 +13,48 @@ from typing import Optional
     layer denoise interface
 """
 def radar_denoise(
-        preprocessed_img: Image,
+        preprocessed_img: RadarFrame,
         output_path: Path,
-        enable_debug: bool = False
-) -> Optional[Image]:
+        enable_debug: bool,
+        radar_config: RadarConfig,
+        debug_sink: Optional[DebugSink] = None
+) -> Optional[RadarFrame]:
     """
     Apply velocity layer analysis to denoise and velocity unfolding
     Args:
-        preprocessed_img: preprocessed radar image in internal gray format
+        preprocessed_img: preprocessed radar frame
         output_path: output path from current radar image process result
         enable_debug: boolean flag enabling debug mode for saving analysis result image
+        radar_config: radar config of the frame
+        debug_sink: debug sink of the radar image, debug images are saved under output path if not given
 
-    Returns: denoised image in PIL.Image type, None otherwise
+    Returns: denoised radar frame in RadarFrame type, None otherwise
     """
     start = time.time()
     print("[Info] Start radar denoise process...")
-    debug_output_path = output_path
-    if enable_debug:
-        debug_output_path = check_output_folder(output_path, CURRENT_DEBUG_RESULT_FOLDER)
-        if debug_output_path is None:
-            print(Fore.RED + "[Error] Output folder check failed." + Style.RESET_ALL)
-            return None
+    debug_sink = get_debug_sink(enable_debug, output_path, CURRENT_DEBUG_RESULT_FOLDER, debug_sink)
+    if debug_sink is None:
+        print(Fore.RED + "[Error] Output folder check failed." + Style.RESET_ALL)
+        return None
 
     # Get velocity layers list from the preprocessed image
     try:
-        layer_model = dependencies.get_layer_model(preprocessed_img)
+        with record_stage("layer_model"):
+            layer_model = dependencies.get_layer_model(preprocessed_img, radar_config)
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] Getting layer model for radar denoise process failed." + Style.RESET_ALL)
         return None
 
 
-    # Get denoise image
+    # Get denoise image, the two velocity modes only read the preprocessed frame and layer model so they may run concurrently
     try:
-        neg_denoise_img = layer_analysis.get_denoise_img(preprocessed_img, layer_model,
-                                                         "neg", enable_debug, debug_output_path)
-        pos_denoise_img = layer_analysis.get_denoise_img(preprocessed_img, layer_model,
-                                                         "pos", enable_debug, debug_output_path)
+        neg_future = submit_stage("neg", layer_analysis.get_denoise_img, preprocessed_img, layer_model,
+                                  "neg", debug_sink, radar_config)
+        pos_future = submit_stage("pos", layer_analysis.get_denoise_img, preprocessed_img, layer_model,
+                                  "pos", debug_sink, radar_config)
+        neg_denoise_img = neg_future.result()
+        pos_denoise_img = pos_future.result()
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] layer analysis processing failed." + Style.RESET_ALL)
@@ -55,8 +62,9 @@ def radar_denoise(
 
     # Integrate two denoised image
     try:
-        integrate_img = velocity_integrate.integrate_velocity_mode(neg_denoise_img, pos_denoise_img,
-                                                                   enable_debug, debug_output_path)
+        with record_stage("integrate"):
+            integrate_img = velocity_integrate.integrate_velocity_mode(neg_denoise_img, pos_denoise_img, debug_sink,
+                                                                       radar_config)
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] Velocity integration processing failed." + Style.RESET_ALL)
@@ -64,7 +72,8 @@ def radar_denoise(
 
     # Velocity unfolding
     try:
-        unfold_img = velocity_unfold.unfold_echoes(integrate_img, enable_debug, debug_output_path)
+        with record_stage("unfold"):
+            unfold_img = velocity_unfold.unfold_echoes(integrate_img, debug_sink, radar_config)
     except Exception as e:
         print(Fore.RED + f"[Error] Unexpected error: {e}" + Style.RESET_ALL)
         print(Fore.RED + f"[Error] Velocity unfolding failed." + Style.RESET_ALL)
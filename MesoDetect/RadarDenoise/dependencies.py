@@ -1,133 +1,410 @@
-from PIL import Image
 import numpy as np
-from skimage.segmentation import flood_fill
-from MesoDetect.DataIO.utils import get_radar_info, get_color_bar_info
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT, SURROUNDING_OFFSETS
-from typing import List, Tuple, Optional
+from collections.abc import Sequence
+from scipy import ndimage
+from MesoDetect.DataIO.consts import SURROUNDING_OFFSETS
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
+from MesoDetect.DataIO.metrics import count_metric
+from MesoDetect.RadarDenoise.consts import LAYER_MODEL_UPDATE_RATIO, ECHO_GROUP_WINDOW_MARGIN
+from typing import List, Optional, Tuple
 
 """
     Internal Dependency Functions
 """
-def get_layer_model(filled_img: Image) -> List[List[Tuple[int, int]]]:
+# Labeling structures of connected echo groups for each connectivity
+ECHO_GROUP_STRUCTURES = {8: np.ones((3, 3), dtype=bool), 4: ndimage.generate_binary_structure(2, 1)}
+
+# Labeling structure of blanks for inner filling, blanks are connected horizontally and vertically
+INNER_HOLE_STRUCTURE = ndimage.generate_binary_structure(2, 1)
+
+# Labeling structure of blanks in stacked planes for batched inner filling, blanks of different planes are not connected
+BATCH_INNER_HOLE_STRUCTURE = np.stack((np.zeros((3, 3), dtype=bool), INNER_HOLE_STRUCTURE, np.zeros((3, 3), dtype=bool)))
+
+
+class LayerModel:
+    """
+    Echo coordinates of each layer index in radar zone, stored as slices of one int32 array of
+    linear indexes (y * width + x) sorted by layer index, with CSR style offsets of the layer slices.
+    Echoes of each layer are listed by x first and then y.
+    Layer model is never changed in place, `update` returns a new layer model for a changed frame.
+
+    Attributes:
+        radar_zone (Tuple[int, int]): radar zone range of the layer model.
+        width (int): width of the frame.
+        indexes (np.ndarray): int32 linear indexes of echoes sorted by layer index.
+        offsets (np.ndarray): int64 array of length layer_num + 1, echoes of layer i are indexes[offsets[i]:offsets[i + 1]].
+        zone_layers (np.ndarray): snapshot of the radar zone of the layer plane that the layer model is built from.
+    """
+    __slots__ = ("radar_zone", "width", "indexes", "offsets", "zone_layers")
+
+    def __init__(self, radar_zone: Tuple[int, int], width: int, indexes: np.ndarray, offsets: np.ndarray,
+                 zone_layers: np.ndarray):
+        self.radar_zone = radar_zone
+        self.width = width
+        self.indexes = indexes
+        self.offsets = offsets
+        self.zone_layers = zone_layers
+
+    @classmethod
+    def from_frame(cls, frame: RadarFrame, radar_config: RadarConfig) -> "LayerModel":
+        """
+        Builds the layer model from the layer plane of the frame with one stable sort of echo layer indexes.
+
+        Args:
+            frame (RadarFrame): frame of the layer model.
+            radar_config (RadarConfig): radar config of the frame.
+        """
+        layer_num = radar_config.layer_num
+        zone_layers = frame.layers[radar_config.zone].copy()
+        zone_size = zone_layers.shape[0]
+
+        # Positions in transposed radar zone, so that coordinates are listed by x first and then y
+        transposed_layers = zone_layers.T.ravel()
+        positions = np.flatnonzero((transposed_layers > -1) & (transposed_layers < layer_num))
+        echo_indexes = transposed_layers[positions].astype(np.intp)
+
+        # Stable sort keeps x first order in each layer
+        order = np.argsort(echo_indexes, kind="stable")
+        offsets = np.zeros(layer_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(echo_indexes, minlength=layer_num), out=offsets[1:])
+
+        positions = positions[order]
+        xs = positions // zone_size + radar_config.radar_zone[0]
+        ys = positions % zone_size + radar_config.radar_zone[0]
+        indexes = (ys * frame.size[0] + xs).astype(np.int32)
+        return cls(radar_config.radar_zone, frame.size[0], indexes, offsets, zone_layers)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, layer_idx: int) -> List[Tuple[int, int]]:
+        """Coordinate list of echoes of the layer, created on each access."""
+        if not 0 <= layer_idx < len(self):
+            raise IndexError(f"layer index {layer_idx} out of range")
+        xs, ys = self.coordinates(layer_idx)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def layer_indexes(self, layer_idx: int) -> np.ndarray:
+        """Linear indexes of echoes of the layer, a view of the layer model array."""
+        return self.indexes[self.offsets[layer_idx]:self.offsets[layer_idx + 1]]
+
+    def coordinates(self, layer_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Arrays of x and y coordinates of echoes of the layer, usable as [ys, xs] array index."""
+        ys, xs = np.divmod(self.layer_indexes(layer_idx), self.width)
+        return xs, ys
+
+    def matches(self, frame: RadarFrame, radar_config: RadarConfig) -> bool:
+        """Whether the layer model can be updated for the frame with the radar config."""
+        return (self.radar_zone == radar_config.radar_zone and len(self) == radar_config.layer_num
+                and self.width == frame.size[0] and frame.layers.shape[0] >= self.radar_zone[1])
+
+    def update(self, frame: RadarFrame, radar_config: RadarConfig) -> "LayerModel":
+        """
+        Updates the layer model with pixels of the frame that differ from the layer model snapshot,
+        by removing changed echoes and merging their new layer indexes into the sorted linear index array.
+
+        Args:
+            frame (RadarFrame): changed frame of the layer model.
+            radar_config (RadarConfig): radar config of the frame.
+
+        Returns:
+            LayerModel: the layer model itself when no pixel is changed, otherwise a new layer model.
+        """
+        zone_start = self.radar_zone[0]
+        zone_layers = frame.layers[radar_config.zone]
+        changed_ys, changed_xs = np.nonzero(zone_layers != self.zone_layers)
+        count_metric("changed_pixels", len(changed_ys))
+        if len(changed_ys) == 0:
+            return self
+        if len(changed_ys) > len(self.indexes) * LAYER_MODEL_UPDATE_RATIO:
+            return LayerModel.from_frame(frame, radar_config)
+
+        # Sort keys of echoes ordered by layer index, x and then y
+        layer_num = len(self)
+        zone_size = self.zone_layers.shape[0]
+        layer_area = zone_size * zone_size
+        ys, xs = np.divmod(self.indexes.astype(np.int64), self.width)
+        layer_labels = np.repeat(np.arange(layer_num, dtype=np.int64), np.diff(self.offsets))
+        keys = layer_labels * layer_area + (xs - zone_start) * zone_size + (ys - zone_start)
+
+        # Remove echoes of changed pixels
+        changed_indexes = (changed_ys + zone_start) * self.width + (changed_xs + zone_start)
+        keys = keys[~np.isin(self.indexes, changed_indexes)]
+
+        # Merge new echoes of changed pixels
+        new_indexes = zone_layers[changed_ys, changed_xs].astype(np.int64)
+        is_echo = (new_indexes > -1) & (new_indexes < layer_num)
+        new_keys = np.sort(new_indexes[is_echo] * layer_area + changed_xs[is_echo] * zone_size + changed_ys[is_echo])
+        keys = np.insert(keys, np.searchsorted(keys, new_keys), new_keys)
+
+        layer_labels, positions = np.divmod(keys, layer_area)
+        offsets = np.zeros(layer_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(layer_labels, minlength=layer_num), out=offsets[1:])
+        xs, ys = np.divmod(positions, zone_size)
+        indexes = ((ys + zone_start) * self.width + xs + zone_start).astype(np.int32)
+        return LayerModel(self.radar_zone, self.width, indexes, offsets, zone_layers.copy())
+
+
+def get_layer_model(filled_frame: RadarFrame, radar_config: RadarConfig) -> LayerModel:
     """
-    Generate a list of same velocity echo coordinate lists that have same length and according index
-    value with the color velocity pairs
-    :param filled_img: Pillow Image object of filled image
+    Get layer model of the frame whose layers have same index value with the color velocity pairs,
+    the layer model cached by the frame or its source frame is updated with changed pixels instead of rebuilding
+    :param filled_frame: RadarFrame object of filled radar data
+    :param radar_config: radar config of the frame
     :return: layer model
     """
-    # Get dependency data
-    radar_zone = get_radar_info("radar_zone")
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
-
-    # Construct empty data structure
-    layer_model = []
-    for idx in range(len(cv_pairs)):
-        layer_model.append([])
-
-    # iterate the filled image
-    for x in range(radar_zone[0], radar_zone[1]):
-        for y in range(radar_zone[0], radar_zone[1]):
-            # get current pixel value
-            pixel_value = filled_img.getpixel((x, y))
-            gray_index = round(pixel_value[0] * 1.0 / GRAY_SCALE_UNIT) - 1
-            if -1 < gray_index < len(cv_pairs):
-                layer_model[gray_index].append((x, y))
+    layer_model = filled_frame.layer_model
+    if layer_model is not None and layer_model.matches(filled_frame, radar_config):
+        layer_model = layer_model.update(filled_frame, radar_config)
+    else:
+        layer_model = LayerModel.from_frame(filled_frame, radar_config)
+    filled_frame.layer_model = layer_model
     return layer_model
 
 
-def get_echo_groups(refer_img: Image, coordinate_list: List[Tuple[int, int]]) -> List[List[Tuple[int, int]]]:
+class EchoGroups(Sequence):
+    """
+    Connected echo groups labeled from a refer plane, ordered by their first given coordinate.
+    Pixels of each group are stored as a span of one int32 array of linear indexes (y * width + x)
+    listed by x first and then y.
+    Indexing a group gives its coordinate list, which is created on first access.
+
+    Attributes:
+        width (int): width of the refer plane.
+        origin (Tuple[int, int]): (x, y) coordinate of the top left pixel of the label plane in the refer plane.
+        labels (np.ndarray): int32 label plane of the labeled window of the refer plane indexed by [y, x],
+            pixels of group i are labeled i + 1 and other pixels are labeled 0.
+        sizes (np.ndarray): pixel number of each group.
+        bboxes (np.ndarray): array with shape (n, 4) of (x_min, y_min, x_max, y_max) of each group, bounds included.
+        indexes (np.ndarray): int32 linear indexes of group pixels grouped by group.
+        offsets (np.ndarray): int64 array of length n + 1, pixels of group i are indexes[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, width: int, origin: Tuple[int, int], labels: np.ndarray, indexes: np.ndarray,
+                 offsets: np.ndarray):
+        self.width = width
+        self.origin = origin
+        self.labels = labels
+        self.indexes = indexes
+        self.offsets = offsets
+        self.sizes = np.diff(offsets)
+        if len(indexes) > 0:
+            ys, xs = np.divmod(indexes, width)
+            self.bboxes = np.stack((np.minimum.reduceat(xs, offsets[:-1]), np.minimum.reduceat(ys, offsets[:-1]),
+                                    np.maximum.reduceat(xs, offsets[:-1]), np.maximum.reduceat(ys, offsets[:-1])),
+                                   axis=1)
+        else:
+            self.bboxes = np.zeros((0, 4), dtype=np.int64)
+        self.groups: List[Optional[List[Tuple[int, int]]]] = [None] * len(self.sizes)
+
+    @classmethod
+    def empty(cls, width: int) -> "EchoGroups":
+        return cls(width, (0, 0), np.zeros((0, 0), dtype=np.int32), np.zeros(0, dtype=np.int32),
+                   np.zeros(1, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def __getitem__(self, group_idx: int) -> List[Tuple[int, int]]:
+        if group_idx < 0:
+            group_idx += len(self)
+        if not 0 <= group_idx < len(self):
+            raise IndexError(f"echo group index {group_idx} out of range")
+        if self.groups[group_idx] is None:
+            xs, ys = self.coordinates(group_idx)
+            self.groups[group_idx] = list(zip(xs.tolist(), ys.tolist()))
+        return self.groups[group_idx]
+
+    def group_indexes(self, group_idx: int) -> np.ndarray:
+        """Linear indexes of pixels of the group, a view of the group pixel array."""
+        return self.indexes[self.offsets[group_idx]:self.offsets[group_idx + 1]]
+
+    def coordinates(self, group_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Arrays of x and y coordinates of pixels of the group, usable as [ys, xs] array index."""
+        ys, xs = np.divmod(self.group_indexes(group_idx), self.width)
+        return xs, ys
+
+    @property
+    def window(self) -> Tuple[slice, slice]:
+        """Index of the label plane window for arrays with same shape of the refer plane."""
+        return (slice(self.origin[1], self.origin[1] + self.labels.shape[0]),
+                slice(self.origin[0], self.origin[0] + self.labels.shape[1]))
+
+    def select_mask(self, is_selected: np.ndarray) -> np.ndarray:
+        """
+        Boolean mask of the label plane window with True for pixels of selected groups.
+        :param is_selected: boolean array with True for each selected group
+        """
+        return np.concatenate(([False], is_selected))[self.labels]
+
+
+def label_echo_groups(
+        refer_plane: np.ndarray,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        radar_config: RadarConfig,
+        connectivity: int = 8
+) -> EchoGroups:
+    """
+    Label connected components of pixels that have same refer value with the given coordinates,
+    and return components that include the given coordinates. Pixels are connected within radar zone
+    with its end bound included. Labeling starts from the window around given coordinates and the window
+    is enlarged until no returned component touches a window border inside the radar zone.
+    :param refer_plane: array indexed by [y, x] whose equal values indicate connected relationship of echoes,
+        such as a layer index plane or a boolean echo mask
+    :param xs: x coordinates of echoes in radar zone that have same refer value
+    :param ys: y coordinates of echoes in radar zone that have same refer value
+    :param radar_config: radar config of the plane
+    :param connectivity: 8 for connecting surrounding pixels or 4 for connecting only horizontal and vertical pixels
+    :return: connected echo groups ordered by their first given coordinate
+    """
+    height, width = refer_plane.shape
+    if len(xs) == 0:
+        return EchoGroups.empty(width)
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    structure = ECHO_GROUP_STRUCTURES[connectivity]
+
+    # Labeling bounds of radar zone, the end bound is included
+    bound_start = radar_config.radar_zone[0]
+    bound_end_x = min(radar_config.radar_zone[1] + 1, width)
+    bound_end_y = min(radar_config.radar_zone[1] + 1, height)
+
+    # Extract refer value of first point
+    target_value = refer_plane[ys[0], xs[0]]
+
+    margin = ECHO_GROUP_WINDOW_MARGIN
+    while True:
+        left = max(int(xs.min()) - margin, bound_start)
+        top = max(int(ys.min()) - margin, bound_start)
+        right = min(int(xs.max()) + margin + 1, bound_end_x)
+        bottom = min(int(ys.max()) + margin + 1, bound_end_y)
+        labels, _ = ndimage.label(refer_plane[top:bottom, left:right] == target_value, structure=structure)
+        seed_labels = labels[ys - top, xs - left]
+
+        # Enlarge the window when components of given coordinates might continue outside of it
+        borders = []
+        if left > bound_start:
+            borders.append(labels[:, 0])
+        if top > bound_start:
+            borders.append(labels[0, :])
+        if right < bound_end_x:
+            borders.append(labels[:, -1])
+        if bottom < bound_end_y:
+            borders.append(labels[-1, :])
+        if not borders:
+            break
+        border_labels = np.concatenate(borders)
+        if not np.isin(seed_labels, border_labels[border_labels > 0]).any():
+            break
+        margin *= 4
+
+    # Order components by their first given coordinate and relabel them from 1
+    group_labels, first_positions = np.unique(seed_labels, return_index=True)
+    first_positions = first_positions[group_labels > 0]
+    group_labels = group_labels[group_labels > 0]
+    group_labels = group_labels[np.argsort(first_positions, kind="stable")]
+    label_map = np.zeros(labels.max() + 1, dtype=np.int32)
+    label_map[group_labels] = np.arange(1, len(group_labels) + 1, dtype=np.int32)
+    labels = label_map[labels]
+
+    # Group pixels listed by x first and then y
+    transposed_labels = labels.T.ravel()
+    positions = np.flatnonzero(transposed_labels)
+    pixel_labels = transposed_labels[positions]
+    order = np.argsort(pixel_labels, kind="stable")
+    offsets = np.zeros(len(group_labels) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pixel_labels, minlength=len(group_labels) + 1)[1:], out=offsets[1:])
+    pixel_xs, pixel_ys = np.divmod(positions[order], labels.shape[0])
+    indexes = ((pixel_ys + top) * width + pixel_xs + left).astype(np.int32)
+    return EchoGroups(width, (left, top), labels, indexes, offsets)
+
+
+def get_echo_groups(
+        refer_plane: np.ndarray,
+        coordinate_list: List[Tuple[int, int]],
+        radar_config: RadarConfig
+) -> EchoGroups:
     """
     a utility function that divides the given coordinate_list
     and then return a list of connected components
-    :param refer_img: a Pillow Image object that used for checking connected relationship of echoes
+    :param refer_plane: array indexed by [y, x] whose equal values indicate connected relationship of echoes,
+        such as a layer index plane or a boolean echo mask
     :param coordinate_list: list of coordinate that might have several connected component
+    :param radar_config: radar config of the plane
     :return: a list of connected components
     """
     if len(coordinate_list) == 0:
-        return []
-    # get neighbour coordinate offset
-    neighbour_offsets = SURROUNDING_OFFSETS
-
-    # Get radar zone
-    radar_zone = get_radar_info("radar_zone")
-
-    # Extract gray value index of current point
-    target_value = refer_img.getpixel(coordinate_list[0])[0]
-    target_index = round(1.0 * target_value / GRAY_SCALE_UNIT) - 1
-
-    components = []
-    visited = set()
-    for point in coordinate_list:
-        if point not in visited:
-            visited.add(point)
-            stack = [point]
-            component = [point]
-
-            while stack:
-                current_point = stack.pop()
-
-                # get surrounding pixel values
-                for offset in neighbour_offsets:
-                    # ger neighbour pixel coordinate
-                    neighbour = (current_point[0] + offset[0], current_point[1] + offset[1])
-                    # radar scale check
-                    if (radar_zone[0] <= neighbour[0] <= radar_zone[1]
-                            and radar_zone[0] <= neighbour[1] <= radar_zone[1]):
-                        neighbour_value = refer_img.getpixel(neighbour)[0]
-                        if round(neighbour_value * 1.0 / GRAY_SCALE_UNIT) - 1 == target_index:
-                            # Mean that neighbour value similar to target value (slight difference is allowed)
-                            if neighbour not in visited:
-                                visited.add(neighbour)
-                                component.append(neighbour)
-                                stack.append(neighbour)
-            components.append(component)
-    return components
-
-
-def inner_filling(refer_img: Image, fill_color: Tuple[int, int, int], fill_img: Image) -> Optional[Image]:
-    """
-    Flooding outer blanks in given gray image and fill inner blanks of the image with
-    gray color that gray value index indicates
-    :param refer_img: PIL Image object in RGB mode with gray color that indicating inner relationship
-    :param fill_color: RGB color for filling
-    :param fill_img: PIL IMage object in RGB mode that need inner filling
-    :return: a PIL Image object of an inner filled gray image
-    """
-    # Check valid fill color
-    if len(fill_color) != 3:
-        print(f"[Error] Invalid fill color: {fill_color} for `inner_filling`.")
-        return None
-    # Get basic data
-    gray_value_interval = GRAY_SCALE_UNIT
-    radar_zone = get_radar_info("radar_zone")
-
-    # Convert RGB Image into gray image numpy array
-    gray_img_arr = np.array(refer_img.convert("L"))
-
-    # flood fill the array from point (0, 0) with value 255
-    flooded_arr = flood_fill(gray_img_arr, (0, 0), new_value=255, connectivity=1)
-
-    # Get interested zone border of the image
-    top, left = radar_zone[0], radar_zone[0]
-    bottom, right = radar_zone[1], radar_zone[1]
-
-    # Convert original gray RGB PIL image into numpy array
-    frame_arr = np.array(fill_img)
-
-    # Extract radar zone from the array
-    flooded_arr_sub = flooded_arr[top:bottom, left:right]  # shape: (subH, subW)
-    frame_arr_sub = frame_arr[top:bottom, left:right, :]  # shape: (subH, subW, 3)
-
-    # Compute the gray color index in one shot
-    color_index_arr = np.round(flooded_arr_sub.astype(float) / gray_value_interval) - 1
-
-    # Identify pixels where the index == -1
-    mask = (color_index_arr == -1)
-
-    # Fill those pixels in the frame_sub
-    frame_arr_sub[mask] = [fill_color[0], fill_color[1], fill_color[2]]
-
-    # Convert back to PIL and save
-    fill_img = Image.fromarray(frame_arr, mode="RGB")
-    return fill_img
+        return EchoGroups.empty(refer_plane.shape[1])
+    xs, ys = np.array(coordinate_list, dtype=np.int64).T
+    return label_echo_groups(refer_plane, xs, ys, radar_config)
+
+
+def get_surroundings(echo_groups: EchoGroups, excluded_plane: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get surroundings of each echo group, which are surrounding pixels of group pixels that are not excluded,
+    each surrounding pixel of a group is listed once even if it surrounds several group pixels
+    :param echo_groups: echo groups labeled in radar zone
+    :param excluded_plane: boolean array with same shape of the refer plane of echo groups indexed by [y, x],
+        with True for pixels that are not surroundings, such as pixels of the groups
+    :return: group indexes and linear indexes (y * width + x) of surrounding pixels of the group indexes
+    """
+    width = echo_groups.width
+    group_ids = np.repeat(np.arange(len(echo_groups), dtype=np.int64), echo_groups.sizes)
+    # Radar zone is inside the refer plane, so that surrounding pixels never cross the plane border
+    neighbour_offsets = np.array([offset[1] * width + offset[0] for offset in SURROUNDING_OFFSETS], dtype=np.int64)
+    neighbour_indexes = (echo_groups.indexes.astype(np.int64)[np.newaxis, :] + neighbour_offsets[:, np.newaxis]).ravel()
+    neighbour_group_ids = np.tile(group_ids, len(neighbour_offsets))
+    is_surrounding = ~excluded_plane.ravel()[neighbour_indexes]
+
+    # Remove repeated surrounding pixels of each group
+    plane_size = excluded_plane.size
+    surrounding_keys = np.unique(neighbour_group_ids[is_surrounding] * plane_size + neighbour_indexes[is_surrounding])
+    return np.divmod(surrounding_keys, plane_size)
+
 
+def get_inner_holes(zone_masks: np.ndarray) -> np.ndarray:
+    """
+    Get inner blanks of echo masks of radar zone, which are blanks that are not connected to the border of radar zone
+    horizontally or vertically. Stacked masks are labeled in one call without connecting blanks of different masks.
+    :param zone_masks: boolean array of radar zone indexed by [y, x], or stack of them indexed by [i, y, x],
+        with True for echoes that indicate inner relationship
+    :return: boolean array with same shape of the masks, True for inner blanks
+    """
+    if zone_masks.size == 0:
+        return np.zeros(zone_masks.shape, dtype=bool)
+    structure = INNER_HOLE_STRUCTURE if zone_masks.ndim == 2 else BATCH_INNER_HOLE_STRUCTURE
+    blank_labels, _ = ndimage.label(~zone_masks, structure=structure)
+
+    # Blanks connected to the border of radar zone are outer blanks
+    outer_labels = np.concatenate((blank_labels[..., 0, :].ravel(), blank_labels[..., -1, :].ravel(),
+                                   blank_labels[..., :, 0].ravel(), blank_labels[..., :, -1].ravel()))
+    is_outer = np.zeros(blank_labels.max() + 1, dtype=bool)
+    is_outer[outer_labels] = True
+    is_outer[0] = True
+    return ~is_outer[blank_labels]
+
+
+def inner_filling(
+        echo_mask: np.ndarray,
+        fill_frame: RadarFrame,
+        fill_index: int,
+        radar_config: RadarConfig,
+        fill_flags: int = 0
+) -> RadarFrame:
+    """
+    Fill inner blanks in radar zone of the frame that are enclosed by echoes of given echo mask
+    with given layer index and flags
+    :param echo_mask: boolean array indexed by [y, x] with True for echoes that indicate inner relationship,
+        only echoes in radar zone are considered
+    :param fill_frame: RadarFrame object that need inner filling, filled in place
+    :param fill_index: layer index for filling
+    :param radar_config: radar config of the frame
+    :param fill_flags: flags for filling
+    :return: the inner filled RadarFrame object
+    """
+    zone = radar_config.zone
+    inner_holes = get_inner_holes(echo_mask[zone])
+    fill_frame.layers[zone][inner_holes] = fill_index
+    fill_frame.flags[zone][inner_holes] = fill_flags
+    return fill_frame
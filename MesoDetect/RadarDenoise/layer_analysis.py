@@ -1,56 +1,56 @@
-from PIL import Image, ImageDraw
+import numpy as np
 from MesoDetect.RadarDenoise import dependencies, consts
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT, SURROUNDING_OFFSETS
-from MesoDetect.DataIO.utils import get_color_bar_info, get_radar_info
+from MesoDetect.DataIO.consts import SURROUNDING_OFFSETS, FLAG_BASE_ECHO, FLAG_BASE_FILLED, FLAG_BASE_MASK
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
+from MesoDetect.DataIO.debug_sink import DebugSink
+from MesoDetect.DataIO.metrics import count_metric
 from typing import List, Tuple
-from pathlib import Path
 
 """
     Interface: get_denoise_img
 """
-# regard debug_output_path is valid when calling this interface
 def get_denoise_img(
-        fill_img: Image,
-        layer_model: List[List[Tuple[int, int]]],
-        mode: str, enable_debug: bool,
-        debug_output_path: Path
-) -> Image:
+        fill_img: RadarFrame,
+        layer_model: dependencies.LayerModel,
+        mode: str,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+) -> RadarFrame:
     """
-    denoise given filled image and return denoised result image
+    denoise given filled frame and return denoised result frame
     Args:
-        fill_img: PIL Image Object of narrow filled image
-        layer_model: list of layer echoes
+        fill_img: RadarFrame object of narrow filled radar data
+        layer_model: layer model of the filled frame
         mode: string that indicates the velocity mode
-        enable_debug: boolean flag, True for enabling debug mode and False for disabling
-        debug_output_path: pathlib path type of output image path
+        debug_sink: debug sink for debug images of the process
+        radar_config: radar config of the frame
 
     Returns:
-    PIL Image object of a denoised image
+    RadarFrame object of a denoised frame
     """
     print(f"[Info] Start generating {mode} denoise image...")
     # Get basemaps echo image: Filter out Image Scale isolated echo group and draw echoes with two valid channel color
-    denoise_img = get_base_echo_img(layer_model, fill_img.size, mode)
-    if enable_debug:
-        denoise_img.save(debug_output_path / (mode + "_base.png"))
+    denoise_img = get_base_echo_img(layer_model, fill_img.size, mode, radar_config)
+    debug_sink.save_frame(mode + "_base", denoise_img)
 
     # Layer filter process: Draw large echo groups in Layer Scale and inner fill them for the holes in them and get small echo groups
-    denoise_img, small_echo_groups = layer_filter(fill_img, mode, denoise_img, layer_model, enable_debug, debug_output_path)
+    denoise_img, small_echo_groups = layer_filter(fill_img, mode, denoise_img, layer_model, debug_sink, radar_config)
 
     # Small echo groups analysis: Draw echoes that does not exceed below or surrounding layer gap
-    denoise_img = small_echo_group_analysis(fill_img, denoise_img, mode, small_echo_groups, enable_debug, debug_output_path)
+    denoise_img = small_echo_group_analysis(fill_img, denoise_img, mode, small_echo_groups, debug_sink)
 
     # Remove small isolated echo that is basemaps on the basemaps echo
-    denoise_img = remove_small_isolated_groups(denoise_img, len(layer_model), mode, enable_debug, debug_output_path)
+    denoise_img = remove_small_isolated_groups(denoise_img, len(layer_model), mode, debug_sink, radar_config)
 
     # Filling basemaps echo area
-    denoise_img = base_echo_fill(denoise_img, len(layer_model), mode)
+    denoise_img = base_echo_fill(denoise_img, len(layer_model), mode, radar_config)
 
     # Remove basemaps echoes
-    denoise_img = remove_base_echoes(denoise_img, len(layer_model), mode, enable_debug, debug_output_path)
+    denoise_img = remove_base_echoes(denoise_img, len(layer_model), mode, debug_sink, radar_config)
 
     # Save debug image
-    if enable_debug:
-        denoise_img.save(debug_output_path / (mode + "_denoised.png"))
+    debug_sink.save_frame(mode + "_denoised", denoise_img)
 
     print(f"[Info] {mode} denoise image generation success.")
     return denoise_img
@@ -59,120 +59,106 @@ def get_denoise_img(
 """
     Internal dependency functions
 """
-def remove_base_echoes(denoise_img: Image, layer_model_len: int, mode: str, enable_debug: bool, debug_result_folder: Path) -> Image:
+def remove_base_echoes(
+        denoise_img: RadarFrame,
+        layer_model_len: int,
+        mode: str,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+) -> RadarFrame:
     # Check mode code
     base_value_index, _ = check_velocity_mode(mode, layer_model_len)
 
-    # Debug image for process
-    remove_debug_img = Image.new("RGB", denoise_img.size, (0, 0, 0))
-    remove_debug_draw = ImageDraw.Draw(remove_debug_img)
-
-    denoise_draw = ImageDraw.Draw(denoise_img)
-    # Iterate radar zone to filter out basemaps echoes, but keep basemaps filled echoes
-    radar_zone = get_radar_info("radar_zone")
-    for x in range(radar_zone[0], radar_zone[1]):
-        for y in range(radar_zone[0], radar_zone[1]):
-            # Extract the second and third channel RGB color value for distinguish basemaps echo pixel
-            pixel_value = denoise_img.getpixel((x, y))
-            second_channel = pixel_value[1]
-            third_channel = pixel_value[2]
-            second_channel_index = round(second_channel / GRAY_SCALE_UNIT) - 1
-            third_channel_index = round(third_channel / GRAY_SCALE_UNIT) - 1
-            # Only basemaps echo that have different value in second and third channel RGB color
-            if second_channel_index != third_channel_index:
-                # Indicate that current pixel is basemaps echo
-                denoise_draw.point((x, y), (0, 0, 0))
-                remove_debug_draw.point((x, y), (0, 255, 0))
+    # Filter out basemaps echoes in radar zone, but keep basemaps filled echoes
+    zone = radar_config.zone
+    # Only basemaps echo have base echo flag
+    base_echo_mask = (denoise_img.flags[zone] & FLAG_BASE_ECHO) != 0
+    denoise_img.layers[zone][base_echo_mask] = -1
+    denoise_img.flags[zone][base_echo_mask] = 0
 
     # Save debug image
-    if enable_debug:
-        remove_debug_img.save(debug_result_folder / (mode + "_base_remove.png"))
+    remove_debug_arr = debug_sink.canvas(denoise_img.size)
+    if remove_debug_arr is not None:
+        remove_debug_arr[zone][base_echo_mask] = (0, 255, 0)
+        debug_sink.save_canvas(mode + "_base_remove", remove_debug_arr)
 
     return denoise_img
 
 
-def remove_small_isolated_groups(denoise_img: Image, layer_model_len: int, mode: str, enable_debug: bool, debug_result_folder: Path) -> Image:
+def remove_small_isolated_groups(
+        denoise_img: RadarFrame,
+        layer_model_len: int,
+        mode: str,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+) -> RadarFrame:
     """
     Remove small isolated groups that is only surrounded by basemaps echoes in Image Scale,
     and inner fill the image after that.
     Args:
-        denoise_img: PIL Image object of denoised image
+        denoise_img: RadarFrame object of denoised frame
         layer_model_len: length of layer model in Int value type
         mode: velocity mode code in str type, only allowed to be "neg" or "pos"
-        enable_debug:
-        debug_result_folder: str type of debug result folder path
+        debug_sink: debug sink for debug images of the process
+        radar_config: radar config of the frame
 
     Returns:
-        PIL Image object of denoised image that has removed isolated echo groups
+        RadarFrame object of denoised frame that has removed isolated echo groups
     """
     # Check mode code
     base_index, _ = check_velocity_mode(mode, layer_model_len)
 
-    # Get refer image for basemaps echo exclusion
-    exclude_base_img = Image.new("RGB", denoise_img.size, (0, 0, 0))
-    exclude_base_draw = ImageDraw.Draw(exclude_base_img)
-    radar_zone = get_radar_info("radar_zone")
-    # Iterate radar zone and get target echo list as well as drawing refer image
-    exclude_img_echo_list = []
-    for x in range(radar_zone[0], radar_zone[1]):
-        for y in range(radar_zone[0], radar_zone[1]):
-            # Get pixel value from denoise image
-            pixel_value = denoise_img.getpixel((x, y))
-            # Calculate value index, use the second channel value for excluding basemaps echo
-            pixel_index = round(pixel_value[1] / GRAY_SCALE_UNIT) - 1
-            if pixel_index >= 0:
-                exclude_img_echo_list.append((x, y))
-                exclude_base_draw.point((x, y), consts.REFER_IMG_COLOR)
-    if enable_debug:
-        exclude_base_img.save(debug_result_folder / (mode + "_exclude_base.png"))
-
-    # Get echo groups from exclude basemaps image
-    exclude_base_echo_groups = dependencies.get_echo_groups(exclude_base_img, exclude_img_echo_list)
-
-    # Check group size for each group
-    remove_debug_img = Image.new("RGB", denoise_img.size, (0, 0, 0))
-    remove_debug_draw = ImageDraw.Draw(remove_debug_img)
-    denoise_draw = ImageDraw.Draw(denoise_img)
-    for echo_group in exclude_base_echo_groups:
-        if len(echo_group) < consts.SMALL_GROUP_SIZE_THRESHOLD:
-            # Remove small isolated groups that smaller than threshold from denoise image
-            for echo_coord in echo_group:
-                denoise_draw.point(echo_coord, (0, 0, 0))
-                remove_debug_draw.point(echo_coord, (0, 255, 0))
+    # Get refer mask for basemaps echo exclusion, use valid echoes only
+    exclude_base_mask = np.zeros(denoise_img.layers.shape, dtype=bool)
+    zone = radar_config.zone
+    exclude_base_mask[zone] = (denoise_img.layers[zone] >= 0) & ((denoise_img.flags[zone] & FLAG_BASE_MASK) == 0)
+    # Get target echo list by x first and then y
+    xs, ys = np.nonzero(exclude_base_mask.T)
+    exclude_base_arr = debug_sink.canvas(denoise_img.size)
+    if exclude_base_arr is not None:
+        exclude_base_arr[exclude_base_mask] = consts.REFER_IMG_COLOR
+        debug_sink.save_canvas(mode + "_exclude_base", exclude_base_arr)
+
+    # Get echo groups from exclude basemaps mask
+    exclude_base_echo_groups = dependencies.label_echo_groups(exclude_base_mask, xs, ys, radar_config)
+
+    # Remove small isolated groups that smaller than threshold from denoise image
+    window = exclude_base_echo_groups.window
+    removed_mask = exclude_base_echo_groups.select_mask(
+        exclude_base_echo_groups.sizes < consts.SMALL_GROUP_SIZE_THRESHOLD)
+    denoise_img.layers[window][removed_mask] = -1
+    denoise_img.flags[window][removed_mask] = 0
+    remove_debug_arr = debug_sink.canvas(denoise_img.size)
+    if remove_debug_arr is not None:
+        remove_debug_arr[window][removed_mask] = (0, 255, 0)
     # Execute inner filling for denoise after exclude basemaps echo isolated echo groups removing
-    base_color_value = (base_index + 1) * GRAY_SCALE_UNIT
-    denoise_img = dependencies.inner_filling(denoise_img, (base_color_value, 0, base_color_value), denoise_img)
+    denoise_img = dependencies.inner_filling(denoise_img.layers >= 0, denoise_img, base_index, radar_config, FLAG_BASE_ECHO)
 
     # Save debug img
-    if enable_debug:
-        remove_debug_img.save(debug_result_folder / (mode + "_exclude_remove.png"))
+    debug_sink.save_canvas(mode + "_exclude_remove", remove_debug_arr)
     return denoise_img
 
 
 def small_echo_group_analysis(
-        fill_img: Image,
-        denoise_img: Image, mode: str,
+        fill_img: RadarFrame,
+        denoise_img: RadarFrame, mode: str,
         small_echo_groups: List[List[Tuple[int, int]]],
-        enable_debug: bool,
-        debug_result_folder: Path
-) -> Image:
+        debug_sink: DebugSink
+) -> RadarFrame:
     # Check mode code
     is_reverse = check_velocity_mode(mode)
 
-    denoise_draw = ImageDraw.Draw(denoise_img)
     for small_group in small_echo_groups:
         # Get below echo value of current group
         # There are three cases:
         #   1. valid echo with full RGB color from large group inner filling(velocity >= 0)
         #   2. basemaps echo with two channel RGB color from basemaps echo(velocity 0)
         #   3. empty basemaps
-        below_value = denoise_img.getpixel(small_group[0])
-        # Calculate below value index using the second channel value
-        below_value_index = round(1.0 * below_value[1] / GRAY_SCALE_UNIT) - 1
+        # Calculate below value index using valid echo only
+        below_value_index = denoise_img.valid_index(small_group[0])
 
         # Calculate small group actual value index
-        current_group_value = fill_img.getpixel(small_group[0])
-        current_group_index = round(1.0 * current_group_value[0] / GRAY_SCALE_UNIT) - 1
+        current_group_index = fill_img.layer_index(small_group[0])
         # Note that the absolute value of velocity is required to be increasing in this process when below echo is valid
         if below_value_index >= 0:
             # Indicate that current group is above valid echoes
@@ -180,17 +166,18 @@ def small_echo_group_analysis(
             if not is_reverse and 0 <= current_group_index - below_value_index <= consts.LAYER_GAP_THRESHOLD:
                 # Indicate that current mode is pos
                 for echo_coordinate in small_group:
-                    denoise_draw.point(echo_coordinate, current_group_value)
+                    denoise_img.set_pixel(echo_coordinate, current_group_index)
             elif is_reverse and 0 <= below_value_index - current_group_index <= consts.LAYER_GAP_THRESHOLD:
                 # Indicate that current mode is neg
                 for echo_coordinate in small_group:
-                    denoise_draw.point(echo_coordinate, current_group_value)
+                    denoise_img.set_pixel(echo_coordinate, current_group_index)
         else:
             # Indicate that current group is above basemaps echoes or just empty
-            base_below_index = round(1.0 * below_value[0] / GRAY_SCALE_UNIT) - 1
+            base_below_index = denoise_img.layer_index(small_group[0])
             if base_below_index >= 0:
                 # Indicate that no empty but is basemaps echo
                 # Get surroundings
+                small_group_set = set(small_group)
                 surroundings = set()
                 valid_surroundings = set()
                 valid_surrounding_indexes = []
@@ -199,9 +186,8 @@ def small_echo_group_analysis(
                     for offset in SURROUNDING_OFFSETS:
                         neighbour_coordinate = (echo_coordinate[0] + offset[0], echo_coordinate[1] + offset[1])
                         # Use filled image to calculate the surrounding set instead of denoise image
-                        neighbour_value = denoise_img.getpixel(neighbour_coordinate)[1]
-                        neighbour_index = round(neighbour_value / GRAY_SCALE_UNIT) - 1
-                        if neighbour_coordinate not in small_group:
+                        neighbour_index = denoise_img.valid_index(neighbour_coordinate)
+                        if neighbour_coordinate not in small_group_set:
                             if neighbour_coordinate not in surroundings:
                                 surroundings.add(neighbour_coordinate)
                         if neighbour_index >= 0:
@@ -219,30 +205,35 @@ def small_echo_group_analysis(
                         # Check with threshold
                         if abs(current_group_index - avg_surrounding_index) <= consts.LAYER_GAP_THRESHOLD:
                             for echo_coordinate in small_group:
-                                denoise_draw.point(echo_coordinate, current_group_value)
+                                denoise_img.set_pixel(echo_coordinate, current_group_index)
                         else:
                             # Indicate that current small group exceed the gap threshold with valid surroundings
                             # Calculate approximate average value index
                             round_avg_index = round(avg_surrounding_index)
-                            round_avg_value = (round_avg_index + 1) * GRAY_SCALE_UNIT
                             for echo_coordinate in small_group:
-                                denoise_draw.point(echo_coordinate, (round_avg_value, round_avg_value, round_avg_value))
+                                denoise_img.set_pixel(echo_coordinate, round_avg_index)
                 else:
                     # Indicate that current small group has not valid surroundings
                     # Check with basemaps below index
                     if abs(current_group_index - base_below_index) <= consts.LAYER_GAP_THRESHOLD:
                         for echo_coordinate in small_group:
-                            denoise_draw.point(echo_coordinate, current_group_value)
+                            denoise_img.set_pixel(echo_coordinate, current_group_index)
             # Groups that above empty is not drawn and is filtered out
             # Because in the process of getting basemaps echo image, Image Scale small groups is removed
 
     # Save debug img
-    if enable_debug:
-        denoise_img.save(debug_result_folder / (mode + "_small_filter.png"))
+    debug_sink.save_frame(mode + "_small_filter", denoise_img)
     return denoise_img
 
 
-def layer_filter(fill_img: Image, mode: str, denoise_img: Image, layer_model: List[List[Tuple[int, int]]], enable_debug: bool, debug_result_folder: Path):
+def layer_filter(
+        fill_img: RadarFrame,
+        mode: str,
+        denoise_img: RadarFrame,
+        layer_model: dependencies.LayerModel,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+):
     """
     Execute layer filter process, for each layer, draw large trustworthy echo group and then inner filling the whole in them,
     in the meantime, collect small echo groups in Layer Scale for latter analysis
@@ -251,187 +242,155 @@ def layer_filter(fill_img: Image, mode: str, denoise_img: Image, layer_model: Li
     base_index, layer_range = check_velocity_mode(mode, len(layer_model))
 
     # Keep echo groups which size exceed size threshold that is more likely to be trustful
-    denoise_draw = ImageDraw.Draw(denoise_img)
     small_echo_groups = []
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
-    for layer_idx in layer_range:
-        # Create a debug image for each layer
-        layer_debug_img = Image.new("RGB", denoise_img.size, (0, 0, 0))
-        layer_debug_draw = ImageDraw.Draw(layer_debug_img)
-
-        # Calculate gray color value for current layer
-        layer_echo_value = (layer_idx + 1) * GRAY_SCALE_UNIT
-        echo_color = (layer_echo_value, layer_echo_value, layer_echo_value)
-
-        # Create an inner filling refer image
-        inner_fill_refer_img = Image.new("RGB", denoise_img.size, (0, 0, 0))
-        inner_fill_refer_draw = ImageDraw.Draw(inner_fill_refer_img)
-
+    # Create inner filling refer masks for all layers
+    inner_fill_refer_masks = np.zeros((len(layer_range),) + denoise_img.layers.shape, dtype=bool)
+    for mask_idx, layer_idx in enumerate(layer_range):
         # Get echo groups for current layer
-        echo_groups = dependencies.get_echo_groups(fill_img, layer_model[layer_idx])
+        xs, ys = layer_model.coordinates(layer_idx)
+        echo_groups = dependencies.label_echo_groups(fill_img.layers, xs, ys, radar_config)
+        count_metric("echo_groups/layer_" + str(layer_idx), len(echo_groups))
 
-        # Draw echo groups that bigger than size threshold
-        for echo_group in echo_groups:
+        # Collect echo groups that bigger than size threshold
+        for group_idx in range(len(echo_groups)):
             # Huge echo skip denoise
-            if len(echo_group) >= consts.SMALL_GROUP_SIZE_THRESHOLD:
-                for echo_coordinate in echo_group:
-                    denoise_draw.point(echo_coordinate, echo_color)
-                    inner_fill_refer_draw.point(echo_coordinate, echo_color)
-                    layer_debug_draw.point(echo_coordinate, cv_pairs[layer_idx][0])
+            if echo_groups.sizes[group_idx] >= consts.SMALL_GROUP_SIZE_THRESHOLD:
+                xs, ys = echo_groups.coordinates(group_idx)
+                inner_fill_refer_masks[mask_idx, ys, xs] = True
             # In the meantime get small echo groups list
             else:
-                if len(echo_group) > 0:
-                    small_echo_groups.append(echo_group)
-        # Execute inner filling for each layer with valid full RGB color
-        denoise_img = dependencies.inner_filling(inner_fill_refer_img, echo_color, denoise_img)
-        layer_debug_img = dependencies.inner_filling(inner_fill_refer_img, (255, 0, 255), layer_debug_img)
-        denoise_draw = ImageDraw.Draw(denoise_img)
-        if enable_debug:
-            layer_debug_img.save(debug_result_folder / (mode + "_layer_debug_" + str(layer_idx) + ".png"))
+                small_echo_groups.append(echo_groups[group_idx])
+
+    # Get inner holes in radar zone of large echo groups of all layers in one batch
+    zone = radar_config.zone
+    inner_holes = dependencies.get_inner_holes(inner_fill_refer_masks[(slice(None),) + zone])
+
+    palette = radar_config.palette
+    for mask_idx, layer_idx in enumerate(layer_range):
+        # Draw large echo groups of current layer and fill their inner holes, following layers overwrite former ones
+        denoise_img.layers[inner_fill_refer_masks[mask_idx]] = layer_idx
+        denoise_img.flags[inner_fill_refer_masks[mask_idx]] = 0
+        denoise_img.layers[zone][inner_holes[mask_idx]] = layer_idx
+        denoise_img.flags[zone][inner_holes[mask_idx]] = 0
+
+        # Create a debug image for each layer
+        layer_debug_arr = debug_sink.canvas(denoise_img.size)
+        if layer_debug_arr is not None:
+            layer_debug_arr[inner_fill_refer_masks[mask_idx]] = palette[layer_idx]
+            layer_debug_arr[zone][inner_holes[mask_idx]] = (255, 0, 255)
+            debug_sink.save_canvas(mode + "_layer_debug_" + str(layer_idx), layer_debug_arr)
     # Save debug image
-    if enable_debug:
-        denoise_img.save(debug_result_folder / (mode + "_smooth.png"))
+    debug_sink.save_frame(mode + "_smooth", denoise_img)
     return denoise_img, small_echo_groups
 
 
 """
 Note: image scale small group and layer scale small group are distinct. 
 """
-def get_base_echo_img(layer_model: List[List[Tuple[int, int]]], radar_img_size: Tuple[int, int], mode: str) -> Image:
+def get_base_echo_img(
+        layer_model: dependencies.LayerModel,
+        radar_img_size: Tuple[int, int],
+        mode: str,
+        radar_config: RadarConfig
+) -> RadarFrame:
     """
-    Generate an inner filled basemaps echo image with two valid channel color
-    that has remove image scale small echo groups. This image is useful for latter analysis
+    Generate an inner filled basemaps echo frame with base echo flag
+    that has remove image scale small echo groups. This frame is useful for latter analysis
     including denoise and velocity unfold
     Args:
-        layer_model: list of layer echoes
+        layer_model: layer model of the filled frame
         radar_img_size: size of radar image
         mode: a string that indicate the velocity mode
+        radar_config: radar config of the frame
 
     Returns:
-        A PIL Image Object of basemaps velocity image
+        A RadarFrame object of basemaps velocity frame
     """
     # Check mode code
     base_index, layer_range = check_velocity_mode(mode, len(layer_model))
 
-    # Create an empty image
-    base_img = Image.new("RGB", radar_img_size, (0, 0, 0))
-    base_draw = ImageDraw.Draw(base_img)
-    # Get basic values
-    base_value = GRAY_SCALE_UNIT * (base_index + 1)
-    # Use two valid channel color to distinguish basemaps echo
-    base_color = (base_value, 0, base_value)
+    # Create an empty frame
+    base_img = RadarFrame.empty(radar_img_size)
     # Iterate each layer for draw all echo as basemaps echo
+    # Use base echo flag to distinguish basemaps echo
     for layer_idx in layer_range:
-        for echo_coordinate in layer_model[layer_idx]:
-            base_draw.point(echo_coordinate, base_color)
+        xs, ys = layer_model.coordinates(layer_idx)
+        base_img.layers[ys, xs] = base_index
+        base_img.flags[ys, xs] = FLAG_BASE_ECHO
 
     # Execute inner filling which might be useful for velocity unfold
-    base_img = dependencies.inner_filling(base_img, base_color, base_img)
-
-    # Get all basemaps echo pixel coordinate
-    echo_pixel_list = []
-    radar_zone = get_radar_info("radar_zone")
-    for x in range(radar_zone[0], radar_zone[1]):
-        for y in range(radar_zone[0], radar_zone[1]):
-            # Get current pixel value
-            pixel_coordinate = (x, y)
-            pixel_value = base_img.getpixel(pixel_coordinate)[0]
-            # Calculate color value index of the pixel
-            pixel_index = round(1.0 * pixel_value / GRAY_SCALE_UNIT) - 1
-            if pixel_index != -1:
-                echo_pixel_list.append(pixel_coordinate)
+    base_img = dependencies.inner_filling(base_img.layers >= 0, base_img, base_index, radar_config, FLAG_BASE_ECHO)
 
-    # Get basemaps echo groups
-    echo_groups = dependencies.get_echo_groups(base_img, echo_pixel_list)
+    # Get all basemaps echo pixel coordinate by x first and then y
+    radar_zone = radar_config.radar_zone
+    zone_layers = base_img.layers[radar_config.zone]
+    xs, ys = np.nonzero(zone_layers.T != -1)
 
-    # Get list of basemaps echo groups that smaller than the size threshold
-    removed_groups = []
-    for echo_group in echo_groups:
-        if len(echo_group) < consts.SMALL_GROUP_SIZE_THRESHOLD:
-            removed_groups.append(echo_group)
+    # Get basemaps echo groups
+    echo_groups = dependencies.label_echo_groups(base_img.layers, xs + radar_zone[0], ys + radar_zone[0], radar_config)
 
-    # Cover the small groups with empty value for removing
-    base_draw = ImageDraw.Draw(base_img)
-    for echo_group in removed_groups:
-        for echo_coordinate in echo_group:
-            base_draw.point(echo_coordinate, (0, 0, 0))
+    # Cover basemaps echo groups that smaller than the size threshold with empty value for removing
+    removed_mask = echo_groups.select_mask(echo_groups.sizes < consts.SMALL_GROUP_SIZE_THRESHOLD)
+    base_img.layers[echo_groups.window][removed_mask] = -1
+    base_img.flags[echo_groups.window][removed_mask] = 0
 
-    # Return result image
+    # Return result frame
     return base_img
 
 
-def base_echo_fill(gray_img: Image, layer_model_len: int, mode: str) -> Image:
+def base_echo_fill(gray_img: RadarFrame, layer_model_len: int, mode: str, radar_config: RadarConfig) -> RadarFrame:
     """
     Analise all basemaps echo groups and fill them basemaps on the valid surrounding echo values
-    when surrounded ratio exceed threshold. The filling color is one valid channel RGB color.
+    when surrounded ratio exceed threshold. The filled echoes are flagged as base filled echoes.
     Args:
-        gray_img: gray value image in PIL Image object type that has basemaps echoes
+        gray_img: RadarFrame object that has basemaps echoes
         layer_model_len: len of echo layer list
         mode: string value that indicate the velocity mode
+        radar_config: radar config of the frame
 
-    Returns: a filled image in PIL Image object type
+    Returns: a filled RadarFrame object
 
     """
     # Check mode code
     base_index, _ = check_velocity_mode(mode, layer_model_len)
 
-    # get basemaps echo color value
-    base_color_value = (base_index + 1) * GRAY_SCALE_UNIT
-    base_color = (base_color_value, base_color_value, base_color_value)
-
-    # Create a refer image for grouping
-    refer_img = Image.new("RGB", gray_img.size, (0, 0, 0))
-    refer_draw = ImageDraw.Draw(refer_img)
-
-    # Iterate radar zone to get need fill area
-    radar_zone = get_radar_info("radar_zone")
-    base_echo_list = []
-    for x in range(radar_zone[0], radar_zone[1]):
-        for y in range(radar_zone[0], radar_zone[1]):
-            # Get current pixel value
-            pixel_value = gray_img.getpixel((x, y))
-            # Calculate gray value index
-            pixel_index_0 = round(pixel_value[0] / GRAY_SCALE_UNIT) - 1     # First channel value
-            pixel_index_1 = round(pixel_value[1] / GRAY_SCALE_UNIT) - 1     # Second channel value
-            # Check whether is basemaps echo or not
-            if pixel_index_0 != pixel_index_1:
-                base_echo_list.append((x, y))
-                refer_draw.point((x, y), base_color)
+    # Get need fill area in radar zone, which are basemaps echoes
+    refer_mask = np.zeros(gray_img.layers.shape, dtype=bool)
+    zone = radar_config.zone
+    refer_mask[zone] = (gray_img.layers[zone] >= 0) & ((gray_img.flags[zone] & FLAG_BASE_MASK) != 0)
+    xs, ys = np.nonzero(refer_mask.T)
 
     # Get basemaps echo groups
-    base_echo_groups = dependencies.get_echo_groups(refer_img, base_echo_list)
-    # Analise each group's surrounding
-    gray_draw = ImageDraw.Draw(gray_img)
-    for echo_group in base_echo_groups:
-        # First get surrounded valid indexes
-        surroundings = set()
-        valid_surrounding_indexes = []
-        for echo_coordinate in echo_group:
-            for offset in SURROUNDING_OFFSETS:
-                neighbour_coordinate = (echo_coordinate[0] + offset[0], echo_coordinate[1] + offset[1])
-                neighbour_value = gray_img.getpixel(neighbour_coordinate)
-                neighbour_index_0 = round(neighbour_value[0] / GRAY_SCALE_UNIT) - 1
-                neighbour_index_1 = round(neighbour_value[1] / GRAY_SCALE_UNIT) - 1
-                if neighbour_index_0 == neighbour_index_1:
-                    # Indicate that current neighbor is not basemaps echo
-                    if neighbour_coordinate not in surroundings:
-                        # Note that surroundings set might include empty pixel coord
-                        surroundings.add(neighbour_coordinate)
-                        if neighbour_index_0 >= 0:
-                            # Add valid echo indexes into list
-                            valid_surrounding_indexes.append(neighbour_index_0)
-        if len(surroundings) == 0:
-            continue
-        surrounded_ratio = len(valid_surrounding_indexes) / len(surroundings)
-        # Fill basemaps echo group with average surrounded valid echo value when exceed surrounded ratio
-        if surrounded_ratio >= consts.BASE_ECHO_SURROUNDED_RATIO_THRESHOLD:
-            # Calculate average surrounding index
-            avg_surrounding_idx = sum(valid_surrounding_indexes) / len(valid_surrounding_indexes)
-            round_avg_idx = round(avg_surrounding_idx)
-            avg_value = (round_avg_idx + 1) * GRAY_SCALE_UNIT
-            for echo_coordinate in echo_group:
-                # Note that the basemaps filling value is one valid channel RGB color
-                gray_draw.point(echo_coordinate, (avg_value, 0, 0))
+    base_echo_groups = dependencies.label_echo_groups(refer_mask, xs, ys, radar_config)
+    if len(base_echo_groups) == 0:
+        return gray_img
+
+    # Get surroundings of each group that are not basemaps echoes, note that surroundings might include empty pixels
+    group_ids, surrounding_indexes = dependencies.get_surroundings(base_echo_groups,
+                                                                   (gray_img.flags & FLAG_BASE_MASK) != 0)
+    surrounding_layers = gray_img.layers.ravel()[surrounding_indexes]
+    is_valid = surrounding_layers >= 0
+
+    # Count surroundings, valid surroundings and sum valid surrounding indexes of each group
+    group_num = len(base_echo_groups)
+    surrounding_nums = np.bincount(group_ids, minlength=group_num)
+    valid_surrounding_nums = np.bincount(group_ids[is_valid], minlength=group_num)
+    valid_index_sums = np.bincount(group_ids[is_valid], weights=surrounding_layers[is_valid], minlength=group_num)
+
+    # Fill basemaps echo groups with average surrounded valid echo value when exceed surrounded ratio
+    is_filled = np.zeros(group_num, dtype=bool)
+    has_surroundings = surrounding_nums > 0
+    is_filled[has_surroundings] = (valid_surrounding_nums[has_surroundings] / surrounding_nums[has_surroundings]
+                                   >= consts.BASE_ECHO_SURROUNDED_RATIO_THRESHOLD)
+    # Round half to even as built-in round
+    fill_indexes = np.zeros(group_num + 1, dtype=np.int8)
+    fill_indexes[1:][is_filled] = np.rint(valid_index_sums[is_filled] / valid_surrounding_nums[is_filled])
+
+    # Note that the basemaps filling echo is flagged as base filled echo
+    window = base_echo_groups.window
+    filled_mask = base_echo_groups.select_mask(is_filled)
+    gray_img.layers[window][filled_mask] = fill_indexes[base_echo_groups.labels[filled_mask]]
+    gray_img.flags[window][filled_mask] = FLAG_BASE_FILLED
     return gray_img
 
 
@@ -1,8 +1,10 @@
-from PIL import Image, ImageDraw
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT, SURROUNDING_OFFSETS
+import numpy as np
+from MesoDetect.DataIO.consts import SURROUNDING_OFFSETS, FLAG_BASE_ECHO
 from MesoDetect.RadarDenoise import dependencies, consts
-from MesoDetect.DataIO.utils import get_radar_info, get_color_bar_info
-from pathlib import Path
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
+from MesoDetect.DataIO.debug_sink import DebugSink
+from MesoDetect.DataIO.metrics import count_metric
 """
 crossed echo groups:
     1. small groups:
@@ -19,46 +21,42 @@ crossed echo groups:
 """
     Interface: integrate_velocity_mode
 """
-def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool, debug_result_folder: Path) -> Image:
+def integrate_velocity_mode(
+        neg_img: RadarFrame,
+        pos_img: RadarFrame,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+) -> RadarFrame:
     """
-    Integrate neg and pos velocity mode denoise result image into complete radar image
+    Integrate neg and pos velocity mode denoise result frame into complete radar frame
     Args:
-        neg_img: PIL Image object of neg denoise image
-        pos_img: PIL Image object of pos denoise image
-        enable_debug: Boolean flag, True for enabling debug mode and False for disabling
-        debug_result_folder: folder path for containing debug result image
+        neg_img: RadarFrame object of neg denoise frame
+        pos_img: RadarFrame object of pos denoise frame
+        debug_sink: debug sink for debug images of the process
+        radar_config: radar config of the frames
 
     Returns:
-    PIL Image object of integrated image
+    RadarFrame object of integrated frame
     """
     print("[Info] Start integrating two velocity mode images...")
-    # Create a integration result image
-    integrate_img = Image.new("RGB", neg_img.size, (0, 0, 0))
+    # Create a integration result frame
+    integrate_img = RadarFrame.empty(neg_img.size)
 
    # Draw separate echoes and get crossed echo groups
-    crossed_groups, refer_img = get_crossed_echo_groups(neg_img, pos_img, integrate_img, enable_debug, debug_result_folder)
-
-    integrate_draw = ImageDraw.Draw(integrate_img)
-    # Debug image for surrounding analysis
-    surrounding_debug_img = Image.new("RGB", neg_img.size, (0, 0, 0))
-    surrounding_debug_draw = ImageDraw.Draw(surrounding_debug_img)
+    crossed_groups, refer_mask = get_crossed_echo_groups(neg_img, pos_img, integrate_img, debug_sink, radar_config)
 
     # Iterate each group and check the surroundings
-    radar_zone = get_radar_info("radar_zone")
-    cv_pairs = get_color_bar_info("color_velocity_pairs")
-    pos_unfold_idx = len(cv_pairs) - 1
+    pos_unfold_idx = radar_config.layer_num - 1
     for crossed_group in crossed_groups:
+        crossed_group_set = set(crossed_group)
         # Get unrepeated surroundings
         surrounding_coords = set()
         for echo_coordinate in crossed_group:
             for offset in SURROUNDING_OFFSETS:
                 # Get neighbour coordinate with offset
                 neighbour_coordinate = (echo_coordinate[0] + offset[0], echo_coordinate[1] + offset[1])
-                # Get neighbour value
-                neighbour_value = refer_img.getpixel(neighbour_coordinate)
-                neighbour_index = round(neighbour_value[0] / GRAY_SCALE_UNIT) - 1
                 # Surrounding check
-                if neighbour_index == -1:
+                if not refer_mask[neighbour_coordinate[1], neighbour_coordinate[0]]:
                     if neighbour_coordinate not in surrounding_coords:
                         surrounding_coords.add(neighbour_coordinate)
         if len(surrounding_coords) == 0:
@@ -72,10 +70,8 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
         # that channel one value not equal to channel two value
         valid_surroundings = []
         for coord in surrounding_coords:
-            # Get pixel value from neg image
-            surrounding_value = neg_img.getpixel(coord)
-            # Calculate index value
-            surrounding_index = round(surrounding_value[0] / GRAY_SCALE_UNIT) - 1
+            # Get index value from neg frame
+            surrounding_index = neg_img.layer_index(coord)
             if surrounding_index >= 0:
                 valid_surroundings.append(surrounding_index)
         # Calculate valid surrounding ratio
@@ -85,19 +81,14 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
             # Indicates that current group is going to add upon neg velocity mode echoes
             # Draw above echo group
             for coord in crossed_group:
-                pos_pixel_value = pos_img.getpixel(coord)
-                integrate_draw.point(coord, pos_pixel_value)
-                surrounding_debug_draw.point(coord, pos_pixel_value)
+                integrate_img.copy_pixel(coord, pos_img)
             # Execute folded echoes check and cover folded echoes if exceed threshold
             total_gap_sum = 0
             # Calculate average layer gap of the crossed echo
             for coord in crossed_group:
-                # Get pixel value
-                neg_pixel_value = neg_img.getpixel(coord)
-                pos_pixel_value = pos_img.getpixel(coord)
-                # Calculate value index
-                neg_pixel_index = round(neg_pixel_value[0] / GRAY_SCALE_UNIT) - 1
-                pos_pixel_index = round(pos_pixel_value[0] / GRAY_SCALE_UNIT) - 1
+                # Get value index
+                neg_pixel_index = neg_img.layer_index(coord)
+                pos_pixel_index = pos_img.layer_index(coord)
                 # Calculate distance
                 layer_gap = pos_pixel_index - neg_pixel_index
                 total_gap_sum += layer_gap
@@ -105,10 +96,7 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
             if avg_layer_gap >= consts.FOLDED_ECHO_CHECK_THRESHOLD:
                 # Indicate that current group is folded and on neg basemaps
                 for coord in crossed_group:
-                    neg_pixel_value = (0 + 1) * GRAY_SCALE_UNIT
-                    neg_pixel_color = (neg_pixel_value, 0, neg_pixel_value)
-                    integrate_draw.point(coord, neg_pixel_color)
-                    surrounding_debug_draw.point(coord, neg_pixel_color)
+                    integrate_img.set_pixel(coord, 0, FLAG_BASE_ECHO)
                 continue
             # When the crossed echo group does not folded echoes
             # Then check surrounding shear for small group, while large group is trustful and skip analysis
@@ -119,7 +107,7 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
                     # Check each neighbour for the current group coordinate
                     for offset in SURROUNDING_OFFSETS:
                         neighbour_coord = (group_coord[0] + offset[0], group_coord[1] + offset[1])
-                        if neighbour_coord not in crossed_group:
+                        if neighbour_coord not in crossed_group_set:
                             # Indicate that current group coord is outer scope echo
                             group_outer_scopes.append(group_coord)
                             break
@@ -127,18 +115,16 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
                 group_layer_gap_sum = 0
                 for outer_coord in group_outer_scopes:
                     # Get current outer point value index
-                    outer_value = integrate_img.getpixel(outer_coord)
-                    outer_index = round(outer_value[0] / GRAY_SCALE_UNIT) - 1
+                    outer_index = integrate_img.layer_index(outer_coord)
                     outer_layer_gap_sum = 0
                     outer_layer_gap_num = 0
                     # Get neighbour coord for current outer coordinate
                     for offset in SURROUNDING_OFFSETS:
                         neighbour_coord = (outer_coord[0] + offset[0], outer_coord[1] + offset[1])
                         # Filter out group coordinate
-                        if neighbour_coord in crossed_group:
+                        if neighbour_coord in crossed_group_set:
                             continue
-                        neighbour_value = integrate_img.getpixel(neighbour_coord)
-                        neighbour_index = round(neighbour_value[0] / GRAY_SCALE_UNIT) - 1
+                        neighbour_index = integrate_img.layer_index(neighbour_coord)
                         if neighbour_index >= 0:
                             outer_layer_gap_sum += abs(outer_index - neighbour_index)
                             outer_layer_gap_num += 1
@@ -155,26 +141,19 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
                     group_layer_gap_avg = 0
                 if group_layer_gap_avg > consts.CROSSED_SMALL_GROUP_SURROUNDING_GAP_THRESHOLD:
                     for coord in crossed_group:
-                        echo_value = neg_img.getpixel(coord)
-                        integrate_draw.point(coord, echo_value)
-                        surrounding_debug_draw.point(coord, echo_value)
+                        integrate_img.copy_pixel(coord, neg_img)
         else:
             # Indicates that current group is going to add upon pos velocity mode echoes
             # Draw above echo group
             for coord in crossed_group:
-                neg_pixel_value = neg_img.getpixel(coord)
-                integrate_draw.point(coord, neg_pixel_value)
-                surrounding_debug_draw.point(coord, neg_pixel_value)
+                integrate_img.copy_pixel(coord, neg_img)
             # Execute folded echoes check and cover folded echoes if exceed threshold
             total_gap_sum = 0
             # Calculate average layer gap of the crossed echo
             for coord in crossed_group:
-                # Get pixel value
-                neg_pixel_value = neg_img.getpixel(coord)
-                pos_pixel_value = pos_img.getpixel(coord)
-                # Calculate value index
-                neg_pixel_index = round(neg_pixel_value[0] / GRAY_SCALE_UNIT) - 1
-                pos_pixel_index = round(pos_pixel_value[0] / GRAY_SCALE_UNIT) - 1
+                # Get value index
+                neg_pixel_index = neg_img.layer_index(coord)
+                pos_pixel_index = pos_img.layer_index(coord)
                 # Calculate distance
                 layer_gap = pos_pixel_index - neg_pixel_index
                 total_gap_sum += layer_gap
@@ -182,10 +161,7 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
             if avg_layer_gap >= consts.FOLDED_ECHO_CHECK_THRESHOLD:
                 # Indicate that current group is folded and on neg basemaps
                 for coord in crossed_group:
-                    pos_pixel_value = (pos_unfold_idx + 1) * GRAY_SCALE_UNIT
-                    pos_pixel_color = (pos_pixel_value, 0, pos_pixel_value)
-                    integrate_draw.point(coord, pos_pixel_color)
-                    surrounding_debug_draw.point(coord, pos_pixel_color)
+                    integrate_img.set_pixel(coord, pos_unfold_idx, FLAG_BASE_ECHO)
                 continue
             # When the crossed echo group does not folded echoes
             # Then check surrounding shear for small group, while large group is trustful and skip analysis
@@ -196,7 +172,7 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
                     # Check each neighbour for the current group coordinate
                     for offset in SURROUNDING_OFFSETS:
                         neighbour_coord = (group_coord[0] + offset[0], group_coord[1] + offset[1])
-                        if neighbour_coord not in crossed_group:
+                        if neighbour_coord not in crossed_group_set:
                             # Indicate that current group coord is outer scope echo
                             group_outer_scopes.append(group_coord)
                             break
@@ -204,18 +180,16 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
                 group_layer_gap_sum = 0
                 for outer_coord in group_outer_scopes:
                     # Get current outer point value index
-                    outer_value = integrate_img.getpixel(outer_coord)
-                    outer_index = round(outer_value[0] / GRAY_SCALE_UNIT) - 1
+                    outer_index = integrate_img.layer_index(outer_coord)
                     outer_layer_gap_sum = 0
                     outer_layer_gap_num = 0
                     # Get neighbour coord for current outer coordinate
                     for offset in SURROUNDING_OFFSETS:
                         neighbour_coord = (outer_coord[0] + offset[0], outer_coord[1] + offset[1])
                         # Filter out group coordinate
-                        if neighbour_coord in crossed_group:
+                        if neighbour_coord in crossed_group_set:
                             continue
-                        neighbour_value = integrate_img.getpixel(neighbour_coord)
-                        neighbour_index = round(neighbour_value[0] / GRAY_SCALE_UNIT) - 1
+                        neighbour_index = integrate_img.layer_index(neighbour_coord)
                         if neighbour_index >= 0:
                             outer_layer_gap_sum += abs(outer_index - neighbour_index)
                             outer_layer_gap_num += 1
@@ -232,49 +206,50 @@ def integrate_velocity_mode(neg_img: Image, pos_img: Image, enable_debug: bool,
                     group_layer_gap_avg = 0
                 if group_layer_gap_avg > consts.CROSSED_SMALL_GROUP_SURROUNDING_GAP_THRESHOLD:
                     for coord in crossed_group:
-                        echo_value = pos_img.getpixel(coord)
-                        integrate_draw.point(coord, echo_value)
-                        surrounding_debug_draw.point(coord, echo_value)
+                        integrate_img.copy_pixel(coord, pos_img)
 
-    if enable_debug:
-        surrounding_debug_img.save(debug_result_folder / "surrounding_fill.png")
-        integrate_img.save(debug_result_folder / "denoised_integrate.png")
+    if debug_sink.enabled:
+        # Crossed echoes are empty in integrated frame until drawn by surrounding analysis
+        surrounding_debug_img = RadarFrame(np.where(refer_mask, integrate_img.layers, -1).astype(np.int8),
+                                           np.where(refer_mask, integrate_img.flags, 0).astype(np.uint8))
+        debug_sink.save_frame("surrounding_fill", surrounding_debug_img)
+        debug_sink.save_frame("denoised_integrate", integrate_img)
 
     print("[Info] Velocity integration success.")
     return integrate_img
 
 
-def get_crossed_echo_groups(neg_img: Image, pos_img: Image, integrate_img: Image, enable_debug: bool, debug_result_folder: Path):
-    integrate_draw = ImageDraw.Draw(integrate_img)
-    # Iterate through both neg and pos image to get uncrossed echoes
-    radar_zone = get_radar_info("radar_zone")
-    crossed_echoes = []
-    for x in range(radar_zone[0], radar_zone[1]):
-        for y in range(radar_zone[0], radar_zone[1]):
-            # Get pixel value for both neg and pos image
-            neg_pixel_value = neg_img.getpixel((x, y))
-            pos_pixel_value = pos_img.getpixel((x, y))
-            # Calculate gray value index of the pixel value
-            neg_pixel_index = round(neg_pixel_value[0] / GRAY_SCALE_UNIT) - 1
-            pos_pixel_index = round(pos_pixel_value[0] / GRAY_SCALE_UNIT) - 1
-            # Check both index to decide echo get crossed or not
-            if neg_pixel_index != -1 and pos_pixel_index == -1:
-                integrate_draw.point((x, y), neg_pixel_value)
-            elif neg_pixel_index == -1 and pos_pixel_index != -1:
-                integrate_draw.point((x, y), pos_pixel_value)
-            elif neg_pixel_index != -1 and pos_pixel_index != -1:
-                crossed_echoes.append((x, y))
+def get_crossed_echo_groups(
+        neg_img: RadarFrame,
+        pos_img: RadarFrame,
+        integrate_img: RadarFrame,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+):
+    # Check both neg and pos frame in radar zone to get uncrossed echoes
+    zone = radar_config.zone
+    neg_echo_mask = neg_img.layers[zone] != -1
+    pos_echo_mask = pos_img.layers[zone] != -1
+    # Check both masks to decide echo get crossed or not
+    neg_only_mask = neg_echo_mask & ~pos_echo_mask
+    pos_only_mask = pos_echo_mask & ~neg_echo_mask
+    for source_img, source_mask in ((neg_img, neg_only_mask), (pos_img, pos_only_mask)):
+        integrate_img.layers[zone][source_mask] = source_img.layers[zone][source_mask]
+        integrate_img.flags[zone][source_mask] = source_img.flags[zone][source_mask]
 
-    # Create a refer image for crossed echo grouping
-    refer_img = Image.new("RGB", neg_img.size, (0, 0, 0))
-    refer_draw = ImageDraw.Draw(refer_img)
-    for echo_coordinate in crossed_echoes:
-        refer_draw.point(echo_coordinate, consts.REFER_IMG_COLOR)
-    if enable_debug:
-        refer_img.save(debug_result_folder / "crossed_refer.png")
+    # Create a refer mask for crossed echo grouping
+    refer_mask = np.zeros(neg_img.layers.shape, dtype=bool)
+    refer_mask[zone] = neg_echo_mask & pos_echo_mask
+    refer_arr = debug_sink.canvas(neg_img.size)
+    if refer_arr is not None:
+        refer_arr[refer_mask] = consts.REFER_IMG_COLOR
+        debug_sink.save_canvas("crossed_refer", refer_arr)
 
-    # Get crossed echo groups
-    crossed_groups = dependencies.get_echo_groups(refer_img, crossed_echoes)
+    # Get crossed echoes by x first and then y
+    xs, ys = np.nonzero(refer_mask.T)
 
-    return crossed_groups, refer_img
+    # Get crossed echo groups
+    crossed_groups = dependencies.label_echo_groups(refer_mask, xs, ys, radar_config)
+    count_metric("crossed_groups", len(crossed_groups))
 
+    return crossed_groups, refer_mask
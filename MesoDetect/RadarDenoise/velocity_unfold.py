@@ -1,56 +1,60 @@
-from PIL import Image, ImageDraw
+import numpy as np
 from MesoDetect.RadarDenoise import dependencies, consts
-from MesoDetect.DataIO.consts import GRAY_SCALE_UNIT, SURROUNDING_OFFSETS
+from MesoDetect.DataIO.consts import SURROUNDING_OFFSETS, FLAG_UNFOLDED
+from MesoDetect.DataIO.radar_frame import RadarFrame
+from MesoDetect.DataIO.radar_config import RadarConfig
+from MesoDetect.DataIO.debug_sink import DebugSink
 from colorama import Fore, Style
-from pathlib import Path
 from typing import List, Tuple
 
-def unfold_echoes(integrated_img: Image, enable_debug: bool, debug_result_folder: Path) -> Image:
+def unfold_echoes(
+        integrated_img: RadarFrame,
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+) -> RadarFrame:
     """
-        Process folded echoes from given integrated radar image.
+        Process folded echoes from given integrated radar frame.
     Args:
-        integrated_img: integrated radar image in PIL object type
-        enable_debug:
-        debug_result_folder:
+        integrated_img: integrated radar frame in RadarFrame object type
+        debug_sink: debug sink for debug images of the process
+        radar_config: radar config of the frame
 
     Returns:
 
     """
     print("[Info] Start unfolding echoes...")
     # Get layer model of integrated image
-    layer_model = dependencies.get_layer_model(integrated_img)
+    layer_model = dependencies.get_layer_model(integrated_img, radar_config)
 
     # Note that using copy to separate the tow mode process in case of interference
     unfold_img = integrated_img.copy()
 
     # Neg unfolding
-    unfold_img = folded_echo_analysis(layer_model, integrated_img, unfold_img, "neg", enable_debug, debug_result_folder)
+    unfold_img = folded_echo_analysis(layer_model, integrated_img, unfold_img, "neg", debug_sink, radar_config)
 
     # Pos unfolding
-    unfold_img = folded_echo_analysis(layer_model, integrated_img, unfold_img, "pos", enable_debug, debug_result_folder)
+    unfold_img = folded_echo_analysis(layer_model, integrated_img, unfold_img, "pos", debug_sink, radar_config)
 
     print("[Info] Echoes unfolding success.")
     return unfold_img
 
 
 def folded_echo_analysis(
-        layer_model: List[List[Tuple[int, int]]],
-        integrated_img: Image,
-        unfold_img: Image,
+        layer_model: dependencies.LayerModel,
+        integrated_img: RadarFrame,
+        unfold_img: RadarFrame,
         mode: str,
-        enable_debug: bool,
-        debug_result_folder: Path
-) -> Image:
+        debug_sink: DebugSink,
+        radar_config: RadarConfig
+) -> RadarFrame:
     # Check mode code
     if mode == "neg":
         target_indexes = range(len(layer_model) - consts.FOLDED_LAYER_NUM, len(layer_model))
-        unfolded_value = (0 + 1) * GRAY_SCALE_UNIT
-        unfolded_color = (unfolded_value, unfolded_value, unfolded_value)
+        unfolded_index = 0
         is_reversed = False
     elif mode == "pos":
         target_indexes = range(0 + consts.FOLDED_LAYER_NUM - 1, -1, -1)
-        unfolded_value = (len(layer_model) - 1 + 1) * GRAY_SCALE_UNIT
-        unfolded_color = (unfolded_value, unfolded_value, unfolded_value)
+        unfolded_index = len(layer_model) - 1
         is_reversed = True
     else:
         print(Fore.RED + f"[Error] Invalid mode code: {mode} for `folded_echo_analysis` call." + Style.RESET_ALL)
@@ -60,24 +64,21 @@ def folded_echo_analysis(
     half_index = round(len(layer_model) / 2) - 1
 
     # Debug image
-    debug_img = Image.new("RGB", integrated_img.size, (0, 0, 0))
-    debug_draw = ImageDraw.Draw(debug_img)
+    debug_arr = debug_sink.canvas(integrated_img.size)
 
-    # Get refer image for target echoes grouping
-    refer_img = Image.new("RGB", integrated_img.size, (0, 0, 0))
-    refer_draw = ImageDraw.Draw(refer_img)
-    # Get refer image color
-    refer_img_color = consts.REFER_IMG_COLOR
+    # Get refer mask for target echoes grouping
+    refer_mask = np.zeros(integrated_img.layers.shape, dtype=bool)
 
-    unfold_draw = ImageDraw.Draw(unfold_img)
-    target_echo_list = []
+    target_xs, target_ys = [], []
     for layer_idx in target_indexes:
-        for echo_coord in layer_model[layer_idx]:
-            target_echo_list.append(echo_coord)
-            refer_draw.point(echo_coord, refer_img_color)
+        xs, ys = layer_model.coordinates(layer_idx)
+        refer_mask[ys, xs] = True
+        target_xs.append(xs)
+        target_ys.append(ys)
 
     # Get target echo groups
-    target_echo_groups = dependencies.get_echo_groups(refer_img, target_echo_list)
+    target_echo_groups = dependencies.label_echo_groups(refer_mask, np.concatenate(target_xs),
+                                                        np.concatenate(target_ys), radar_config)
 
     # Analise each target echo group
     for echo_group in target_echo_groups:
@@ -87,15 +88,12 @@ def folded_echo_analysis(
         for coord in echo_group:
             for offset in SURROUNDING_OFFSETS:
                 neighbour_coord = (coord[0] + offset[0], coord[1] + offset[1])
-                # Extract current pixel color from refer image to decide whether is surrounding or not
-                neighbour_refer_value = refer_img.getpixel(neighbour_coord)
-                neighbour_refer_index = round(neighbour_refer_value[0] / GRAY_SCALE_UNIT) - 1
-                if neighbour_refer_index == -1:
+                # Check refer mask to decide whether is surrounding or not
+                if not refer_mask[neighbour_coord[1], neighbour_coord[0]]:
                     # Indicate that current neighbour pixel is not in the group
                     if neighbour_coord not in surroundings:
                         surroundings.add(neighbour_coord)
-                        neighbour_value = integrated_img.getpixel(neighbour_coord)
-                        neighbour_index = round(neighbour_value[0] / GRAY_SCALE_UNIT) - 1
+                        neighbour_index = integrated_img.layer_index(neighbour_coord)
                         if neighbour_index >= 0:
                             valid_surrounding_indexes.append(neighbour_index)
                             if not is_reversed and neighbour_index <= half_index:
@@ -112,12 +110,12 @@ def folded_echo_analysis(
                 opposite_surrounded_ratio = len(opposite_mode_indexes) / len(surroundings)
                 if opposite_surrounded_ratio >= consts.OPPOSITE_SURROUNDED_THRESHOLD:
                     for coord in echo_group:
-                        unfold_draw.point(coord, unfolded_color)
-                        debug_draw.point(coord, (0, 255, 0))
+                        unfold_img.set_pixel(coord, unfolded_index, FLAG_UNFOLDED)
+                        if debug_arr is not None:
+                            debug_arr[coord[1], coord[0]] = (0, 255, 0)
 
     # Save debug image
-    if enable_debug:
-        debug_img.save(debug_result_folder / (mode + "_unfold_debug.png"))
-        unfold_img.save(debug_result_folder / "unfold.png")
+    debug_sink.save_canvas(mode + "_unfold_debug", debug_arr)
+    debug_sink.save_frame("unfold", unfold_img)
 
     return unfold_img
@@ -1,15 +1,34 @@
 import time
+import itertools
+import functools
+import random
+import asyncio
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
 from colorama import Fore, Style
-from MesoDetect.DataIO.data_config import setup_config
+from PIL import Image
+from MesoDetect.DataIO.data_config import setup_config, get_station_config
+from MesoDetect.DataIO.radar_config import RadarConfig
 from MesoDetect.DataIO.preprocessor import radar_image_preprocess
+from MesoDetect.DataIO.watcher import watch_radar_images
+from MesoDetect.DataIO.frame_store import get_frame_key, load_stored_frame, save_stored_frame
 from MesoDetect.RadarDenoise.denoise import radar_denoise
-from MesoDetect.DataIO.utils import visualize_result, pack_detection_result, print_detection_result
+from MesoDetect.DataIO.utils import (visualize_result, get_visualization_img, pack_detection_result,
+                                     print_detection_result)
 from MesoDetect.ImmerseSimulation.peak_detector import get_extrema_regions
 from MesoDetect.MesocycloneAnalysis.meso_analysis import opposite_extrema_analysis
-from typing import Union, Optional, List, Callable
+from typing import Union, Optional, List, Callable, Tuple, Iterable, Iterator, AsyncIterable, AsyncIterator
 from pathlib import Path
-from MesoDetect.DataIO.consts import DetectionResult
-from MesoDetect.DataIO.utils import get_folder_image_paths, check_output_folder
+from MesoDetect.DataIO.consts import (DetectionResult, ENABLE_FRAME_STORE, FRAME_STORE_FOLDER, DEFAULT_DECODER_ENGINE,
+                                      BATCH_CHUNK_SIZE, BATCH_MAX_TASKS_PER_CHILD, ASYNC_MAX_IN_FLIGHT,
+                                      WATCH_QUEUE_SIZE, WATCH_POLL_INTERVAL, DEBUG_FORMATS, DEFAULT_DEBUG_FORMAT,
+                                      DEBUG_BUNDLE_NAME, DEFAULT_RESULT_RENDER_MODE, PROFILE_FOLDER_NAME,
+                                      PROFILE_SAMPLE_RATE)
+from MesoDetect.DataIO.debug_sink import BundleDebugSink, flush_debug_bundles
+from MesoDetect.DataIO.metrics import collect_metrics, record_stage, count_metric
+from MesoDetect.DataIO.utils import scan_folder_image_paths, check_output_folder
 
 
 def meso_detect_with_progress(
@@ -24,26 +43,26 @@ def meso_detect_with_progress(
     setup_result = setup_config(img_path, output_folder_path, "", True)
     if setup_result is None:
         return None
-    station_num, resolved_img_path, output_path = setup_result
+    station_num, resolved_img_path, output_path, radar_config = setup_result
     step += 1
     update_progress(step, total_steps)
 
     # 2. Preprocess image
-    gray_img = radar_image_preprocess(resolved_img_path, station_num, output_path, False)
+    gray_img = radar_image_preprocess(resolved_img_path, station_num, output_path, False, radar_config=radar_config)
     if gray_img is None:
         return None
     step += 1
     update_progress(step, total_steps)
 
     # 3. Denoise
-    unfold_img = radar_denoise(gray_img, output_path, False)
+    unfold_img = radar_denoise(gray_img, output_path, False, radar_config)
     if unfold_img is None:
         return None
     step += 1
     update_progress(step, total_steps)
 
     # 4. Immerse simulation
-    immerse_result = get_extrema_regions(unfold_img, output_path, False)
+    immerse_result = get_extrema_regions(unfold_img, output_path, False, radar_config)
     if immerse_result is None:
         return None
     neg_regions, pos_regions = immerse_result
@@ -51,11 +70,11 @@ def meso_detect_with_progress(
     update_progress(step, total_steps)
 
     # 5. Mesocyclone analysis
-    meso_list = opposite_extrema_analysis(unfold_img, neg_regions, pos_regions, output_path, False)
+    meso_list = opposite_extrema_analysis(unfold_img, neg_regions, pos_regions, output_path, False, radar_config)
     if meso_list is None:
         return None
 
-    result = pack_detection_result(station_num, resolved_img_path, unfold_img, meso_list, output_path)
+    result = pack_detection_result(station_num, resolved_img_path, unfold_img, meso_list, output_path, radar_config)
     step += 1
     update_progress(step, total_steps)
 
@@ -68,7 +87,13 @@ def meso_detect_with_progress(
 def meso_detect(
         img_path: Union[str, Path],
         output_folder_path: Union[str, Path],
-        enable_debug_mode: bool = False
+        enable_debug_mode: bool = False,
+        debug_format: str = DEFAULT_DEBUG_FORMAT,
+        render_mode: str = DEFAULT_RESULT_RENDER_MODE,
+        enable_profile: bool = False,
+        enable_memory_trace: bool = False,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
 ) -> Optional[list[DetectionResult]]:
     start = time.time()
     print("----------------------------------")
@@ -84,9 +109,11 @@ def meso_detect(
     if setup_result is None:
         print(Fore.RED + "[Error] Detection config data setup failed." + Style.RESET_ALL)
         return None
-    station_num, resolved_img_path, output_path = setup_result
+    station_num, resolved_img_path, output_path, radar_config = setup_result
 
-    detection_result = detect_mesocyclone(resolved_img_path, output_path, station_num, enable_debug_mode)
+    detection_result = detect_mesocyclone(resolved_img_path, output_path, station_num, enable_debug_mode,
+                                          radar_config, enable_frame_store, frame_store_folder, debug_format,
+                                          render_mode, enable_profile, enable_memory_trace)
     if detection_result is None:
         print(Fore.RED + "[Error] Meso detection process failed." + Style.RESET_ALL)
         return None
@@ -102,8 +129,38 @@ def meso_detect(
 def meso_batch_detect(
         img_folder_path: Union[str, Path],
         output_folder_path: Union[str, Path],
-        enable_debug_mode: bool = False
+        enable_debug_mode: bool = False,
+        worker_num: int = 1,
+        chunk_size: int = BATCH_CHUNK_SIZE,
+        max_tasks_per_child: Optional[int] = BATCH_MAX_TASKS_PER_CHILD,
+        enable_profile: bool = False,
+        profile_sample_rate: float = PROFILE_SAMPLE_RATE,
+        enable_memory_trace: bool = False,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
 ) -> Optional[list[DetectionResult]]:
+    """
+    Detects mesocyclones of all radar images in given folder. Images are scanned lazily, so detection starts
+    before the whole folder is listed. With more than one worker, images are detected in a process pool,
+    and results are still returned in image order.
+
+    Args:
+        img_folder_path: folder path of radar images of the same station.
+        output_folder_path: folder path for detection results.
+        enable_debug_mode: whether to enable debug mode.
+        worker_num: number of worker processes, images are detected in current process if not more than 1.
+        chunk_size: number of images submitted to a worker process at a time.
+        max_tasks_per_child: number of images a worker process detects before it is replaced,
+            None for keeping worker processes until all images are detected.
+        enable_profile: whether to profile detection stages of sampled images.
+        profile_sample_rate: ratio of images randomly sampled for profiling when profiling is enabled.
+        enable_memory_trace: whether to trace memory usage of detection stages into detection metrics.
+        enable_frame_store: whether to reuse preprocessed frames stored by earlier detections of the same images.
+        frame_store_folder: folder of stored preprocessed frames.
+
+    Returns:
+        detection results in image order if all images are detected successfully, None otherwise.
+    """
     start = time.time()
     print("----------------------------------")
     print("[Info] Start mesocyclone batch detection.")
@@ -114,48 +171,63 @@ def meso_batch_detect(
     # And extract station numbe from formatted image name
     station_num: str = ""
 
-    # Get valid image paths from given input folder
-    radar_img_paths = get_folder_image_paths(img_folder_path)
+    # Lazily scan valid image paths from given input folder
+    radar_img_paths = scan_folder_image_paths(img_folder_path, ordered=False)
 
-    # Check extraction result
-    if len(radar_img_paths) == 0:
+    # Get sample image for config setup
+    sample_img_path = next(radar_img_paths, None)
+    if sample_img_path is None:
         print(Fore.RED + "[Error] No valid image file in given directory." + Style.RESET_ALL)
         return None
-
-    # Get sample image for config setup
-    sample_img_path = radar_img_paths[0]
+    radar_img_paths = itertools.chain([sample_img_path], radar_img_paths)
     setup_result = setup_config(sample_img_path, output_folder_path, station_num, enable_default_config)
 
     # Check setup result
     if setup_result is None:
         print(Fore.RED + "[Error] Detection config data setup failed." + Style.RESET_ALL)
         return None
-    station_num, _, _ = setup_result
+    # Station radar config profile is shared by all images in the folder
+    station_num, _, _, radar_config = setup_result
+
+    # Sample images for profiling as they are scanned
+    profiled_img_paths = ((radar_img_path, enable_profile and random.random() < profile_sample_rate)
+                          for radar_img_path in radar_img_paths)
 
     # Batch process
     detection_results: List[DetectionResult] = []
-    for img_num, radar_img_path in enumerate(radar_img_paths, start=1):
-        print(f"---[Info] Image {img_num} Mesocyclone Detection:")
-        batch_start = time.time()
-
-        # Extract image name from image path
-        process_result_folder_name = radar_img_path.as_posix().split("/")[-1].split(".")[0]
-        # Create a folder with the extracted image name under given output directory
-        result_output_path = check_output_folder(output_folder_path, process_result_folder_name)
-        if result_output_path is None:
-            print(Fore.RED + "[Error] Create result output folder failed." + Style.RESET_ALL)
-            return None
-        print(f"[Info] Detection result image folder path: {result_output_path}.")
-
-        detection_result = detect_mesocyclone(radar_img_path, result_output_path, station_num, enable_debug_mode)
-        if detection_result is None:
-            print(Fore.RED + "[Error] Meso detection process failed." + Style.RESET_ALL)
-            return None
-        batch_end = time.time()
-        batch_duration = batch_end - batch_start
-        print(f"---[Info] Image {img_num} Mesocyclone Complete.")
-        print(f"---[Info] Duration of batch execution: {batch_duration:.4f} seconds")
-        detection_results.append(detection_result)
+    if worker_num > 1:
+        print(f"[Info] Detecting images with {worker_num} worker processes.")
+        # Tasks are generated as images are scanned, pool consumes them while earlier images are detected
+        batch_tasks = ((radar_img_path, output_folder_path, station_num, enable_debug_mode, profile_flag,
+                        enable_memory_trace) for radar_img_path, profile_flag in profiled_img_paths)
+        # Workers build their own radar config from config data instead of reading or writing config file
+        with multiprocessing.Pool(processes=worker_num, initializer=init_batch_worker,
+                                  initargs=(radar_config.to_dict(), enable_frame_store, frame_store_folder),
+                                  maxtasksperchild=max_tasks_per_child) as pool:
+            for img_num, (detection_result, batch_duration) in enumerate(
+                    pool.imap(run_batch_worker_task, batch_tasks, chunksize=max(chunk_size, 1)), start=1):
+                if detection_result is None:
+                    print(Fore.RED + "[Error] Meso detection process failed." + Style.RESET_ALL)
+                    return None
+                print(f"---[Info] Image {img_num} Mesocyclone Complete.")
+                print(f"---[Info] Duration of batch execution: {batch_duration:.4f} seconds")
+                detection_results.append(detection_result)
+    else:
+        for img_num, (radar_img_path, profile_flag) in enumerate(profiled_img_paths, start=1):
+            print(f"---[Info] Image {img_num} Mesocyclone Detection:")
+            batch_start = time.time()
+
+            detection_result = detect_batch_image(radar_img_path, output_folder_path, station_num, enable_debug_mode,
+                                                  radar_config, profile_flag, enable_memory_trace,
+                                                  enable_frame_store, frame_store_folder)
+            if detection_result is None:
+                print(Fore.RED + "[Error] Meso detection process failed." + Style.RESET_ALL)
+                return None
+            batch_end = time.time()
+            batch_duration = batch_end - batch_start
+            print(f"---[Info] Image {img_num} Mesocyclone Complete.")
+            print(f"---[Info] Duration of batch execution: {batch_duration:.4f} seconds")
+            detection_results.append(detection_result)
 
     end = time.time()
     duration = end - start
@@ -163,41 +235,378 @@ def meso_batch_detect(
     return detection_results
 
 
+def detect_batch_image(
+        radar_img_path: Path,
+        output_folder_path: Union[str, Path],
+        station_num: str,
+        enable_debug_mode: bool,
+        radar_config: RadarConfig,
+        enable_profile: bool = False,
+        enable_memory_trace: bool = False,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+) -> Optional[DetectionResult]:
+    # Extract image name from image path
+    process_result_folder_name = radar_img_path.as_posix().split("/")[-1].split(".")[0]
+    # Create a folder with the extracted image name under given output directory
+    result_output_path = check_output_folder(output_folder_path, process_result_folder_name)
+    if result_output_path is None:
+        print(Fore.RED + "[Error] Create result output folder failed." + Style.RESET_ALL)
+        return None
+    print(f"[Info] Detection result image folder path: {result_output_path}.")
+
+    return detect_mesocyclone(radar_img_path, result_output_path, station_num, enable_debug_mode, radar_config,
+                              enable_frame_store, frame_store_folder, enable_profile=enable_profile,
+                              enable_memory_trace=enable_memory_trace)
+
+
+# Radar config and frame store setting of current batch worker process, set by init_batch_worker
+_worker_radar_config: Optional[RadarConfig] = None
+_worker_enable_frame_store: bool = ENABLE_FRAME_STORE
+_worker_frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+
+
+def init_batch_worker(radar_config_data: dict, enable_frame_store: bool = ENABLE_FRAME_STORE,
+                      frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER):
+    global _worker_radar_config, _worker_enable_frame_store, _worker_frame_store_folder
+    _worker_radar_config = RadarConfig.from_dict(radar_config_data)
+    _worker_enable_frame_store = enable_frame_store
+    _worker_frame_store_folder = frame_store_folder
+
+
+def run_batch_worker_task(
+        batch_task: Tuple[Path, Union[str, Path], str, bool, bool, bool]
+) -> Tuple[Optional[DetectionResult], float]:
+    batch_start = time.time()
+    radar_img_path, output_folder_path, station_num, enable_debug_mode, enable_profile, enable_memory_trace = \
+        batch_task
+    detection_result = detect_batch_image(radar_img_path, output_folder_path, station_num, enable_debug_mode,
+                                          _worker_radar_config, enable_profile, enable_memory_trace,
+                                          _worker_enable_frame_store, _worker_frame_store_folder)
+    # Pool may terminate worker process before background writer finishes, so wait for debug bundles here
+    if enable_debug_mode:
+        flush_debug_bundles()
+    return detection_result, time.time() - batch_start
+
+
+async def meso_detect_async(
+        img_paths: Union[Iterable[Union[str, Path]], AsyncIterable[Union[str, Path]]],
+        output_folder_path: Union[str, Path],
+        enable_debug_mode: bool = False,
+        max_in_flight: int = ASYNC_MAX_IN_FLIGHT,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        executor: Optional[Executor] = None,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+) -> AsyncIterator[DetectionResult]:
+    """
+    Detects mesocyclones of radar images without blocking the event loop. Detections run in an executor,
+    at most max_in_flight images are detected at the same time, and results are yielded as they finish.
+
+    Args:
+        img_paths: radar image paths, images are submitted lazily so that it can be an endless stream.
+            Paths of a sync iterable are pulled in a thread, so that a blocking stream never stalls the event loop.
+        output_folder_path: folder path for detection results.
+        enable_debug_mode: whether to enable debug mode.
+        max_in_flight: maximum number of images of the stream being detected or waiting for detection.
+        semaphore: semaphore shared by several streams to cap images detected at the same time over all of them,
+            a semaphore with max_in_flight permits is used if not given.
+        executor: executor for detections, a process pool with max_in_flight workers is used if not given.
+        enable_frame_store: whether to reuse preprocessed frames stored by earlier detections of the same images.
+        frame_store_folder: folder of stored preprocessed frames.
+
+    Returns:
+        async iterator of detection results in finishing order, images failed to detect are skipped.
+    """
+    loop = asyncio.get_running_loop()
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_in_flight)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_in_flight)
+
+    # Sentinel of exhausted image paths
+    paths_end = object()
+    if isinstance(img_paths, AsyncIterable):
+        async_img_paths = img_paths.__aiter__()
+
+        async def next_img_path():
+            try:
+                return await async_img_paths.__anext__()
+            except StopAsyncIteration:
+                return paths_end
+    else:
+        sync_img_paths = iter(img_paths)
+
+        async def next_img_path():
+            return await loop.run_in_executor(None, next, sync_img_paths, paths_end)
+
+    async def run_detection(img_path: Union[str, Path]) -> Optional[DetectionResult]:
+        # Permit is taken by the task itself, so that a task cancelled before starting never holds one
+        async with semaphore:
+            try:
+                return await loop.run_in_executor(executor, detect_image_task, img_path, output_folder_path,
+                                                  enable_debug_mode, enable_frame_store, frame_store_folder)
+            except Exception as e:
+                print(Fore.RED + f"[Error] Exception: {e} raised when detecting {img_path}." + Style.RESET_ALL)
+                return None
+
+    pending_tasks = set()
+    next_path_task = None
+    paths_exhausted = False
+    try:
+        while not paths_exhausted or pending_tasks:
+            # Pull next image path while the stream has free detection slots, and wait for it with detections
+            if not paths_exhausted and next_path_task is None and len(pending_tasks) < max_in_flight:
+                next_path_task = asyncio.ensure_future(next_img_path())
+            wait_tasks = pending_tasks if next_path_task is None else pending_tasks | {next_path_task}
+            done_tasks, _ = await asyncio.wait(wait_tasks, return_when=asyncio.FIRST_COMPLETED)
+
+            if next_path_task in done_tasks:
+                done_tasks.discard(next_path_task)
+                img_path = next_path_task.result()
+                next_path_task = None
+                if img_path is paths_end:
+                    paths_exhausted = True
+                else:
+                    pending_tasks.add(asyncio.create_task(run_detection(img_path)))
+
+            pending_tasks -= done_tasks
+            for task in done_tasks:
+                if task.result() is not None:
+                    yield task.result()
+    finally:
+        # Wait for cancelled tasks, detections already running in executor are not interrupted
+        unfinished_tasks = pending_tasks if next_path_task is None else pending_tasks | {next_path_task}
+        for task in unfinished_tasks:
+            task.cancel()
+        await asyncio.gather(*unfinished_tasks, return_exceptions=True)
+        if own_executor:
+            # Shut down in a thread so that running detections finish without blocking the event loop
+            await loop.run_in_executor(None, functools.partial(executor.shutdown, wait=True, cancel_futures=True))
+
+
+def detect_image_task(
+        img_path: Union[str, Path],
+        output_folder_path: Union[str, Path],
+        enable_debug_mode: bool,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+) -> Optional[DetectionResult]:
+    detection_results = meso_detect(img_path, output_folder_path, enable_debug_mode,
+                                    enable_frame_store=enable_frame_store, frame_store_folder=frame_store_folder)
+    # Executor may run the task in a worker process exiting without atexit handlers
+    if enable_debug_mode:
+        flush_debug_bundles()
+    if detection_results is None:
+        return None
+    return detection_results[0]
+
+
+def meso_watch_detect(
+        img_folder_path: Union[str, Path],
+        output_folder_path: Union[str, Path],
+        enable_debug_mode: bool = False,
+        stop_event: Optional[threading.Event] = None,
+        queue_size: int = WATCH_QUEUE_SIZE,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        include_existing: bool = True,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+) -> Iterator[DetectionResult]:
+    """
+    Watches a folder for new radar images and detects mesocyclones of each image once it is fully written.
+    A watcher thread puts new images into a bounded queue, and stops scanning while the queue is full,
+    so that scanning never runs ahead of detection.
+
+    Args:
+        img_folder_path: path of the watched folder.
+        output_folder_path: folder path for detection results.
+        enable_debug_mode: whether to enable debug mode.
+        stop_event: event for stopping watching, watching stops when the iterator is closed if not given.
+        queue_size: maximum number of images waiting for detection.
+        poll_interval: interval in seconds between folder scans.
+        include_existing: whether to detect radar images already in the folder when watching starts.
+        enable_frame_store: whether to reuse preprocessed frames stored by earlier detections of the same images.
+        frame_store_folder: folder of stored preprocessed frames.
+
+    Returns:
+        iterator of detection results in image arriving order, images failed to detect are skipped.
+    """
+    if stop_event is None:
+        stop_event = threading.Event()
+    image_queue: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+
+    def watch_folder():
+        try:
+            for img_path in watch_radar_images(img_folder_path, stop_event, poll_interval,
+                                               include_existing=include_existing):
+                # Block while the queue is full, checking stop event at each poll interval
+                while not stop_event.is_set():
+                    try:
+                        image_queue.put(img_path, timeout=poll_interval)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as e:
+            print(Fore.RED + f"[Error] Exception: {e} raised when watching {img_folder_path}." + Style.RESET_ALL)
+        finally:
+            stop_event.set()
+
+    watcher = threading.Thread(target=watch_folder, name="meso-folder-watcher", daemon=True)
+    watcher.start()
+    print(f"[Info] Start watching radar image folder: {img_folder_path}.")
+    try:
+        while not (stop_event.is_set() and image_queue.empty()):
+            try:
+                img_path = image_queue.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+            detection_results = meso_detect(img_path, output_folder_path, enable_debug_mode,
+                                            enable_frame_store=enable_frame_store,
+                                            frame_store_folder=frame_store_folder)
+            if detection_results is not None:
+                yield detection_results[0]
+    finally:
+        stop_event.set()
+        watcher.join()
+        print(f"[Info] Stop watching radar image folder: {img_folder_path}.")
+
+
+def meso_watch_detect_with_callback(
+        img_folder_path: Union[str, Path],
+        output_folder_path: Union[str, Path],
+        callback: Callable[[DetectionResult], None],
+        enable_debug_mode: bool = False,
+        stop_event: Optional[threading.Event] = None,
+        queue_size: int = WATCH_QUEUE_SIZE,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        include_existing: bool = True,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
+):
+    """
+    Runs meso_watch_detect until stop_event is set, and passes each detection result to callback.
+    Scanning waits for callback through the bounded queue, see meso_watch_detect.
+    """
+    for detection_result in meso_watch_detect(img_folder_path, output_folder_path, enable_debug_mode, stop_event,
+                                              queue_size, poll_interval, include_existing, enable_frame_store,
+                                              frame_store_folder):
+        callback(detection_result)
+
+
 def detect_mesocyclone(
         resolved_img_path: Path,
         output_path: Path,
         station_num: str = "",
-        enable_debug_mode: bool = False
+        enable_debug_mode: bool = False,
+        radar_config: Optional[RadarConfig] = None,
+        enable_frame_store: bool = ENABLE_FRAME_STORE,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER,
+        debug_format: str = DEFAULT_DEBUG_FORMAT,
+        render_mode: str = DEFAULT_RESULT_RENDER_MODE,
+        enable_profile: bool = False,
+        enable_memory_trace: bool = False
+) -> Optional[DetectionResult]:
+    # Get radar config profile of the station once and pass it through all stages
+    if radar_config is None:
+        try:
+            with Image.open(resolved_img_path) as radar_img:
+                radar_config = get_station_config(station_num, radar_img.size)
+        except Exception as e:
+            print(Fore.RED + f"[Error] Exception: {e} raised when getting radar config." + Style.RESET_ALL)
+            return None
+    if debug_format not in DEBUG_FORMATS:
+        print(Fore.RED + f"[Error] Invalid debug format: `{debug_format}`." + Style.RESET_ALL)
+        return None
+
+    # Record debug outputs of all stages into one bundle written in background
+    debug_sink = BundleDebugSink() if enable_debug_mode and debug_format == "bundle" else None
+    try:
+        # Profiling outputs of each stage are saved in profile folder of the radar image
+        profile_folder = output_path / PROFILE_FOLDER_NAME if enable_profile else None
+        with collect_metrics(profile_folder, enable_memory_trace) as metrics:
+            detection_result = run_detection_stages(resolved_img_path, output_path, station_num, enable_debug_mode,
+                                                    radar_config, enable_frame_store, render_mode, debug_sink,
+                                                    frame_store_folder)
+    finally:
+        # Debug outputs of failed detection are saved as well
+        if debug_sink is not None:
+            bundle_path = output_path / DEBUG_BUNDLE_NAME
+            debug_sink.save_bundle(bundle_path)
+            print(f"[Info] Debug bundle is being saved to {bundle_path.as_posix()}.")
+
+    if detection_result is not None:
+        detection_result["metrics"] = metrics.to_dict()
+    return detection_result
+
+
+def run_detection_stages(
+        resolved_img_path: Path,
+        output_path: Path,
+        station_num: str,
+        enable_debug_mode: bool,
+        radar_config: RadarConfig,
+        enable_frame_store: bool,
+        render_mode: str = DEFAULT_RESULT_RENDER_MODE,
+        debug_sink: Optional[BundleDebugSink] = None,
+        frame_store_folder: Union[str, Path] = FRAME_STORE_FOLDER
 ) -> Optional[DetectionResult]:
+
+    # Reuse stored preprocessed frame of the same image, debug mode always preprocesses for debug images
+    frame_key = None
+    gray_img = None
+    if enable_frame_store:
+        frame_key = get_frame_key(resolved_img_path, station_num, DEFAULT_DECODER_ENGINE, radar_config)
+        if not enable_debug_mode:
+            with record_stage("frame_store"):
+                gray_img = load_stored_frame(frame_key, radar_config.image_size, frame_store_folder)
+                count_metric("hits", int(gray_img is not None))
+
     # Get gray image
-    gray_img = radar_image_preprocess(resolved_img_path, station_num, output_path, enable_debug_mode)
     if gray_img is None:
-        print(Fore.RED + "[Error] Radar image preprocessing failed." + Style.RESET_ALL)
-        return None
+        with record_stage("preprocess"):
+            gray_img = radar_image_preprocess(resolved_img_path, station_num, output_path, enable_debug_mode,
+                                              radar_config=radar_config, debug_sink=debug_sink)
+        if gray_img is None:
+            print(Fore.RED + "[Error] Radar image preprocessing failed." + Style.RESET_ALL)
+            return None
+        if frame_key is not None:
+            save_stored_frame(frame_key, gray_img, frame_store_folder)
 
     # Get denoised image
-    unfold_img = radar_denoise(gray_img, output_path, enable_debug_mode)
+    with record_stage("denoise"):
+        unfold_img = radar_denoise(gray_img, output_path, enable_debug_mode, radar_config, debug_sink)
     if unfold_img is None:
         print(Fore.RED + "[Error] Radar denoise process failed." + Style.RESET_ALL)
         return None
 
     if enable_debug_mode:
-        visualize_result(output_path, unfold_img, "unfold")
-
-    immerse_simulation_result = get_extrema_regions(unfold_img, output_path, enable_debug_mode)
+        if debug_sink is not None:
+            # Keep PNG encoding off the detection path in bundle mode, the image is rendered from the bundle
+            debug_sink.stage("visualization").save_image("unfold", get_visualization_img(unfold_img, radar_config))
+        else:
+            visualize_result(output_path, unfold_img, "unfold", radar_config)
+
+    with record_stage("immerse_simulation"):
+        immerse_simulation_result = get_extrema_regions(unfold_img, output_path, enable_debug_mode, radar_config,
+                                                        debug_sink)
     if immerse_simulation_result is None:
         print(Fore.RED + "[Error] Immerse simulation process failed." + Style.RESET_ALL)
         return None
 
     neg_extrema_regions, pos_extrema_regions = immerse_simulation_result
 
-    mesocyclone_list = opposite_extrema_analysis(unfold_img, neg_extrema_regions, pos_extrema_regions, output_path,
-                                                 enable_debug_mode)
+    with record_stage("meso_analysis"):
+        mesocyclone_list = opposite_extrema_analysis(unfold_img, neg_extrema_regions, pos_extrema_regions,
+                                                     output_path, enable_debug_mode, radar_config, debug_sink)
     if mesocyclone_list is None:
         print(Fore.RED + "[Error] Mesocyclone analysis process failed." + Style.RESET_ALL)
         return None
 
-    detection_result = pack_detection_result(station_num, resolved_img_path, unfold_img, mesocyclone_list, output_path)
+    with record_stage("pack_result"):
+        detection_result = pack_detection_result(station_num, resolved_img_path, unfold_img, mesocyclone_list,
+                                                 output_path, radar_config, render_mode=render_mode)
     if enable_debug_mode:
         print_detection_result(detection_result)
 
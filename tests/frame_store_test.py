@@ -0,0 +1,27 @@
+import tempfile
+from pathlib import Path
+from MesoDetect.meso_detect import meso_batch_detect
+
+
+if __name__ == "__main__":
+    # Get the project root (where this script lives)
+    PROJECT_ROOT = Path(__file__).parent.parent
+    test_img_folder_path = PROJECT_ROOT / "data/example/0419_sg"
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        output_folder_path = Path(temp_folder) / "result"
+        for worker_num in (1, 2):
+            frame_store_folder = Path(temp_folder) / ("frames_" + str(worker_num))
+            # First run over an empty store preprocesses and stores all frames
+            first_results = meso_batch_detect(test_img_folder_path, output_folder_path, worker_num=worker_num,
+                                              enable_frame_store=True, frame_store_folder=frame_store_folder)
+            # Second run over the same folder loads stored frames instead of preprocessing
+            second_results = meso_batch_detect(test_img_folder_path, output_folder_path, worker_num=worker_num,
+                                               enable_frame_store=True, frame_store_folder=frame_store_folder)
+            assert first_results is not None and second_results is not None
+            for first_result, second_result in zip(first_results, second_results):
+                second_metrics = second_result["metrics"]
+                assert "preprocess" not in second_metrics["stages"], second_result["input_img_path"]
+                assert second_metrics["counters"]["frame_store/hits"] == 1, second_result["input_img_path"]
+                assert first_result["meso_list"] == second_result["meso_list"]
+            print(f"[Info] Stored frames are reused with {worker_num} worker processes.")